@@ -0,0 +1,63 @@
+'''
+Compares frames/sec of the old disk-based gif pipeline against the in-memory process pool
+
+run from the backend directory: python -m benchmarks.bench_gif
+'''
+import os
+import time
+import shutil
+import tempfile
+import ffmpeg
+from PIL import Image
+from utils.gif_utils import process_gif
+
+# the bundled dance sequence (223 frames) made back into a gif
+SOURCE_SEQUENCE = "../assets/frame_sequences/dance/frame%04d.png"
+
+
+def make_gif(path: str, fps: int = 20):
+    ffmpeg.input(SOURCE_SEQUENCE, framerate=fps, start_number=1).output(path, loglevel="quiet").overwrite_output().run()
+
+
+def legacy_process_gif(path: str, output_folder: str, scale: int = 720) -> int:
+    '''
+    The original extract_frames pipeline: PNGs to disk, then read back, quantize and rewrite one at a time
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    ffmpeg.input(path).output(f"{output_folder}/%04d.png", vf=f"scale={scale}:-1", loglevel="quiet").run()
+    for filename in os.listdir(output_folder):
+        input_path = os.path.join(output_folder, filename)
+        img = Image.open(input_path).convert("P", colors=256)
+        img.save(os.path.join(output_folder, f"frame{filename}"), optimize=True)
+        os.remove(input_path)
+    return len(os.listdir(output_folder))
+
+
+def run(worker_counts=tuple(sorted({1, os.cpu_count() or 1})), palettes=("web", "shared")) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        gif_path = os.path.join(temp_dir, "dance.gif")
+        make_gif(gif_path)
+
+        def measure(name, process):
+            output_folder = os.path.join(temp_dir, name)
+            start = time.perf_counter()
+            frames = process(output_folder)
+            elapsed = time.perf_counter() - start
+            size = sum(entry.stat().st_size for entry in os.scandir(output_folder))
+            shutil.rmtree(output_folder)
+            results.append({"path": name, "frames": frames, "seconds": elapsed,
+                            "frames_per_second": frames / elapsed, "bytes": size})
+
+        measure("legacy", lambda folder: legacy_process_gif(gif_path, folder))
+        for palette in palettes:
+            for workers in worker_counts:
+                measure(f"pool-{palette}-{workers}", lambda folder: process_gif(
+                    gif_path, folder, palette=palette, workers=workers)["frame_count"])
+    return results
+
+
+if __name__ == "__main__":
+    for result in run():
+        print(f"{result['path']:>16}: {result['frames']} frames in {result['seconds']:.2f}s "
+              f"({result['frames_per_second']:.1f} frames/s, {result['bytes'] / 1024:.0f} KB)")
@@ -0,0 +1,77 @@
+'''
+Compares the numpy mixer against the old chained AudioSegment.overlay loop
+
+run from the backend directory: python -m benchmarks.bench_mixer
+'''
+import time
+import random
+import numpy as np
+from pydub import AudioSegment
+from video_generation.mixer import mix_timeline, frame_to_ms
+
+
+def synth_clip(frequency: float, duration_ms: int, frame_rate: int = 44100) -> AudioSegment:
+    '''
+    Makes a stereo sine tone, standing in for a decoded note/sound effect
+    '''
+    t = np.arange(int(frame_rate * duration_ms / 1000)) / frame_rate
+    wave = (np.sin(2 * np.pi * frequency * t) * 1000).astype(np.int16)
+    stereo = np.repeat(wave[:, None], 2, axis=1)
+    return AudioSegment(data=stereo.tobytes(), sample_width=2, frame_rate=frame_rate, channels=2)
+
+
+def make_timeline(event_count: int, duration: int, clip_count: int = 8, seed: int = 3):
+    rng = random.Random(seed)
+    clips = {f"clip{i}": synth_clip(220 * (i + 1), rng.randint(100, 800)) for i in range(clip_count)}
+    timeline = [{"audio": f"clip{rng.randrange(clip_count)}", "frame": rng.randrange(duration * 60)}
+                for _ in range(event_count)]
+    return timeline, clips
+
+
+def overlay_mix(audio_timeline, clips, duration):
+    '''
+    The original generate_audio mixing loop
+    '''
+    final_audio = AudioSegment.silent(duration=duration * 1000)
+    for entry in audio_timeline:
+        audio = clips[entry["audio"]]
+        if "audio_duration" in entry.keys():
+            audio = audio[0:entry["audio_duration"]]
+        final_audio = final_audio.overlay(audio, position=frame_to_ms(entry["frame"]))
+    return final_audio
+
+
+def run(event_counts=(10, 100, 1000), duration: int = 60) -> list[dict]:
+    results = []
+    for event_count in event_counts:
+        timeline, clips = make_timeline(event_count, duration)
+
+        start = time.perf_counter()
+        expected = overlay_mix(timeline, clips, duration)
+        overlay_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mixed = mix_timeline(timeline, clips, duration)
+        mixer_time = time.perf_counter() - start
+
+        # both paths should agree up to resampling rounding and length differences of a frame
+        a = np.array(expected.get_array_of_samples(), dtype=np.int32)
+        b = np.array(mixed.get_array_of_samples(), dtype=np.int32)
+        length = min(len(a), len(b))
+        max_error = int(np.abs(a[:length] - b[:length]).max()) if length else 0
+
+        results.append({
+            "events": event_count,
+            "overlay_seconds": overlay_time,
+            "mixer_seconds": mixer_time,
+            "speedup": overlay_time / mixer_time if mixer_time else float("inf"),
+            "max_sample_error": max_error,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    for result in run():
+        print(f"{result['events']:>5} events: overlay {result['overlay_seconds']:.3f}s, "
+              f"mixer {result['mixer_seconds']:.3f}s ({result['speedup']:.1f}x), "
+              f"max sample error {result['max_sample_error']}")
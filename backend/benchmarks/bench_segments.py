@@ -0,0 +1,65 @@
+'''
+Compares wall-clock time and output size of the single-process encode against segment-parallel encoding
+
+run from the backend directory: python -m benchmarks.bench_segments
+'''
+import os
+import time
+import tempfile
+import ffmpeg
+from video_generation.segments import encode_segments, SEGMENT_FRAMES, SEGMENT_WORKERS
+
+FPS = 60
+
+
+def make_frames(session_dir: str, seconds: int, size: str = "640x360"):
+    '''
+    Writes a synthetic frame sequence (frame0000.png, ...) like the one the express server renders
+    '''
+    frame_dir = os.path.join(session_dir, "frames")
+    os.makedirs(frame_dir, exist_ok=True)
+    ffmpeg.input(f"testsrc2=size={size}:rate={FPS}", format="lavfi", t=seconds) \
+        .output(os.path.join(frame_dir, "frame%04d.png"), start_number=0, loglevel="quiet") \
+        .overwrite_output() \
+        .run()
+    return seconds * FPS
+
+
+def encode_single(session_dir: str):
+    '''
+    The combine_frames path: one libx264 process for the whole sequence
+    '''
+    ffmpeg.input(os.path.join(session_dir, "frames", "frame%04d.png"), framerate=FPS) \
+        .output(os.path.join(session_dir, "output.mp4"), vcodec='libx264', pix_fmt='yuv420p', r=FPS, loglevel='quiet') \
+        .overwrite_output() \
+        .run()
+
+
+def run(durations=(10, 30, 60), segment_frames: int = SEGMENT_FRAMES, workers: int = SEGMENT_WORKERS) -> list[dict]:
+    results = []
+    for seconds in durations:
+        with tempfile.TemporaryDirectory() as session_dir:
+            total_frames = make_frames(session_dir, seconds)
+            output_video = os.path.join(session_dir, "output.mp4")
+
+            start = time.perf_counter()
+            encode_single(session_dir)
+            single_time = time.perf_counter() - start
+            single_size = os.path.getsize(output_video)
+
+            segmented_time = encode_segments(session_dir, total_frames, FPS, segment_frames, workers)
+            segmented_size = os.path.getsize(output_video)
+
+            results.append({"seconds": seconds, "frames": total_frames, "single_time": single_time,
+                            "segmented_time": segmented_time, "single_bytes": single_size,
+                            "segmented_bytes": segmented_size})
+    return results
+
+
+if __name__ == "__main__":
+    print(f"segments of {SEGMENT_FRAMES} frames, {SEGMENT_WORKERS} workers, {os.cpu_count()} cores")
+    for result in run():
+        print(f"{result['seconds']:>4}s ({result['frames']} frames): "
+              f"single {result['single_time']:.2f}s {result['single_bytes'] / 1024:.0f} KB, "
+              f"segmented {result['segmented_time']:.2f}s {result['segmented_bytes'] / 1024:.0f} KB "
+              f"({result['single_time'] / result['segmented_time']:.2f}x)")
@@ -0,0 +1,128 @@
+'''
+Measures how long the backend takes to start and how much memory a process needs once it has
+
+run from the backend directory: python -m benchmarks.bench_startup [--runs 5] [--workers 2]
+
+Every cold start is a fresh interpreter importing main and building the app. With --workers, gunicorn
+is booted with the production settings (gunicorn.conf.py) and timed until it answers its first request.
+'''
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+# SUPABASE_URL/SUPABASE_KEY only have to be set, the client is not created until something uses it
+ENV = {**os.environ, "SUPABASE_URL": os.environ.get("SUPABASE_URL", "http://localhost:54321"),
+       "SUPABASE_KEY": os.environ.get("SUPABASE_KEY", "startup-benchmark")}
+
+COLD_START = '''
+import time, json
+start = time.perf_counter()
+from main import create_app
+app = create_app(start_background=False)
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS"))
+print(json.dumps({"seconds": elapsed, "rss_kb": rss}))
+'''
+
+
+def rss_kb(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmRSS"))
+    except (OSError, StopIteration):
+        return None
+
+
+def cold_starts(runs: int) -> list[dict]:
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", COLD_START], env=ENV, capture_output=True, text=True,
+                                check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def slowest_imports(count: int = 10) -> list[tuple[int, str]]:
+    '''
+    The modules that took the longest to import (cumulative microseconds), from python -X importtime
+    '''
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], env=ENV,
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # main itself includes everything
+        if module.strip() != "main":
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def gunicorn_boot(workers: int, port: int, timeout: float = 60) -> dict | None:
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("gunicorn is not installed, skipping the worker benchmark")
+        return None
+    env = {**ENV, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    with tempfile.TemporaryDirectory() as directory:
+        pid_file = os.path.join(directory, "gunicorn.pid")
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--pid", pid_file,
+                                    "wsgi:app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            first_response = None
+            while time.perf_counter() - start < timeout and process.poll() is None:
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+                    first_response = time.perf_counter() - start
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            if first_response is None:
+                print("gunicorn did not answer in time")
+                return None
+            # waiting for every worker to have forked
+            while time.perf_counter() - start < timeout:
+                children = subprocess.run(["pgrep", "-P", str(process.pid)], capture_output=True,
+                                          text=True).stdout.split()
+                if len(children) >= workers:
+                    break
+                time.sleep(0.05)
+            return {"first_response": first_response, "master_rss_kb": rss_kb(process.pid),
+                    "worker_rss_kb": [rss_kb(int(pid)) for pid in children]}
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=0, help="also boot gunicorn with this many workers")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = cold_starts(args.runs)
+    times = sorted(result["seconds"] for result in results)
+    print(f"cold start ({args.runs} runs): median {times[len(times) // 2] * 1000:.0f} ms, "
+          f"min {times[0] * 1000:.0f} ms, max {times[-1] * 1000:.0f} ms, "
+          f"rss {max(result['rss_kb'] for result in results) / 1024:.1f} MB")
+    print("slowest imports:")
+    for micros, module in slowest_imports():
+        print(f"  {micros / 1000:>7.1f} ms  {module}")
+
+    if args.workers:
+        boot = gunicorn_boot(args.workers, args.port)
+        if boot is not None:
+            print(f"gunicorn with {args.workers} workers answered after {boot['first_response'] * 1000:.0f} ms, "
+                  f"master rss {boot['master_rss_kb'] / 1024:.1f} MB, worker rss "
+                  + ", ".join(f"{rss / 1024:.1f} MB" for rss in boot["worker_rss_kb"] if rss is not None))
@@ -0,0 +1,339 @@
+'''
+Offline benchmark suite for the render backend
+
+Synthesizes a session (frames at a given resolution, an audio timeline drawn from assets/midi and
+assets/sound_effects, and a gif made from assets/frame_sequences), then times every stage on its
+own and a whole render end to end. Supabase and its TUS endpoint are replaced by the local stubs in
+benchmarks/stubs, so nothing leaves this machine.
+
+run from the backend directory:
+    python -m benchmarks.run --frames 600 --resolution 720x1280 --events 200
+    python -m benchmarks.run --save-baseline                 # stores the results as benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --threshold 0.15
+                                                             # exits with 1 if a stage got slower than that
+'''
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import ffmpeg
+
+# the real supabase client is never created (the stub stands in for it), the settings only have to exist
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from benchmarks.stubs.tus_server import TusStubServer
+from benchmarks.stubs.supabase_stub import SupabaseStub
+from utils.audio_cache import audio_cache
+from utils.gif_cache import gif_cache
+from utils.gif_utils import extract_gif
+from utils.sequence_pack import remove_packs
+from video_generation import video
+from video_generation.segments import encode_segments
+from video_generation.profiles import select_profile, video_options
+from video_generation.frame_stream import finish_stream
+from video_generation.outbox import Outbox
+from renderer.render import render_session
+
+ROOT_DIR = "../"
+ASSET_URL = "http://localhost:8000/file/get_asset/"
+# benchmark sessions live where real ones do, so every path (packs, asset urls) behaves the same
+BENCH_DIR = "../videos/benchmark"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+FPS = 60
+STAGES = ("generate_audio", "combine_frames", "combine_frames_segmented", "encode_video",
+          "extract_frames", "upload_video", "server_render", "record_outbox", "end_to_end")
+
+
+def synthesize_frames(frame_dir: str, frames: int, resolution: str):
+    os.makedirs(frame_dir, exist_ok=True)
+    ffmpeg.input(f"testsrc2=size={resolution}:rate={FPS}", format="lavfi") \
+        .output(os.path.join(frame_dir, "frame%04d.png"), start_number=0, vframes=frames, loglevel="quiet") \
+        .overwrite_output() \
+        .run()
+
+
+def synthesize_timeline(events: int, frames: int, seed: int) -> list[dict]:
+    '''
+    K sound events at random frames, using the bundled notes and sound effects
+    '''
+    sounds = sorted(glob.glob(os.path.join(ROOT_DIR, "assets/midi/*/*.mp3"))) + \
+        sorted(glob.glob(os.path.join(ROOT_DIR, "assets/sound_effects/*.mp3")))
+    rng = random.Random(seed)
+    urls = [ASSET_URL + os.path.relpath(path, ROOT_DIR).replace(os.sep, "/") for path in sounds]
+    return [{"audio": rng.choice(urls), "frame": rng.randrange(frames)} for _ in range(events)]
+
+
+def synthesize_gif(sequence: str, path: str, fps: int = 20):
+    pattern = os.path.join(ROOT_DIR, "assets/frame_sequences", sequence, "frame%04d.png")
+    ffmpeg.input(pattern, framerate=fps, start_number=1).output(path, loglevel="quiet").overwrite_output().run()
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.duration = max(1, args.frames // FPS)
+        self.frames = self.duration * FPS
+        self.timeline = synthesize_timeline(args.events, self.frames, args.seed)
+        self.session_count = 0
+        # every session gets hard links to the same synthesized frames
+        self.frame_template = os.path.join(BENCH_DIR, "template", "frames")
+        synthesize_frames(self.frame_template, self.frames, args.resolution)
+        self.gif_path = os.path.join(BENCH_DIR, "template", f"{args.gif}.gif")
+        synthesize_gif(args.gif, self.gif_path)
+        self.tus_server = TusStubServer()
+        self.supabase = SupabaseStub(self.tus_server)
+        video.get_supabase = lambda: self.supabase
+        video._tus_uploader = None
+        # the rows of benchmark renders must never reach a real database
+        self.outbox_dir = tempfile.mkdtemp()
+        video.outbox = Outbox(os.path.join(self.outbox_dir, "outbox.db"), lambda: self.supabase)
+        # the benchmarks may use every profile
+        self.profile = select_profile(args.profile, "studio")
+
+    def new_session(self, with_frames: bool = True) -> tuple[str, str]:
+        self.session_count += 1
+        session_id = f"session{self.session_count}"
+        session_dir = os.path.join(BENCH_DIR, session_id)
+        for directory in ["assets/sounds", "assets/images", "assets/frame_sequences", "audio"]:
+            os.makedirs(os.path.join(session_dir, directory), exist_ok=True)
+        if with_frames:
+            frame_dir = os.path.join(session_dir, "frames")
+            os.makedirs(frame_dir)
+            for name in os.listdir(self.frame_template):
+                os.link(os.path.join(self.frame_template, name), os.path.join(frame_dir, name))
+        return session_id, session_dir
+
+    def render_data(self, session_id: str, session_dir: str) -> dict:
+        return {
+            "userID": "benchmark",
+            "sessionID": session_id,
+            "sessionDir": session_dir,
+            "duration": self.duration,
+            "audioTimeline": self.timeline,
+            "assetLoadTime": 0.0,
+            "frameWriteTime": 0.0,
+            "categoryName": "benchmark",
+            "templateName": "benchmark",
+            "resolution": self.args.resolution,
+            "profile": self.profile,
+            "plan": "studio",
+        }
+
+    # each stage sets up what it needs, then returns (seconds, extra measurements) for the timed part
+
+    def generate_audio(self):
+        _, session_dir = self.new_session(with_frames=False)
+        audio_cache.clear()
+        start = time.perf_counter()
+        video.generate_audio(self.timeline, self.duration, session_dir)
+        return time.perf_counter() - start, {"events": len(self.timeline)}
+
+    def combine_frames(self):
+        _, session_dir = self.new_session()
+        start = time.perf_counter()
+        video.combine_frames(session_dir, profile=self.profile)
+        elapsed = time.perf_counter() - start
+        return elapsed, {"frames_per_second": self.frames / elapsed,
+                         "bytes": os.path.getsize(os.path.join(session_dir, "output.mp4"))}
+
+    def combine_frames_segmented(self):
+        _, session_dir = self.new_session()
+        start = time.perf_counter()
+        encode_segments(session_dir, self.frames, FPS, output_options=video_options(self.profile))
+        elapsed = time.perf_counter() - start
+        return elapsed, {"frames_per_second": self.frames / elapsed,
+                         "bytes": os.path.getsize(os.path.join(session_dir, "output.mp4"))}
+
+    def encode_video(self):
+        _, session_dir = self.new_session()
+        video.generate_audio(self.timeline, self.duration, session_dir)
+        start = time.perf_counter()
+        final_video, _ = video.encode_video(session_dir, profile=self.profile)
+        elapsed = time.perf_counter() - start
+        return elapsed, {"frames_per_second": self.frames / elapsed, "bytes": os.path.getsize(final_video)}
+
+    def extract_frames(self):
+        _, session_dir = self.new_session(with_frames=False)
+        with open(self.gif_path, "rb") as f:
+            data = f.read()
+        output_folder = os.path.join(session_dir, "assets", "frame_sequences", self.args.gif)
+        # a cold gif cache, so the gif is really processed
+        cache_dir = gif_cache.cache_dir
+        with tempfile.TemporaryDirectory() as gif_cache.cache_dir:
+            start = time.perf_counter()
+            # hashing the gif like an upload does, then extracting it from where it is on disk
+            info = extract_gif(self.gif_path, hashlib.sha256(data).hexdigest(), output_folder)
+            elapsed = time.perf_counter() - start
+        gif_cache.cache_dir = cache_dir
+        return elapsed, {"frames": info["frame_count"], "frames_per_second": info["frame_count"] / elapsed}
+
+    def upload_video(self):
+        session_id, session_dir = self.new_session()
+        video.generate_audio(self.timeline, self.duration, session_dir)
+        final_video, _ = video.encode_video(session_dir, profile=self.profile)
+        start = time.perf_counter()
+        _, _, chunks = video.upload_video(final_video, "benchmark", session_id)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(final_video)
+        return elapsed, {"bytes": size, "chunks": len(chunks), "bytes_per_second": size / elapsed}
+
+    def server_render(self):
+        # drawing a template's frames on the server and encoding them as they are drawn
+        session_id, session_dir = self.new_session(with_frames=False)
+        category, name = self.args.template.split("/")
+        with open("animation-configs.json") as f:
+            config = json.load(f)[category]["animations"][name]
+        width, height = (int(side) for side in self.args.resolution.split("x"))
+        data = {**self.render_data(session_id, session_dir), "path": self.args.template,
+                "config": {**config, "canvas_width": width, "canvas_height": height}}
+        start = time.perf_counter()
+        render_session(data)
+        finish_stream("benchmark", session_id)
+        elapsed = time.perf_counter() - start
+        return elapsed, {"frames_per_second": self.frames / elapsed, "events": len(data["audioTimeline"]),
+                         "bytes": os.path.getsize(os.path.join(session_dir, "output.mp4"))}
+
+    def record_outbox(self):
+        # queueing the Videos rows of --events renders (what a render waits for), then inserting them in batches
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = Outbox(os.path.join(directory, "outbox.db"), lambda: self.supabase)
+            requests = self.supabase.requests
+            start = time.perf_counter()
+            for index in range(self.args.events):
+                outbox.add("Videos", {"url": f"benchmark/video_{index}", "user": "benchmark"}, key=str(index))
+            add_time = time.perf_counter() - start
+            while outbox.flush():
+                pass
+            elapsed = time.perf_counter() - start
+        return elapsed, {"rows": self.args.events, "add_ms": add_time / self.args.events * 1000,
+                         "requests": self.supabase.requests - requests}
+
+    def end_to_end(self):
+        session_id, session_dir = self.new_session()
+        data = self.render_data(session_id, session_dir)
+        audio_cache.clear()
+        start = time.perf_counter()
+        video.render_video(data)
+        # the upload runs on its own executor, the render is done once its info is recorded
+        while True:
+            entry = video.progress_store.get("benchmark", session_id)
+            if entry is not None and entry["progress"] >= 100:
+                break
+            if time.perf_counter() - start > self.args.timeout:
+                raise TimeoutError(f"render of {session_id} did not finish in {self.args.timeout}s")
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        video.progress_store.delete("benchmark", session_id)
+        return elapsed, {"frames_per_second": self.frames / elapsed}
+
+    def run(self, stages) -> dict:
+        results = {}
+        for stage in stages:
+            runs = []
+            extra = {}
+            for _ in range(self.args.repeat):
+                seconds, extra = getattr(self, stage)()
+                runs.append(seconds)
+            results[stage] = {"seconds": statistics.median(runs), "min": min(runs), "runs": runs, **extra}
+            print(f"{stage:>26}: {results[stage]['seconds']:.3f}s (median of {len(runs)})", file=sys.stderr)
+        return results
+
+    def close(self):
+        self.tus_server.shutdown()
+        shutil.rmtree(self.outbox_dir, ignore_errors=True)
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+        remove_packs(BENCH_DIR)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    '''
+    Lists every stage that is more than threshold (e.g. 0.15 = 15%) slower than in the baseline
+    '''
+    regressions = []
+    for stage, result in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        ratio = result["seconds"] / previous["seconds"] if previous["seconds"] > 0 else 1.0
+        result["baseline_seconds"] = previous["seconds"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append({"stage": stage, "seconds": result["seconds"],
+                                "baseline_seconds": previous["seconds"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the render backend's stages")
+    parser.add_argument("--frames", type=int, default=600, help="frames per session (rounded down to whole seconds)")
+    parser.add_argument("--resolution", default="720x1280")
+    parser.add_argument("--events", type=int, default=200, help="sound events in the audio timeline")
+    parser.add_argument("--gif", default="dance", help="frame sequence in assets/frame_sequences to make a gif from")
+    parser.add_argument("--template", default="collection/particle-ring",
+                        help="animation drawn by the server_render stage")
+    parser.add_argument("--profile", default=None, help="encoder profile (preview, standard, archive)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="where to write the results (stdout if not given)")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before a stage fails")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also store the results as {DEFAULT_BASELINE}")
+    args = parser.parse_args(argv)
+
+    bench = Bench(args)
+    try:
+        stages = bench.run(args.stages)
+    finally:
+        bench.close()
+    results = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "frames": bench.frames,
+            "resolution": args.resolution,
+            "events": args.events,
+            "gif": args.gif,
+            "template": args.template,
+            "profile": bench.profile,
+            "repeat": args.repeat,
+        },
+        "stages": stages,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results["regressions"] = regressions
+
+    body = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body)
+    else:
+        print(body)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as f:
+            f.write(body)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression['stage']}: {regression['seconds']:.3f}s vs "
+              f"{regression['baseline_seconds']:.3f}s ({regression['ratio']:.2f}x)", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+'''
+Local stand-in for the parts of the supabase client the render backend uses
+
+    stub = SupabaseStub(tus_server)                     # uploads go to a TusStubServer
+    stub.storage.from_("videos").get_public_url(path)
+    stub.table("Videos").insert(row).execute()          # rows end up in stub.rows["Videos"]
+    stub.table("Videos").select("url").eq("url", url).execute().data
+    stub.fail_next = 2                                  # the next 2 inserts raise, like an unavailable database
+'''
+
+
+class Response:
+    def __init__(self, data: list):
+        self.data = data
+
+
+class QueryStub:
+    def __init__(self, client, rows: list, payload):
+        self.client = client
+        self.rows = rows
+        self.payload = payload
+
+    def execute(self) -> Response:
+        if self.client.fail_next > 0:
+            self.client.fail_next -= 1
+            raise ConnectionError("database unavailable")
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        self.rows.extend(payload)
+        self.client.requests += 1
+        return Response(payload)
+
+
+class SelectStub:
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.filters = {}
+
+    def eq(self, column: str, value) -> "SelectStub":
+        self.filters[column] = value
+        return self
+
+    def execute(self) -> Response:
+        return Response([row for row in self.rows
+                         if all(row.get(column) == value for column, value in self.filters.items())])
+
+
+class TableStub:
+    def __init__(self, client, rows: list):
+        self.client = client
+        self.rows = rows
+
+    def insert(self, payload, **kwargs) -> QueryStub:
+        return QueryStub(self.client, self.rows, payload)
+
+    def upsert(self, payload, **kwargs) -> QueryStub:
+        return QueryStub(self.client, self.rows, payload)
+
+    def select(self, *columns) -> SelectStub:
+        return SelectStub(self.rows)
+
+
+class BucketStub:
+    def __init__(self, base_url: str, bucket: str):
+        self.base_url = base_url
+        self.bucket = bucket
+
+    def get_public_url(self, path: str) -> str:
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{path}"
+
+
+class StorageStub:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def from_(self, bucket: str) -> BucketStub:
+        return BucketStub(self.base_url, bucket)
+
+
+class SupabaseStub:
+    def __init__(self, tus_server):
+        host, port = tus_server.server_address[:2]
+        self.supabase_url = f"http://{host}:{port}"
+        self.supabase_key = "benchmark"
+        self.storage = StorageStub(self.supabase_url)
+        self.rows: dict[str, list] = {}
+        # how many of the next inserts fail, and how many insert requests succeeded
+        self.fail_next = 0
+        self.requests = 0
+
+    def table(self, name: str) -> TableStub:
+        return TableStub(self, self.rows.setdefault(name, []))
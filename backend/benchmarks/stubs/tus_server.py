@@ -0,0 +1,91 @@
+'''
+Local stand-in for supabase's resumable (tus) upload endpoint
+
+    server = TusStubServer()   # listens on an ephemeral port
+    server.endpoint            # http://127.0.0.1:<port>/storage/v1/upload/resumable
+    server.uploads             # upload id => {"data", "length", "metadata"}
+    server.shutdown()
+
+run on its own from the backend directory: python -m benchmarks.stubs.tus_server
+'''
+import re
+import uuid
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+UPLOAD_PATH = "/storage/v1/upload/resumable"
+
+
+class TusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Tus-Resumable", "1.0.0")
+        self.send_header("Content-Length", "0")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _upload(self):
+        match = re.fullmatch(UPLOAD_PATH + r"/([0-9a-f]+)", self.path)
+        return self.server.uploads.get(match.group(1)) if match else None
+
+    def do_POST(self):
+        if self.path != UPLOAD_PATH:
+            return self._reply(404)
+        metadata = {}
+        for pair in filter(None, self.headers.get("Upload-Metadata", "").split(",")):
+            key, _, value = pair.partition(" ")
+            metadata[key] = base64.b64decode(value).decode()
+        length = self.headers.get("Upload-Length")
+        upload_id = uuid.uuid4().hex
+        self.server.uploads[upload_id] = {
+            "data": bytearray(),
+            "length": int(length) if length is not None else None,
+            "metadata": metadata,
+        }
+        self._reply(201, {"Location": f"{UPLOAD_PATH}/{upload_id}"})
+
+    def do_HEAD(self):
+        upload = self._upload()
+        if upload is None:
+            return self._reply(404)
+        self._reply(200, {"Upload-Offset": str(len(upload["data"])), "Cache-Control": "no-store"})
+
+    def do_PATCH(self):
+        upload = self._upload()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if upload is None:
+            return self._reply(404)
+        if int(self.headers["Upload-Offset"]) != len(upload["data"]):
+            return self._reply(409)
+        if self.headers.get("Upload-Length") is not None:
+            upload["length"] = int(self.headers["Upload-Length"])
+        upload["data"] += body
+        self.server.patches += 1
+        self._reply(204, {"Upload-Offset": str(len(upload["data"]))})
+
+
+class TusStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), TusHandler)
+        self.uploads: dict[str, dict] = {}
+        self.patches = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{UPLOAD_PATH}"
+
+
+if __name__ == "__main__":
+    server = TusStubServer(port=8001)
+    print(f"tus stand-in listening on {server.endpoint}")
+    threading.Event().wait()
@@ -0,0 +1,37 @@
+'''
+gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app (from the backend directory)
+
+The app is imported once in the master and forked into the workers, so the workers share its memory
+and start instantly. Anything a worker can not inherit (threads, sqlite connections, http pools, the
+supabase client) is created in the worker itself.
+
+Every worker has its own render queue and metrics, so RENDER_WORKERS and MAX_QUEUED_RENDERS are
+limits per worker process. Unless they are set, the machine's render budget (half its cores, 16 waiting
+renders) is split between the workers here. A frame stream from the express server
+(STREAM_FRAMES=true) lives in the worker that started it, so that mode needs WEB_CONCURRENCY=1.
+
+Every open progress stream (/video/render_events, see RENDER_EVENTS_MAX_SECONDS) holds one of a
+worker's WEB_THREADS threads, so a worker serves at most that many streams, with nothing left for
+other requests like /file/get_asset. Raise WEB_THREADS along with the number of renders watched at once.
+'''
+import os
+
+# the workers are separate processes, so render progress has to be shared through sqlite
+os.environ.setdefault("PROGRESS_STORE", "sqlite")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, os.cpu_count() or 1)))
+# each worker runs its own render queue (read when the app is imported, after this file)
+os.environ.setdefault("RENDER_WORKERS", str(max(1, (os.cpu_count() or 2) // (2 * workers))))
+os.environ.setdefault("MAX_QUEUED_RENDERS", str(max(1, 16 // workers)))
+# progress streams (server-sent events) hold a thread for as long as a render runs
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+# uploads and frame streams can take a while
+timeout = int(os.environ.get("WEB_TIMEOUT", 300))
+preload_app = True
+
+
+def post_worker_init(worker):
+    import main
+    main.start_background_work()
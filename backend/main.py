@@ -1,14 +1,38 @@
-from video_generation.video import video_bp
+from video_generation.video import video_bp, resume_uploads, outbox
+from video_generation.frame_stream import stream_bp
 from user.auth import auth_bp
 from utils.file_utils import file_bp
-from flask import Flask, Blueprint, request, jsonify
+from utils.metrics import metrics_bp
+from utils.asset_manifest import asset_manifest
+from flask import Flask
 from flask_cors import CORS
-import os
-app = Flask(__name__)
-CORS(app)
-app.register_blueprint(video_bp)
-app.register_blueprint(auth_bp)
-app.register_blueprint(file_bp)
+
+
+def start_background_work():
+    '''
+    Starts this process's background threads (in every worker, after it has been forked)
+    '''
+    asset_manifest.start()
+    outbox.start()
+    resume_uploads()
+
+
+def create_app(start_background: bool = True) -> Flask:
+    '''
+    Builds the app, start_background=False leaves the background threads to the worker processes
+    (see gunicorn.conf.py), since threads do not survive a fork
+    '''
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(video_bp)
+    app.register_blueprint(stream_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(file_bp)
+    app.register_blueprint(metrics_bp)
+    if start_background:
+        start_background_work()
+    return app
+
 
 if __name__ == '__main__':
-    app.run(host="localhost", debug=True, port=8000)
+    create_app().run(host="localhost", debug=True, port=8000)
@@ -0,0 +1,315 @@
+'''
+The frontend's elements (graphics/elements) with their state in NumPy arrays
+
+Every particle (or square) is a row, so moving them and checking them against their container
+happens for all of them at once. The arithmetic is done in the same order as the browser's, so a
+template ends up in the same place (and emits the same collisions on the same frames) as its preview.
+
+Containers return the events their move caused as (row, "collision" | "escape"), in row order.
+'''
+import math
+import numpy as np
+from renderer.seeded_random import SeededRandom
+
+
+def resolve_pairs(candidates: np.ndarray, resolve):
+    '''
+    Calls resolve(i, j) for every pair from the first one the broad phase flagged onwards
+
+    candidates is the vectorized broad phase (True where a pair may be touching). Resolving a pair
+    moves it, which can make later pairs touch, so the pairs are then resolved one after the other in
+    the order the browser goes through them, and resolve checks each pair again itself.
+    '''
+    hits = np.argwhere(np.triu(candidates, 1))
+    if len(hits) == 0:
+        return
+    first_i, first_j = (int(index) for index in hits[0])
+    count = len(candidates)
+    for i in range(first_i, count):
+        for j in range(first_j if i == first_i else i + 1, count):
+            resolve(i, j)
+
+
+class Particles:
+    '''
+    Circles moved by their velocity and gravity (graphics/elements/particle.ts)
+    '''
+
+    def __init__(self, radii: list[float], velocities: list[tuple[float, float]], gravity: float,
+                 appearances: list[str]):
+        self.pos = np.zeros((len(radii), 2))
+        self.vel = np.array(velocities, dtype=np.float64)
+        self.radius = np.array(radii, dtype=np.float64)
+        self.gravity = np.full(len(radii), gravity)
+        # whether each particle is still inside its arc
+        self.in_arc = np.ones(len(radii), dtype=bool)
+        self.appearances = appearances
+
+    def __len__(self):
+        return len(self.radius)
+
+    def move(self):
+        self.vel[:, 1] += self.gravity
+        self.pos += self.vel
+
+    def distances(self) -> np.ndarray:
+        delta = self.pos[:, None, :] - self.pos[None, :, :]
+        return np.sqrt(delta[..., 0] ** 2 + delta[..., 1] ** 2)
+
+    def touching(self) -> np.ndarray:
+        return self.distances() < self.radius[:, None] + self.radius[None, :]
+
+    def collides(self, i: int, j: int) -> bool:
+        dx = self.pos[i, 0] - self.pos[j, 0]
+        dy = self.pos[i, 1] - self.pos[j, 1]
+        return math.sqrt(dx ** 2 + dy ** 2) < self.radius[j] + self.radius[i]
+
+    def handle_collisions(self) -> list[tuple[int, str]]:
+        '''
+        Separates touching particles and exchanges their velocities along the line between them
+        '''
+        events = []
+
+        def resolve(i: int, j: int):
+            if not self.collides(i, j):
+                return
+            events.append((i, "collision"))
+            p1, p2 = self.pos[i].copy(), self.pos[j].copy()
+            v1, v2 = self.vel[i].copy(), self.vel[j].copy()
+            distance = math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+            overlap = distance - (self.radius[i] + self.radius[j])
+            direction = p1 - p2
+            magnitude = math.sqrt(direction[0] * direction[0] + direction[1] * direction[1])
+            direction = direction * ((0.5 * overlap) / magnitude)
+            p1, p2 = p1 - direction, p2 + direction
+
+            # p2's new velocity depends on p1's old one, so both are worked out before either is set
+            dp1, dp2 = p2 - p1, p1 - p2
+            dv1, dv2 = v2 - v1, v1 - v2
+            dot1 = dv1[0] * dp1[0] + dv1[1] * dp1[1]
+            dot2 = dv2[0] * dp2[0] + dv2[1] * dp2[1]
+            denominator1 = math.sqrt(dp1[0] * dp1[0] + dp1[1] * dp1[1]) ** 2
+            denominator2 = math.sqrt(dp2[0] * dp2[0] + dp2[1] * dp2[1]) ** 2
+            self.pos[i], self.pos[j] = p1, p2
+            self.vel[i] = v1 + dp1 * (dot1 / denominator1)
+            self.vel[j] = v2 + dp2 * (dot2 / denominator2)
+            self.vel[i, 1] -= self.gravity[i] / 2
+            self.vel[j, 1] -= self.gravity[j] / 2
+
+        resolve_pairs(self.touching(), resolve)
+        return events
+
+
+class Squares:
+    '''
+    Squares bouncing inside a box without gravity (graphics/elements/square.ts), pos is the top left corner
+    '''
+
+    def __init__(self, sizes: list[float], positions: list[tuple[float, float]],
+                 velocities: list[tuple[float, float]], appearances: list[str]):
+        self.pos = np.array(positions, dtype=np.float64)
+        self.vel = np.array(velocities, dtype=np.float64)
+        self.size = np.array(sizes, dtype=np.float64)
+        self.appearances = appearances
+
+    def __len__(self):
+        return len(self.size)
+
+    def move(self):
+        self.pos += self.vel
+
+    def touching(self) -> np.ndarray:
+        low, high = self.pos, self.pos + self.size[:, None]
+        apart = (high[:, None, :] < low[None, :, :]) | (high[None, :, :] < low[:, None, :])
+        return ~apart.any(axis=2)
+
+    def collides(self, i: int, j: int) -> bool:
+        (x1, y1), (x2, y2) = self.pos[i], self.pos[j]
+        s1, s2 = self.size[i], self.size[j]
+        return not (x1 + s1 < x2 or x2 + s2 < x1 or y1 + s1 < y2 or y2 + s2 < y1)
+
+    def handle_collisions(self) -> list[tuple[int, str]]:
+        '''
+        Bounces touching squares off each other along the side they hit (split into four 90 degree zones)
+        '''
+        events = []
+
+        def resolve(i: int, j: int):
+            if not self.collides(i, j):
+                return
+            events.append((i, "collision"))
+            dx = self.pos[j, 0] - self.pos[i, 0]
+            dy = self.pos[j, 1] - self.pos[i, 1]
+            angle = (math.atan2(dy, dx) * 180) / math.pi
+            if angle < 0:
+                angle += 360
+            if 0 <= angle < 45 or 315 < angle < 360:
+                # s2 is to the right
+                axis, direction, overlap = 0, -1, self.pos[i, 0] + self.size[i] - self.pos[j, 0]
+            elif 45 <= angle < 135:
+                # s2 is below
+                axis, direction, overlap = 1, -1, self.pos[i, 1] + self.size[i] - self.pos[j, 1]
+            elif 135 <= angle < 225:
+                # s2 is to the left
+                axis, direction, overlap = 0, 1, self.pos[j, 0] + self.size[j] - self.pos[i, 0]
+            else:
+                # s2 is above
+                axis, direction, overlap = 1, 1, self.pos[j, 1] + self.size[j] - self.pos[i, 1]
+            # s1 moves away from s2 (in direction) and s2 the other way
+            if self.vel[i, axis] * direction < 0:
+                self.vel[i, axis] = -self.vel[i, axis]
+            if self.vel[j, axis] * direction > 0:
+                self.vel[j, axis] = -self.vel[j, axis]
+            if overlap > 0:
+                move = overlap / 2 + 1
+                self.pos[i, axis] += direction * move
+                self.pos[j, axis] -= direction * move
+
+        resolve_pairs(self.touching(), resolve)
+        return events
+
+
+def reflect(particles: Particles, rows: np.ndarray, center: np.ndarray, radius: float, offsets: np.ndarray,
+            norms: np.ndarray):
+    '''
+    Bounces particles off the inside of a circle: reflects their velocity across the wall's tangent
+    and puts them back against the wall
+    '''
+    unit = offsets / norms[:, None]
+    tangent = np.stack((-offsets[:, 1], offsets[:, 0]), axis=1)
+    velocity = particles.vel[rows]
+    scale = (velocity[:, 0] * tangent[:, 0] + velocity[:, 1] * tangent[:, 1]) / \
+        (tangent[:, 0] * tangent[:, 0] + tangent[:, 1] * tangent[:, 1])
+    velocity = tangent * scale[:, None] * 2 - velocity
+    velocity[:, 1] -= particles.gravity[rows] / 2
+    particles.vel[rows] = velocity
+    particles.pos[rows] = center + unit * (radius - particles.radius[rows])[:, None]
+
+
+class Ring:
+    '''
+    A circle particles bounce around inside of (graphics/elements/ring.ts)
+    '''
+
+    def __init__(self, radius: float, width: int, height: int):
+        self.radius = radius
+        self.center = np.array([width / 2, height / 2])
+
+    def offsets(self, particles: Particles) -> tuple[np.ndarray, np.ndarray]:
+        offsets = particles.pos - self.center
+        return offsets, np.sqrt(offsets[:, 0] * offsets[:, 0] + offsets[:, 1] * offsets[:, 1])
+
+    def contain(self, particles: Particles) -> list[tuple[int, str]]:
+        offsets, norms = self.offsets(particles)
+        rows = np.flatnonzero(norms + particles.radius > self.radius)
+        if len(rows):
+            reflect(particles, rows, self.center, self.radius, offsets[rows], norms[rows])
+        return [(int(row), "collision") for row in rows]
+
+    def randomize_positions(self, particles: Particles, seed: float):
+        '''
+        Places the particles at random (seeded) spots inside, until none of them overlap
+        '''
+        rng = SeededRandom(seed)
+        while True:
+            for row in range(len(particles)):
+                angle = rng.random_range(0, 2 * math.pi)
+                distance = rng.random_range(0, self.radius - particles.radius[row] - 1)
+                particles.pos[row] = (self.center[0] + math.cos(angle) * distance,
+                                      self.center[1] + math.sin(angle) * distance)
+            if not np.triu(particles.touching(), 1).any():
+                return
+
+    def draw(self, canvas):
+        canvas.stroke_circle(self.center[0], self.center[1], self.radius, self.radius * 0.01, "blue")
+
+
+class Arc(Ring):
+    '''
+    A rotating ring with a gap particles can escape through (graphics/elements/arc.ts)
+    start_angle and end_angle are the gap's edges, counterclockwise (y up) and in radians
+    '''
+
+    def __init__(self, radius: float, empty_angle: float, width: int, height: int, rotation_speed: float = 0.01):
+        super().__init__(radius, width, height)
+        theta = (math.pi * empty_angle) / 180
+        self.start_angle = -theta / 2
+        self.end_angle = theta / 2
+        self.rotation_speed = rotation_speed
+
+    def move(self):
+        self.start_angle = math.fmod(self.start_angle + self.rotation_speed, 2 * math.pi)
+        self.end_angle = math.fmod(self.end_angle + self.rotation_speed, 2 * math.pi)
+
+    def in_gap(self, offsets: np.ndarray) -> np.ndarray:
+        angles = -np.arctan2(offsets[:, 1], offsets[:, 0])
+        angles = np.where(angles < 0, angles + 2 * math.pi, angles)
+        start = self.start_angle + 2 * math.pi if self.start_angle < 0 else self.start_angle
+        end = self.end_angle + 2 * math.pi if self.end_angle < 0 else self.end_angle
+        if start > end:
+            # the gap wraps around 0
+            return ((angles >= start) & (angles < 360)) | ((angles >= 0) & (angles <= end))
+        return (angles >= start) & (angles <= end)
+
+    def contain(self, particles: Particles) -> list[tuple[int, str]]:
+        offsets, norms = self.offsets(particles)
+        rows = np.flatnonzero(norms + particles.radius > self.radius)
+        if len(rows) == 0:
+            return []
+        escaped = self.in_gap(offsets[rows])
+        # the escape is only reported the first time a particle goes through the gap
+        newly_escaped = escaped & particles.in_arc[rows]
+        particles.in_arc[rows[escaped]] = False
+        bouncing = particles.in_arc[rows]
+        if bouncing.any():
+            reflect(particles, rows[bouncing], self.center, self.radius, offsets[rows][bouncing],
+                    norms[rows][bouncing])
+        events = []
+        for row, escape, bounce in zip(rows, newly_escaped, bouncing):
+            if escape:
+                events.append((int(row), "escape"))
+            if bounce:
+                events.append((int(row), "collision"))
+        return events
+
+    def draw(self, canvas):
+        # the canvas measures angles clockwise, so the gap is drawn from -end to -start
+        canvas.stroke_arc(self.center[0], self.center[1], self.radius,
+                          2 * math.pi - self.start_angle, 2 * math.pi - self.end_angle, 1, "red")
+
+
+class Box:
+    '''
+    A square squares bounce around inside of (graphics/elements/box.ts)
+    '''
+
+    def __init__(self, width: int, height: int):
+        self.size = width * 0.95
+        self.x = (width - self.size) / 2
+        self.y = (height - self.size) / 2
+
+    def contain(self, squares: Squares) -> list[tuple[int, str]]:
+        low = np.array([self.x, self.y])
+        high = low + self.size
+        far = squares.pos + squares.size[:, None]
+        below = squares.pos <= low
+        hit = below | (far >= high)
+        if not hit.any():
+            return []
+        inside = np.where(below, low + 1, high - squares.size[:, None] - 1)
+        squares.pos[hit] = inside[hit]
+        squares.vel[hit] *= -1
+        # a square hitting a corner reports both walls, x first
+        return [(int(row), "collision") for row, axis in np.argwhere(hit)]
+
+    def randomize_positions(self, squares: Squares, seed: float):
+        rng = SeededRandom(seed)
+        while True:
+            for row in range(len(squares)):
+                squares.pos[row, 0] = rng.random_range(self.x, self.x + self.size - squares.size[row])
+                squares.pos[row, 1] = rng.random_range(self.y, self.y + self.size - squares.size[row])
+            if not np.triu(squares.touching(), 1).any():
+                return
+
+    def draw(self, canvas):
+        canvas.stroke_rect(self.x, self.y, self.size, self.size, 1, "red")
@@ -0,0 +1,179 @@
+import math
+import functools
+import numpy as np
+from PIL import Image, ImageColor
+
+
+@functools.lru_cache(maxsize=256)
+def parse_color(color: str) -> tuple[tuple[float, float, float], float]:
+    '''
+    Any css color the canvas accepts ("#88b0db", "blue", "rgb(...)") as ((r, g, b), alpha between 0 and 1)
+    '''
+    rgba = ImageColor.getcolor(color, "RGBA")
+    return tuple(float(channel) for channel in rgba[:3]), rgba[3] / 255
+
+
+def load_image(path: str, width: float, height: float) -> np.ndarray:
+    '''
+    An image resized to (width, height) as float32 rgba, with alpha between 0 and 1
+    '''
+    with Image.open(path) as image:
+        image = image.convert("RGBA").resize((max(1, round(width)), max(1, round(height))), Image.LANCZOS)
+        pixels = np.asarray(image, dtype=np.float32)
+    pixels[..., 3] /= 255
+    return pixels
+
+
+class Canvas:
+    '''
+    An rgba frame buffer with the few canvas operations the templates draw with
+
+    Shapes are antialiased by the fraction of each pixel they cover, and blended only over their
+    bounding box. Outlines that do not move between frames (rings, boxes) keep their coverage, so
+    after the first frame drawing them is a single indexed blend. The same pixels are redrawn for
+    every frame, nothing is allocated per frame apart from the shapes' small bounding boxes.
+    '''
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.pixels = np.zeros((height, width, 4), dtype=np.uint8)
+        # (shape, geometry) => (rows, columns, coverage, angles) of the pixels an outline touches
+        self._outlines = {}
+
+    def frame(self) -> memoryview:
+        '''
+        The current frame as raw rgba bytes (a view, valid until the next frame is drawn)
+        '''
+        return self.pixels.reshape(-1).data
+
+    def fill(self, color: str):
+        rgb, alpha = parse_color(color)
+        # filling whole pixels at a time is several times faster than filling the channels one by one
+        pixel = np.frombuffer(bytes([*(int(channel) for channel in rgb), round(alpha * 255)]), dtype=np.uint32)
+        self.pixels.view(np.uint32).fill(pixel[0])
+
+    def _blend(self, index, coverage: np.ndarray, color: str):
+        rgb, alpha = parse_color(color)
+        if alpha < 1:
+            coverage = coverage * alpha
+        target = self.pixels[index][..., :3].astype(np.float32)
+        target += (np.array(rgb, dtype=np.float32) - target) * coverage[..., None]
+        self.pixels[index + (slice(0, 3),)] = target + 0.5
+
+    def _box(self, left: float, top: float, right: float, bottom: float) -> tuple[int, int, int, int] | None:
+        x0, y0 = max(0, math.floor(left)), max(0, math.floor(top))
+        x1, y1 = min(self.width, math.ceil(right)), min(self.height, math.ceil(bottom))
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+    def _distances(self, x: float, y: float, box: tuple[int, int, int, int]) -> np.ndarray:
+        # distance from (x, y) to the center of every pixel in the box
+        x0, y0, x1, y1 = box
+        dx = np.arange(x0, x1, dtype=np.float32) + 0.5 - x
+        dy = np.arange(y0, y1, dtype=np.float32) + 0.5 - y
+        return np.sqrt(dx[None, :] ** 2 + dy[:, None] ** 2)
+
+    def fill_circle(self, x: float, y: float, radius: float, color: str):
+        box = self._box(x - radius - 1, y - radius - 1, x + radius + 1, y + radius + 1)
+        if box is None:
+            return
+        coverage = np.clip(radius - self._distances(x, y, box) + 0.5, 0, 1)
+        x0, y0, x1, y1 = box
+        self._blend((slice(y0, y1), slice(x0, x1)), coverage, color)
+
+    def fill_rect(self, x: float, y: float, width: float, height: float, color: str):
+        box = self._box(x, y, x + width, y + height)
+        if box is None:
+            return
+        x0, y0, x1, y1 = box
+        # how much of every column and row the rectangle covers
+        columns = np.arange(x0, x1, dtype=np.float32)
+        rows = np.arange(y0, y1, dtype=np.float32)
+        cover_x = np.clip(np.minimum(columns + 1, x + width) - np.maximum(columns, x), 0, 1)
+        cover_y = np.clip(np.minimum(rows + 1, y + height) - np.maximum(rows, y), 0, 1)
+        self._blend((slice(y0, y1), slice(x0, x1)), cover_y[:, None] * cover_x[None, :], color)
+
+    def _circle_outline(self, x: float, y: float, radius: float, line_width: float):
+        key = ("circle", x, y, radius, line_width)
+        if key not in self._outlines:
+            reach = radius + line_width / 2 + 1
+            box = self._box(x - reach, y - reach, x + reach, y + reach)
+            if box is None:
+                self._outlines[key] = None
+                return None
+            x0, y0, x1, y1 = box
+            distances = self._distances(x, y, box)
+            coverage = np.clip(line_width / 2 + 0.5 - np.abs(distances - radius), 0, min(line_width, 1))
+            rows, columns = np.nonzero(coverage)
+            dy = rows.astype(np.float32) + y0 + 0.5 - y
+            dx = columns.astype(np.float32) + x0 + 0.5 - x
+            # canvas angles (y points down) of every pixel, for drawing only part of the circle
+            angles = np.mod(np.arctan2(dy, dx), 2 * np.pi)
+            self._outlines[key] = (rows + y0, columns + x0, coverage[rows, columns], angles)
+        return self._outlines[key]
+
+    def stroke_circle(self, x: float, y: float, radius: float, line_width: float, color: str):
+        outline = self._circle_outline(x, y, radius, line_width)
+        if outline is not None:
+            rows, columns, coverage, _ = outline
+            self._blend((rows, columns), coverage, color)
+
+    def stroke_arc(self, x: float, y: float, radius: float, start: float, end: float, line_width: float,
+                   color: str):
+        '''
+        ctx.arc(x, y, radius, start, end) followed by ctx.stroke(), drawn clockwise from start to end
+        '''
+        outline = self._circle_outline(x, y, radius, line_width)
+        if outline is None:
+            return
+        rows, columns, coverage, angles = outline
+        if end - start < 2 * math.pi:
+            drawn = np.mod(angles - start, 2 * np.pi) <= (end - start) % (2 * math.pi)
+            rows, columns, coverage = rows[drawn], columns[drawn], coverage[drawn]
+        self._blend((rows, columns), coverage, color)
+
+    def stroke_rect(self, x: float, y: float, width: float, height: float, line_width: float, color: str):
+        key = ("rect", x, y, width, height, line_width)
+        if key not in self._outlines:
+            half = line_width / 2
+            box = self._box(x - half - 1, y - half - 1, x + width + half + 1, y + height + half + 1)
+            if box is None:
+                self._outlines[key] = None
+            else:
+                x0, y0, x1, y1 = box
+                columns = np.arange(x0, x1, dtype=np.float32)
+                rows = np.arange(y0, y1, dtype=np.float32)
+
+                def cover(low: float, high: float, cells: np.ndarray) -> np.ndarray:
+                    return np.clip(np.minimum(cells + 1, high) - np.maximum(cells, low), 0, 1)
+
+                # the outer rectangle of the stroke minus the inner one
+                outer = cover(y - half, y + height + half, rows)[:, None] * \
+                    cover(x - half, x + width + half, columns)[None, :]
+                inner = cover(y + half, y + height - half, rows)[:, None] * \
+                    cover(x + half, x + width - half, columns)[None, :]
+                coverage = outer - inner
+                nonzero_rows, nonzero_columns = np.nonzero(coverage > 0)
+                self._outlines[key] = (nonzero_rows + y0, nonzero_columns + x0,
+                                       coverage[nonzero_rows, nonzero_columns], None)
+        outline = self._outlines[key]
+        if outline is not None:
+            rows, columns, coverage, _ = outline
+            self._blend((rows, columns), coverage, color)
+
+    def draw_image(self, image: np.ndarray, x: float, y: float):
+        '''
+        Draws an image from load_image with its top left corner at (x, y), rounded to the nearest pixel
+        '''
+        height, width = image.shape[:2]
+        left, top = math.floor(x + 0.5), math.floor(y + 0.5)
+        box = self._box(left, top, left + width, top + height)
+        if box is None:
+            return
+        x0, y0, x1, y1 = box
+        visible = image[y0 - top:y1 - top, x0 - left:x1 - left]
+        target = self.pixels[y0:y1, x0:x1, :3].astype(np.float32)
+        target += (visible[..., :3] - target) * visible[..., 3:]
+        self.pixels[y0:y1, x0:x1, :3] = target + 0.5
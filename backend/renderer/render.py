@@ -0,0 +1,53 @@
+import os
+import time
+from renderer.raster import Canvas
+from renderer.templates import TEMPLATES
+from video_generation.frame_stream import FrameStream, finish_stream, streams, streams_lock
+from video_generation.profiles import select_profile
+
+
+def supports(animation_path: str) -> bool:
+    return animation_path in TEMPLATES
+
+
+def render_session(data: dict, on_frame=None) -> dict:
+    '''
+    Draws every frame of a session's animation and encodes it as it is drawn
+
+    The frames go straight from one reused frame buffer into the session's frame stream (left open for
+    render_video to finish, like a stream from the express server). Fills in what the express server
+    would have sent with the render (audioTimeline, assetLoadTime, frameWriteTime, ...) and returns data.
+    on_frame(frame, total_frames) is called after every frame.
+    '''
+    config = data["config"]
+    template = TEMPLATES[data["path"]](config)
+    start_time = time.time()
+    template.load()
+    asset_load_time = time.time() - start_time
+
+    start_time = time.time()
+    os.makedirs(data["sessionDir"], exist_ok=True)
+    canvas = Canvas(template.width, template.height)
+    # closing any stream left over from a render that never finished
+    finish_stream(data["userID"], data["sessionID"])
+    stream = FrameStream(data["sessionDir"], template.width, template.height, "rgba", template.fps,
+                         select_profile(data.get("profile"), data.get("plan")))
+    with streams_lock:
+        streams[(str(data["userID"]), str(data["sessionID"]))] = stream
+    total_frames = int(data["duration"]) * template.fps
+    try:
+        for frame in range(total_frames):
+            template.update()
+            template.draw(canvas)
+            stream.write(canvas.frame())
+            if on_frame is not None:
+                on_frame(frame + 1, total_frames)
+    except Exception:
+        # not leaving ffmpeg running for a render that failed
+        finish_stream(data["userID"], data["sessionID"])
+        raise
+    template.finish()
+
+    data.update(audioTimeline=template.audio_timeline, assetLoadTime=asset_load_time,
+                frameWriteTime=time.time() - start_time, resolution=f"{template.width}p", streamed=True)
+    return data
@@ -0,0 +1,24 @@
+import math
+
+
+class SeededRandom:
+    '''
+    The frontend's linear congruential generator (graphics/utils/random.ts), step for step
+
+    The browser works on doubles, so the seed is kept as a float (and wrapped with fmod like JS's %)
+    for a template to place its elements exactly where the browser preview does.
+    '''
+    MODULUS = float(0x7fffffff)
+    MULTIPLIER = float(0x41c64e6d)
+    INCREMENT = float(0x3039)
+
+    def __init__(self, seed: float):
+        self.seed = float(seed)
+
+    def next(self) -> float:
+        self.seed = math.fmod(self.seed * self.MULTIPLIER + self.INCREMENT, self.MODULUS)
+        return self.seed / self.MODULUS
+
+    def random_range(self, low: float, high: float) -> float:
+        # an integer between low and high (inclusive), like randomRange in the frontend
+        return math.floor(self.next() * (high - low + 1)) + low
@@ -0,0 +1,324 @@
+'''
+Server-side versions of the animation templates in frontend/src/graphics/animations
+
+Each template takes the same config the editor builds from /file/animation_configs and
+/file/element_map, and steps and draws exactly like its frontend counterpart: update() advances the
+physics by a frame (adding to audio_timeline as things collide), draw(canvas) rasterizes the frame.
+'''
+import os
+import math
+from PIL import Image
+from renderer.physics import Particles, Squares, Ring, Arc, Box
+from renderer.raster import Canvas, load_image
+
+# our ROOT directory, relative to the backend directory we run from
+ROOT_DIR = "../"
+# the audio timeline refers to assets the way the frontend does, so generate_audio can resolve them locally
+ASSET_URL = "http://localhost:8000/file/get_asset/"
+# the templates are laid out for 720p and scaled for the other widths
+SCALE_FACTORS = {480: 2 / 3, 720: 1, 1080: 3 / 2}
+
+
+def asset_path(path: str) -> str:
+    return os.path.join(ROOT_DIR, path)
+
+
+class Template:
+    fps = 60
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.width = int(config["canvas_width"])
+        self.height = int(config["canvas_height"])
+        self.scale = SCALE_FACTORS.get(self.width, 1)
+        self.center_x = self.width / 2
+        self.center_y = self.height / 2
+        self.frame = 0
+        self.audio_timeline: list[dict] = []
+
+    def load(self):
+        '''
+        Reads the images and sounds the template needs
+        '''
+
+    def update(self):
+        raise NotImplementedError
+
+    def draw(self, canvas: Canvas):
+        raise NotImplementedError
+
+    def finish(self):
+        '''
+        Called once every frame has been drawn
+        '''
+
+    def play(self, url: str, **fields):
+        self.audio_timeline.append({"audio": url, "frame": self.frame, **fields})
+
+
+class ParticleTemplate(Template):
+    '''
+    Particles bouncing inside a container, drawn as colored circles or images
+    '''
+
+    def __init__(self, config: dict, particles: Particles, container: Ring):
+        super().__init__(config)
+        self.particles = particles
+        self.container = container
+        # row => image resized to the particle, for particles whose appearance is an image
+        self.images = {}
+        self.container.randomize_positions(self.particles, config["seed"])
+
+    def load(self):
+        for row, appearance in enumerate(self.particles.appearances):
+            if appearance and not appearance.startswith("#"):
+                diameter = self.particles.radius[row] * 2
+                try:
+                    self.images[row] = load_image(asset_path(appearance), diameter, diameter)
+                except OSError as e:
+                    print(f"Could not load {appearance}: {e}")
+
+    def handle_events(self, events: list[tuple[int, str]]):
+        for _, event in events:
+            if event == "collision":
+                self.on_collision()
+            else:
+                self.on_escape()
+
+    def on_collision(self):
+        pass
+
+    def on_escape(self):
+        pass
+
+    def move_container(self):
+        pass
+
+    def update(self):
+        self.particles.move()
+        self.handle_events(self.container.contain(self.particles))
+        self.move_container()
+        self.handle_events(self.particles.handle_collisions())
+        self.frame += 1
+
+    def draw_particles(self, canvas: Canvas):
+        for row, appearance in enumerate(self.particles.appearances):
+            x, y = self.particles.pos[row]
+            radius = self.particles.radius[row]
+            if row in self.images:
+                image = self.images[row]
+                if image.shape[0] != max(1, round(radius * 2)):
+                    # the particle grew since its image was loaded
+                    self.images[row] = image = load_image(asset_path(appearance), radius * 2, radius * 2)
+                canvas.draw_image(image, x - radius, y - radius)
+            elif appearance and appearance.startswith("#"):
+                canvas.fill_circle(x, y, radius, appearance)
+
+    def draw(self, canvas: Canvas):
+        canvas.fill(self.config["background_color"])
+        self.draw_particles(canvas)
+        self.container.draw(canvas)
+
+
+class ParticleRing(ParticleTemplate):
+    '''
+    collection/particle-ring: two particles in a ring, with a sound on every collision
+    '''
+
+    def __init__(self, config: dict, speeds: tuple = ((2, 4), (4, 2)), gravity: float = 0.01):
+        scale = SCALE_FACTORS.get(int(config["canvas_width"]), 1)
+        particles = Particles(
+            [40 * scale, 40 * scale], [(vx * scale, vy * scale) for vx, vy in speeds], gravity * scale,
+            [config.get("particle_1_appearance"), config.get("particle_2_color")])
+        super().__init__(config, particles, Ring(0.8 * 360 * scale, int(config["canvas_width"]),
+                                                 int(config["canvas_height"])))
+        self.collision_sound = ASSET_URL + str(self.config.get("collision_sound"))
+
+    def on_collision(self):
+        self.play(self.collision_sound)
+
+
+class MidiBounce(ParticleRing):
+    '''
+    midi-bounce/midibounce: particle-ring that plays the next note of a song on every collision
+    '''
+
+    def __init__(self, config: dict):
+        super().__init__(config, speeds=((2, 6), (6, 2)), gravity=0.1)
+        self.note_paths = []
+        self.note_index = 0
+
+    def load(self):
+        super().load()
+        song = self.config["midi_song"]
+        note_count = len(os.listdir(asset_path(song)))
+        self.note_paths = [ASSET_URL + f"{song}/note{index:04d}.mp3" for index in range(note_count)]
+
+    def on_collision(self):
+        self.play(self.note_paths[self.note_index])
+        self.note_index = (self.note_index + 1) % len(self.note_paths)
+
+
+class ParticleArc(ParticleTemplate):
+    '''
+    ball-escape-finite/particle-arc: a particle in a rotating arc, with a sound when it escapes
+    '''
+
+    def __init__(self, config: dict):
+        scale = SCALE_FACTORS.get(int(config["canvas_width"]), 1)
+        width, height = int(config["canvas_width"]), int(config["canvas_height"])
+        particles = Particles([40 * scale], [(5 * scale, 5 * scale)], 0.25 * scale,
+                              [config.get("particle_1_appearance")])
+        super().__init__(config, particles, Arc(0.8 * (width / 2), 45, width, height))
+        self.collision_sound = ASSET_URL + str(self.config.get("collision_sound"))
+        self.escape_sound = ASSET_URL + str(self.config.get("escape_sound"))
+
+    def move_container(self):
+        self.container.move()
+
+    def on_collision(self):
+        self.play(self.collision_sound)
+
+    def on_escape(self):
+        self.play(self.escape_sound)
+
+
+class GifBounce(ParticleTemplate):
+    '''
+    gif-bounce/multisound: a growing particle in a ring that plays a gif (and its song) while it keeps bouncing
+    '''
+    # how many frames the gif and song keep going after a bounce
+    sound_buffer = 45
+
+    def __init__(self, config: dict):
+        scale = SCALE_FACTORS.get(int(config["canvas_width"]), 1)
+        particles = Particles([60 * scale], [(4 * scale, 6 * scale)], 0.25 * scale,
+                              [config.get("particle_1_color")])
+        super().__init__(config, particles, Ring(0.8 * 360 * scale, int(config["canvas_width"]),
+                                                 int(config["canvas_height"])))
+        self.duration = config["duration"] * self.fps
+        self.song_url = ASSET_URL + str(config.get("collision_sound"))
+        self.sequence = config["sequence"]
+        self.sequence_fps = config["sequence_fps"]
+        self.sequence_frame_count = config["sequence_frame_count"]
+        self.bounce_times = []
+        self.last = 0
+        # how far the gif moves per frame (0 while it is paused) and where it is
+        self.gif_step = 0
+        self.gif_position = 0
+        # gif frame index => frame resized for the canvas (None if it could not be read)
+        self.gif_frames = {}
+
+    def gif_frame(self, index: int):
+        if index not in self.gif_frames:
+            path = asset_path(os.path.join(self.sequence, f"frame{index + 1:04d}.png"))
+            try:
+                with Image.open(path) as image:
+                    aspect = image.height / image.width
+                width = 0.3 * self.width
+                self.gif_frames[index] = load_image(path, width, width * aspect)
+            except OSError as e:
+                print(f"Could not load {path}: {e}")
+                self.gif_frames[index] = None
+        return self.gif_frames[index]
+
+    def on_collision(self):
+        # the particle grows and moves towards the center a little on every bounce
+        self.particles.radius[0] += 1
+        self.particles.pos[0] += (1 / 100) * (self.center_x - self.particles.pos[0, 0]), \
+            (1 / 100) * (self.center_y - self.particles.pos[0, 1])
+        self.gif_step = self.sequence_fps / self.fps
+        self.last = self.frame
+        self.bounce_times.append(self.frame)
+
+    def update(self):
+        self.particles.move()
+        self.handle_events(self.container.contain(self.particles))
+        self.handle_events(self.particles.handle_collisions())
+        if self.frame - self.last >= self.sound_buffer:
+            self.gif_step = 0
+        self.frame += 1
+
+    def draw(self, canvas: Canvas):
+        super().draw(canvas)
+        self.gif_position += self.gif_step
+        # Math.round, which rounds halves up
+        index = math.floor(self.gif_position + 0.5) % (self.sequence_frame_count - 1)
+        image = self.gif_frame(index)
+        if image is not None:
+            height, width = image.shape[:2]
+            canvas.draw_image(image, self.center_x - width / 2, self.center_y - height / 2)
+
+    def finish(self):
+        '''
+        Turns the bounces into stretches of the song (bounces less than sound_buffer frames apart share one)
+        '''
+        if not self.bounce_times:
+            return
+        start = self.bounce_times[0]
+        for i in range(1, len(self.bounce_times)):
+            if self.bounce_times[i] - self.bounce_times[i - 1] >= self.sound_buffer:
+                audio_duration = self.bounce_times[i - 1] + self.sound_buffer - start
+                self.audio_timeline.append({"audio": self.song_url, "frame": start,
+                                            "audio_duration": math.floor(audio_duration / 60 * 1000 + 0.5)})
+                start = self.bounce_times[i]
+            # the last bounce, if the video ends before its stretch would
+            if self.duration - self.bounce_times[i] < self.sound_buffer and i == len(self.bounce_times) - 1:
+                audio_duration = self.duration - self.bounce_times[i]
+                self.audio_timeline.append({"audio": self.song_url, "frame": start,
+                                            "audio_duration": math.floor(audio_duration / 60 * 1000 + 0.5)})
+
+
+class SquareBox(Template):
+    '''
+    square-battle/square-box: two squares bouncing around a box, with a sound on every collision
+    '''
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.box = Box(self.width, self.height)
+        size = self.box.size * 0.2 * self.scale
+        offset = 50 * self.scale
+        self.squares = Squares(
+            [size, size],
+            [(self.center_x + offset, self.center_y + offset), (self.center_x - offset, self.center_y - offset)],
+            [(6 * self.scale, 4 * self.scale), (-8 * self.scale, 7 * self.scale)],
+            [config.get("square_1_appearance"), config.get("square_2_appearance")])
+        self.box.randomize_positions(self.squares, config["seed"])
+        self.collision_sound = ASSET_URL + str(config.get("collision_sound"))
+        self.images = {}
+
+    def load(self):
+        for row, appearance in enumerate(self.squares.appearances):
+            if appearance and not appearance.startswith("#"):
+                try:
+                    self.images[row] = load_image(asset_path(appearance), self.squares.size[row],
+                                                  self.squares.size[row])
+                except OSError as e:
+                    print(f"Could not load {appearance}: {e}")
+
+    def update(self):
+        self.squares.move()
+        for _ in self.box.contain(self.squares) + self.squares.handle_collisions():
+            self.play(self.collision_sound)
+        self.frame += 1
+
+    def draw(self, canvas: Canvas):
+        canvas.fill(self.config["background_color"])
+        for row, appearance in enumerate(self.squares.appearances):
+            x, y = self.squares.pos[row]
+            if row in self.images:
+                canvas.draw_image(self.images[row], x, y)
+            elif appearance and appearance.startswith("#"):
+                canvas.fill_rect(x, y, self.squares.size[row], self.squares.size[row], appearance)
+        self.box.draw(canvas)
+
+
+# animationPath (as the editor and the express server name them) => template
+TEMPLATES = {
+    "collection/particle-ring": ParticleRing,
+    "midi-bounce/midibounce": MidiBounce,
+    "ball-escape-finite/particle-arc": ParticleArc,
+    "gif-bounce/multisound": GifBounce,
+    "square-battle/square-box": SquareBox,
+}
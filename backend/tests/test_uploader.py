@@ -0,0 +1,180 @@
+'''
+Tests for the resumable uploader against the local tus stand-in (benchmarks/stubs/tus_server.py)
+
+run from the backend directory: python -m pytest tests
+'''
+import os
+import time
+import threading
+import pytest
+from benchmarks.stubs.tus_server import TusStubServer
+from video_generation import uploader
+from video_generation.uploader import TusUploader, TusError, UploadAborted, upload_file, pending_uploads
+
+# small chunks, so a few kilobytes already make a multi-chunk upload
+CHUNK_SIZE = 1024
+METADATA = {"bucketName": "videos", "objectName": "user/video_session", "contentType": "video/mp4"}
+
+
+@pytest.fixture(autouse=True)
+def upload_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploader, "UPLOAD_STATE_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(uploader, "BASE_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(uploader, "ADAPTIVE_CHUNKS", False)
+
+
+@pytest.fixture
+def server():
+    server = TusStubServer()
+    yield server
+    server.shutdown()
+
+
+class FailingUploader(TusUploader):
+    '''
+    Loses its connection after a number of chunks, like a process that is killed mid upload
+    '''
+
+    def __init__(self, endpoint: str, chunks: int):
+        super().__init__(endpoint, {})
+        self.chunks = chunks
+
+    def patch(self, url, offset, data, length=None):
+        if self.chunks == 0:
+            raise TusError("connection lost")
+        self.chunks -= 1
+        return super().patch(url, offset, data, length)
+
+
+def only_upload(server) -> dict:
+    assert len(server.uploads) == 1
+    return next(iter(server.uploads.values()))
+
+
+def test_uploads_whole_file(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    content = os.urandom(CHUNK_SIZE * 3 + 100)
+    path.write_bytes(content)
+    progress = []
+
+    chunks = upload_file(TusUploader(server.endpoint, {}), str(path), "user/video_session", METADATA,
+                         on_progress=lambda sent, total: progress.append((sent, total)))
+
+    upload = only_upload(server)
+    assert bytes(upload["data"]) == content
+    assert upload["length"] == len(content)
+    assert upload["metadata"]["objectName"] == "user/video_session"
+    assert [chunk["bytes"] for chunk in chunks] == [CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE, 100]
+    assert progress[-1] == (len(content), len(content))
+    # a finished upload leaves nothing behind to be resumed
+    assert pending_uploads() == []
+
+
+def test_uploads_growing_file(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    content = os.urandom(CHUNK_SIZE * 4 + 10)
+    finished = threading.Event()
+    progress = []
+
+    def write():
+        # the file appears after the upload started, and is written a piece at a time
+        time.sleep(0.3)
+        with open(path, "wb") as file:
+            for start in range(0, len(content), 700):
+                file.write(content[start:start + 700])
+                file.flush()
+                time.sleep(0.1)
+        finished.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    upload_file(TusUploader(server.endpoint, {}), str(path), "user/video_session", METADATA,
+                on_progress=lambda sent, total: progress.append((sent, total)), finished=finished)
+    writer.join()
+
+    upload = only_upload(server)
+    assert bytes(upload["data"]) == content
+    # the length was deferred until the last chunk
+    assert upload["length"] == len(content)
+    assert progress[-1] == (len(content), len(content))
+    # every chunk sent while the file was growing was a full one
+    assert all(sent % CHUNK_SIZE == 0 for sent, total in progress if total is None)
+    assert pending_uploads() == []
+
+
+def test_waits_for_new_file(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    # the previous render's video, still there when the upload starts
+    path.write_bytes(b"old" * CHUNK_SIZE)
+    content = os.urandom(CHUNK_SIZE * 2 + 10)
+    finished, created = threading.Event(), threading.Event()
+
+    def write():
+        time.sleep(0.3)
+        path.unlink()
+        created.set()
+        time.sleep(0.3)
+        path.write_bytes(content)
+        finished.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    upload_file(TusUploader(server.endpoint, {}), str(path), "user/video_session", METADATA,
+                finished=finished, created=created)
+    writer.join()
+
+    assert bytes(only_upload(server)["data"]) == content
+
+
+def test_abandons_growing_file_that_failed(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    path.write_bytes(os.urandom(CHUNK_SIZE * 2))
+    finished, failed = threading.Event(), threading.Event()
+    failed.set()
+    finished.set()
+
+    with pytest.raises(UploadAborted):
+        upload_file(TusUploader(server.endpoint, {}), str(path), "user/video_session", METADATA,
+                    finished=finished, failed=failed)
+    assert pending_uploads() == []
+
+
+def test_resumes_after_restart(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    content = os.urandom(CHUNK_SIZE * 3 + 100)
+    path.write_bytes(content)
+    extra_state = {"render": {"data": {"userID": "user"}, "timings": {}}}
+
+    with pytest.raises(TusError):
+        upload_file(FailingUploader(server.endpoint, chunks=2), str(path), "user/video_session", METADATA,
+                    extra_state=extra_state)
+    # what a restarted process finds and resumes
+    pending = pending_uploads()
+    assert len(pending) == 1
+    assert pending[0]["path"] == str(path)
+    assert pending[0]["render"] == extra_state["render"]
+
+    chunks = upload_file(TusUploader(server.endpoint, {}), pending[0]["path"], pending[0]["key"],
+                         pending[0]["metadata"])
+
+    # the same upload was continued from where the server was, not started over
+    upload = only_upload(server)
+    assert bytes(upload["data"]) == content
+    assert chunks[0]["offset"] == CHUNK_SIZE * 2
+    assert server.patches == 4
+    assert pending_uploads() == []
+
+
+def test_starts_over_when_file_changed(server, tmp_path):
+    path = tmp_path / "final.mp4"
+    path.write_bytes(os.urandom(CHUNK_SIZE * 3))
+
+    with pytest.raises(TusError):
+        upload_file(FailingUploader(server.endpoint, chunks=1), str(path), "user/video_session", METADATA)
+    # a new render of the session replaced the video before the upload was resumed
+    content = os.urandom(CHUNK_SIZE * 2)
+    path.write_bytes(content)
+    upload_file(TusUploader(server.endpoint, {}), str(path), "user/video_session", METADATA)
+
+    assert len(server.uploads) == 2
+    assert any(bytes(upload["data"]) == content for upload in server.uploads.values())
@@ -1,15 +1,67 @@
 
 import os
+import time
+import threading
 from dotenv import load_dotenv, dotenv_values
 from flask import Blueprint, Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
-from supabase import create_client, Client
 load_dotenv()
 supabase_url: str = str(os.environ.get("SUPABASE_URL"))
 supabase_key: str = str(os.environ.get("SUPABASE_KEY"))
-supabase: Client = create_client(supabase_url, supabase_key)
 auth_bp = Blueprint("auth_bp", __name__)
 
+# the client of this process and the process it was made in (a forked worker makes its own)
+_supabase = None
+_supabase_pid = None
+_supabase_lock = threading.Lock()
+
+# the custom users table, with the plan of every user (see the notes below, it may not exist yet)
+USERS_TABLE = os.environ.get("USERS_TABLE", "Users")
+# how long a user's plan (or the lack of one) is remembered before it is looked up again
+PLAN_CACHE_SECONDS = int(os.environ.get("PLAN_CACHE_SECONDS", 60))
+# user => (plan or None, when it was looked up)
+_plans: dict[str, tuple[str | None, float]] = {}
+_plans_lock = threading.Lock()
+
+
+def get_supabase():
+    '''
+    Returns this process's supabase client, created on first use
+
+    The client keeps pooled connections, so every request of a worker shares one, and since its
+    sockets can not be shared with a forked process, each worker process creates its own.
+    '''
+    global _supabase, _supabase_pid
+    with _supabase_lock:
+        if _supabase is None or _supabase_pid != os.getpid():
+            # importing supabase takes most of our startup time, so workers that never use it skip it
+            from supabase import create_client
+            _supabase = create_client(supabase_url, supabase_key)
+            _supabase_pid = os.getpid()
+        return _supabase
+
+
+def get_plan(userID) -> str | None:
+    '''
+    Returns a user's plan from the users table, so it can never be picked by the client
+    Returns None when the plan is not known (no such user or table, or the lookup failed), which
+    callers treat as no plan rather than the cheapest one. Either way the answer is cached for PLAN_CACHE_SECONDS.
+    '''
+    now = time.time()
+    with _plans_lock:
+        cached = _plans.get(str(userID))
+    if cached is not None and now - cached[1] < PLAN_CACHE_SECONDS:
+        return cached[0]
+    try:
+        rows = get_supabase().table(USERS_TABLE).select("plan").eq("userid", str(userID)).execute().data
+        plan = (rows[0].get("plan") if rows else None) or None
+    except Exception as e:
+        print(f"Could not look up the plan of {userID}: {e}")
+        plan = None
+    with _plans_lock:
+        _plans[str(userID)] = (plan, now)
+    return plan
+
 
 '''
 auth
@@ -0,0 +1,50 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from video_generation.progress_store import create_progress_store
+
+# how many uploaded assets are post-processed at once (gif extraction already fans out over its own process pool)
+ASSET_JOB_WORKERS = int(os.environ.get("ASSET_JOB_WORKERS", 2))
+# jobs are kept like render progress (in memory, or in the shared SQLite database), under this "user"
+JOB_KEY = "asset_job"
+
+job_store = create_progress_store()
+job_executor = ThreadPoolExecutor(max_workers=ASSET_JOB_WORKERS, thread_name_prefix="asset-job")
+
+
+def submit_job(work, *args) -> str:
+    '''
+    Runs work(report, *args) in the background and returns the job's id
+
+    report(progress, **fields) updates what /file/job/<job_id> returns while the job runs,
+    and whatever work returns becomes the job's result.
+    '''
+    job_id = uuid.uuid4().hex
+    job_store.set(JOB_KEY, job_id, progress=0, info={"status": "queued"})
+    job_executor.submit(run_job, job_id, work, args)
+    return job_id
+
+
+def run_job(job_id: str, work, args):
+    def report(progress: float, **fields):
+        # 100 means finished, so a running job stays below it
+        job_store.set(JOB_KEY, job_id, progress=min(progress, 99), info={"status": "running", **fields})
+
+    report(0)
+    try:
+        result = work(report, *args)
+    except Exception as e:
+        print(f"Asset job {job_id} failed: {e}")
+        job_store.set(JOB_KEY, job_id, progress=100, info={"status": "error", "message": str(e)})
+        return
+    job_store.set(JOB_KEY, job_id, progress=100, info={"status": "done", "result": result})
+
+
+def get_job(job_id: str) -> dict | None:
+    '''
+    Returns {"job_id", "progress", "status", ...} ("result" once done, "message" if it failed), or None
+    '''
+    entry = job_store.get(JOB_KEY, job_id)
+    if entry is None:
+        return None
+    return {"job_id": job_id, "progress": entry["progress"], **(entry["info"] or {})}
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import mimetypes
+import threading
+from utils.lazy_import import lazy_module
+from utils.audio_cache import hash_file
+
+ffmpeg = lazy_module("ffmpeg")
+
+# our ROOT directory, relative to the backend directory we run from
+ROOT_DIR = "../"
+ASSET_DIR = "assets"
+# how often the watcher looks for changed assets and config files
+MANIFEST_POLL_INTERVAL = float(os.environ.get("MANIFEST_POLL_INTERVAL", 5))
+audio_extensions = (".mp3", ".wav", ".ogg")
+
+
+def audio_duration(path: str) -> float | None:
+    try:
+        return float(ffmpeg.probe(path)["format"]["duration"])
+    except Exception:
+        return None
+
+
+class AssetManifest:
+    '''
+    In-memory index of every file under assets/, built at startup and refreshed by a polling watcher
+
+    files: "assets/sound_effects/button1.mp3" => {"size", "mtime", "sha256", "mime", "duration"}
+    directories: "assets/midi/gfalls" => {"file_count"} (the note/frame count of a folder)
+
+    Unchanged files (same size and mtime) keep their entry, so a refresh only hashes and probes what changed.
+    '''
+
+    def __init__(self, root: str = ROOT_DIR, asset_dir: str = ASSET_DIR):
+        self.root = root
+        self.asset_dir = asset_dir
+        self.files: dict[str, dict] = {}
+        self.directories: dict[str, dict] = {}
+        self.body = b"{}"
+        self.etag = None
+        self.ready = threading.Event()
+        self._signature = None
+        # the process that started the watcher (a forked worker has to start its own)
+        self._started_pid = None
+        self._lock = threading.Lock()
+        # small files (like our json configs) served from memory and refreshed by the same watcher
+        self.cached_files: dict[str, "CachedFile"] = {}
+
+    def _scan(self) -> dict[str, os.stat_result]:
+        stats = {}
+        for directory, _, filenames in os.walk(os.path.join(self.root, self.asset_dir)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                stats[os.path.relpath(path, self.root).replace(os.sep, "/")] = os.stat(path)
+        return stats
+
+    def build(self):
+        stats = self._scan()
+        signature = hashlib.sha256(repr(sorted((path, stat.st_size, stat.st_mtime)
+                                               for path, stat in stats.items())).encode()).hexdigest()
+        if signature == self._signature:
+            return
+        files = {}
+        directories = {}
+        for path, stat in stats.items():
+            previous = self.files.get(path)
+            if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                files[path] = previous
+            else:
+                full_path = os.path.join(self.root, path)
+                files[path] = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "sha256": hash_file(full_path),
+                    "mime": mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    "duration": audio_duration(full_path) if path.lower().endswith(audio_extensions) else None,
+                }
+            directory = path.rsplit("/", 1)[0]
+            directories.setdefault(directory, {"file_count": 0})["file_count"] += 1
+        body = json.dumps({"files": files, "directories": directories}, sort_keys=True).encode()
+        with self._lock:
+            self.files, self.directories, self.body = files, directories, body
+            self.etag = hashlib.sha256(body).hexdigest()
+            self._signature = signature
+        self.ready.set()
+        print(f"Asset manifest built ({len(files)} files)")
+
+    def _watch(self):
+        while True:
+            try:
+                self.build()
+                for cached_file in list(self.cached_files.values()):
+                    cached_file.refresh()
+            except Exception as e:
+                print(f"Could not refresh asset manifest: {e}")
+            time.sleep(MANIFEST_POLL_INTERVAL)
+
+    def start(self):
+        '''
+        Builds the manifest and keeps it fresh on a background thread (only once per process)
+        '''
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._watch, name="asset-manifest", daemon=True).start()
+
+    def lookup(self, path: str) -> dict | None:
+        return self.files.get(path)
+
+    def file_count(self, path: str) -> int | None:
+        entry = self.directories.get(path.rstrip("/"))
+        return entry["file_count"] if entry else None
+
+
+class CachedFile:
+    '''
+    A small file kept in memory along with a strong ETag, reloaded when its mtime changes
+    '''
+
+    def __init__(self, path: str, mimetype: str):
+        self.path = path
+        self.mimetype = mimetype
+        self.mtime = None
+        self.body = b""
+        self.etag = None
+        self.refresh()
+
+    def refresh(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        with open(self.path, "rb") as f:
+            body = f.read()
+        self.body, self.etag, self.mtime = body, hashlib.sha256(body).hexdigest(), mtime
+
+
+# shared by every request in this process
+asset_manifest = AssetManifest()
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.lazy_import import lazy_module
+
+pydub = lazy_module("pydub")
+
+# decoded clips are kept as raw PCM, so a 1 s stereo 44.1 kHz clip costs ~176 KB
+DEFAULT_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def is_static_url(url: str) -> bool:
+    '''
+    Returns whether a url points at one of our bundled assets (these never change, so the url is a stable key)
+    '''
+    return "/file/get_asset/assets/" in url
+
+
+def hash_file(path: str) -> str:
+    '''
+    Returns the sha256 hex digest of a file, read in chunks
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioClipCache:
+    '''
+    Process-wide LRU cache of decoded audio clips with a byte budget
+
+    Static clips (from our assets folder) are keyed by url and are only evicted once every
+    session clip is gone, so they stay warm across renders. Session uploads are keyed by the
+    hash of their contents, so the same upload in two sessions is only decoded once.
+    '''
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key => (clip, size in bytes, static)
+        self._entries: OrderedDict[str, tuple["pydub.AudioSegment", int, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> "pydub.AudioSegment | None":
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            # marking the entry as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def has_url(self, url: str) -> bool:
+        '''
+        Returns whether a static url is already decoded, without touching the hit/miss counters
+        '''
+        with self._lock:
+            return is_static_url(url) and ("url:" + url) in self._entries
+
+    def put(self, key: str, clip: "pydub.AudioSegment", static: bool = False):
+        size = len(clip.raw_data)
+        if size > self.max_bytes:
+            # a single clip bigger than the whole budget is never worth keeping
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (clip, size, static)
+            self.current_bytes += size
+            self._evict()
+
+    def _evict(self):
+        '''
+        Drops least recently used entries until we are under budget, session clips first
+        '''
+        for evict_static in (False, True):
+            if self.current_bytes <= self.max_bytes:
+                return
+            for key in [k for k, entry in self._entries.items() if entry[2] == evict_static]:
+                self.current_bytes -= self._entries.pop(key)[1]
+                self.evictions += 1
+                if self.current_bytes <= self.max_bytes:
+                    return
+
+    def get_clip(self, url: str, path: str | None, fetch=None) -> "pydub.AudioSegment | None":
+        '''
+        Returns the decoded clip for a url, downloading it to path with fetch(url, path) only if needed
+
+        Returns None if the clip is not cached and there is no file to decode it from
+        '''
+        static = is_static_url(url)
+        if static:
+            key = "url:" + url
+            clip = self.get(key)
+            if clip is not None:
+                return clip
+        if path is None:
+            return None
+        if fetch is not None:
+            fetch(url, path)
+        if not static:
+            # session uploads can change under the same url, so we key them by content
+            key = "sha256:" + hash_file(path)
+            clip = self.get(key)
+            if clip is not None:
+                return clip
+        clip = pydub.AudioSegment.from_file(path)
+        self.put(key, clip, static)
+        return clip
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+# shared by every render in this process
+audio_cache = AudioClipCache()
@@ -0,0 +1,100 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+from utils.lazy_import import lazy_module
+
+requests = lazy_module("requests")
+
+# how many downloads we run at once for a single timeline
+MAX_WORKERS = int(os.environ.get("AUDIO_PREFETCH_WORKERS", 8))
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 30
+# urls served by our own send_asset route, which we can read straight from disk
+ASSET_ROUTE = "/file/get_asset/"
+# our ROOT directory, relative to the backend directory we run from
+ROOT_DIR = "../"
+
+_session: "requests.Session | None" = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> "requests.Session":
+    '''
+    Returns the keep-alive session shared by every prefetch in this process
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def resolve_local_path(url: str) -> str | None:
+    '''
+    Returns the file behind a /file/get_asset/ url if it exists on this machine
+    '''
+    route_path = urlparse(url).path
+    if ASSET_ROUTE not in route_path:
+        return None
+    relative_path = unquote(route_path.split(ASSET_ROUTE, 1)[1])
+    root = os.path.abspath(ROOT_DIR)
+    path = os.path.abspath(os.path.join(root, relative_path))
+    # never read outside of our ROOT directory
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def download_file(url: str, path: str) -> int:
+    '''
+    Streams a file to disk in chunks and returns the number of bytes written
+    '''
+    query_params = {"downloadformat": "mp3"}
+    written = 0
+    with get_http_session().get(url, params=query_params, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        with open(path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+                written += len(chunk)
+    return written
+
+
+def fetch(url: str, path: str) -> dict:
+    '''
+    Makes a url available at a local path, returning where it ended up and how long it took
+    '''
+    start_time = time.time()
+    result = {"url": url, "path": None, "source": None, "bytes": 0, "time": 0.0, "error": None}
+    try:
+        local_path = resolve_local_path(url)
+        if local_path is not None:
+            result.update(path=local_path, source="local", bytes=os.path.getsize(local_path))
+        else:
+            result.update(path=path, source="http", bytes=download_file(url, path))
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"Failed to fetch audio {url}: {e}")
+    result["time"] = time.time() - start_time
+    return result
+
+
+def prefetch_audio(urls: list[str], audio_dir: str) -> tuple[dict[str, str], list[dict]]:
+    '''
+    Fetches every distinct url in parallel
+
+    Returns a map of url => local path for the urls that succeeded, and a report for every url
+    '''
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}, []
+    targets = [os.path.join(audio_dir, f"sound_{index}") for index in range(len(unique_urls))]
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(unique_urls))) as executor:
+        report = list(executor.map(fetch, unique_urls, targets))
+    paths = {result["url"]: result["path"] for result in report if result["error"] is None}
+    return paths, report
@@ -0,0 +1,134 @@
+import os
+import re
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import threading
+
+# content-addressed storage for uploaded assets, relative to the backend directory
+BLOB_DIR = os.environ.get("BLOB_DIR", "../blobs")
+# blobs no session links to are kept this long, so a re-upload tomorrow still skips the body
+UNUSED_BLOB_TTL = int(os.environ.get("UNUSED_BLOB_TTL", 7 * 24 * 60 * 60))
+# how often (at most) we look for unused blobs
+GC_INTERVAL = 60 * 60
+
+sha256_pattern = re.compile(r"^[0-9a-f]{64}$")
+_last_gc = 0.0
+_gc_lock = threading.Lock()
+
+
+def is_sha256(value: str) -> bool:
+    return bool(sha256_pattern.match(value))
+
+
+def blob_path(sha256: str) -> str:
+    '''
+    Blobs are fanned out over 256 directories by the first byte of their hash
+    '''
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+def has_blob(sha256: str) -> bool:
+    return is_sha256(sha256) and os.path.isfile(blob_path(sha256))
+
+
+def temp_path(suffix: str = "") -> str:
+    '''
+    A new path inside the store to write a file to before it is hashed and stored (see store_file)
+    '''
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    return os.path.join(BLOB_DIR, f".tmp-{uuid.uuid4().hex}{suffix}")
+
+
+def store_stream(stream, chunk_size: int = 1024 * 1024) -> str:
+    '''
+    Stores a file-like object chunk by chunk, hashing it as it is written, and returns the hash
+    The whole body is never held in memory
+    '''
+    path = temp_path()
+    digest = hashlib.sha256()
+    try:
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return store_file(path, digest.hexdigest())
+
+
+def store_file(path: str, sha256: str) -> str:
+    '''
+    Moves an already hashed file into the store (or drops it if we already have it) and returns the hash
+    '''
+    if has_blob(sha256):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(blob_path(sha256)), exist_ok=True)
+        os.replace(path, blob_path(sha256))
+    return sha256
+
+
+def link_blob(sha256: str, path: str):
+    '''
+    Places a blob at path as a hard link, so the session copy costs no extra disk
+
+    The blob's link count doubles as its reference count. Files in session directories are
+    never modified in place, only replaced, so sharing the inode is safe. If the session
+    directory lives on a different filesystem we fall back to a copy.
+    '''
+    source = blob_path(sha256)
+    if os.path.lexists(path):
+        os.remove(path)
+    try:
+        os.link(source, path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copyfile(source, path)
+    # marking the blob as recently used so garbage collection keeps it around
+    os.utime(source)
+
+
+def reference_count(sha256: str) -> int:
+    '''
+    Number of session files that currently link to a blob
+    '''
+    return os.stat(blob_path(sha256)).st_nlink - 1
+
+
+def collect_garbage(max_age: int = UNUSED_BLOB_TTL) -> int:
+    '''
+    Deletes blobs that no session links to and that have not been used for max_age seconds
+    '''
+    removed = 0
+    now = time.time()
+    if not os.path.isdir(BLOB_DIR):
+        return removed
+    for prefix in os.listdir(BLOB_DIR):
+        prefix_dir = os.path.join(BLOB_DIR, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            if not is_sha256(name):
+                continue
+            path = os.path.join(prefix_dir, name)
+            if reference_count(name) == 0 and now - os.stat(path).st_mtime > max_age:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def maybe_collect_garbage():
+    '''
+    Runs garbage collection in the background if it has not run for a while
+    '''
+    global _last_gc
+    with _gc_lock:
+        if time.time() - _last_gc < GC_INTERVAL:
+            return
+        _last_gc = time.time()
+    threading.Thread(target=collect_garbage, daemon=True).start()
@@ -1,16 +1,26 @@
 import os
 from dotenv import load_dotenv, dotenv_values
-from flask import Blueprint, Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
-import requests
 import json
-from supabase import create_client, Client
-from utils.gif_utils import extract_frames, get_fps, create_directory
+from utils.lazy_import import lazy_module
+from utils.asset_manifest import asset_manifest, CachedFile
+from utils.audio_cache import hash_file
+from utils.sequence_pack import ensure_packed, pack_src, remove_packs, PACK_DIR
+from utils.blob_store import store_stream, store_file, link_blob, has_blob, maybe_collect_garbage, blob_path, temp_path
+from utils.asset_jobs import submit_job, get_job
+from utils.metrics import instrument_blueprint
 import time
 import shutil
 
+# gif processing (PIL) and ffmpeg are only loaded once an upload needs them
+gif_utils = lazy_module("utils.gif_utils")
+ffmpeg = lazy_module("ffmpeg")
+
 
 file_bp = Blueprint("file_bp", __name__)
+# timing every /file request (see /metrics)
+instrument_blueprint(file_bp)
 
 
 # maps file extensions to the appropriate http header
@@ -21,6 +31,41 @@ content_map = {
     "png": "image/png",
     "gif": "image/gif"
 }
+# audio we accept but transcode to mp3 first (in the background)
+transcoded_audio = {"wav", "ogg", "m4a", "flac", "aac"}
+
+# the folders (relative to ROOT) /file/get_asset/ serves from, the rest of ROOT is the backend itself and its
+# state (outbox and progress databases, upload states, the blob store), which must never be sent to a client
+served_folders = ("assets", "videos", os.path.relpath(os.path.abspath(PACK_DIR), os.path.abspath("../")))
+
+
+# our json configs, served from memory (the asset manifest's watcher reloads them when they change)
+asset_manifest.cached_files.update({
+    "animation_configs": CachedFile("animation-configs.json", "application/json"),
+    "element_map": CachedFile("element-map.json", "application/json"),
+})
+
+
+def create_directory(path):
+    '''
+    create directory if it does not exist
+    '''
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            print(e)
+
+
+def cached_response(body: bytes, etag: str, mimetype: str):
+    '''
+    Responds with a body we already have in memory, or with 304 if the client's copy is current
+    '''
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    # the client revalidates every time, which costs nothing but a 304 when nothing changed
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 def get_file_extension(filename):
@@ -28,17 +73,43 @@ def get_file_extension(filename):
     return filename.split(".")[1]
 
 
-@file_bp.route("/file/upload_file", methods=["POST"])
-def upload_asset():
-    start_time = time.time()
-    # receiving file and filename from client
-    # look up flask.Request in docs for other info
-    file = request.files['file']
-    filename = request.form["filename"]
-    userID, sessionID = request.form["userID"], request.form["sessionID"]
-    bytes = file.read()
-    print("Asset received from the frontend")
+def extract_gif_job(report, sha256: str, output_folder: str) -> dict:
+    '''
+    Background job: extracts a stored gif's frames into a session's sequence directory
+    '''
+    gif_info = gif_utils.extract_gif(blob_path(sha256), sha256, output_folder,
+                           on_frame=lambda done, total: report(100 * done / total if total else 0, frames=done))
+    # removing the ../ prefix
+    return {"src": output_folder[3:], "gif_frame_count": gif_info["frame_count"], "gif_fps": gif_info["fps"],
+            "content-type": content_map["gif"]}
 
+
+def transcode_audio_job(report, sha256: str, file_path: str) -> dict:
+    '''
+    Background job: transcodes a stored audio file to mp3 in a session's sound directory
+    '''
+    # the mp3 is stored as a blob of its own and linked in like any other upload: file_path may already
+    # be a link to a blob (an earlier upload of the same name), which must never be written to
+    mp3_path = temp_path(".mp3")
+    try:
+        ffmpeg.input(blob_path(sha256)) \
+            .output(mp3_path, acodec="libmp3lame", audio_bitrate="192k", loglevel="quiet") \
+            .overwrite_output() \
+            .run()
+    except BaseException:
+        if os.path.exists(mp3_path):
+            os.remove(mp3_path)
+        raise
+    link_blob(store_file(mp3_path, hash_file(mp3_path)), file_path)
+    return {"src": file_path[3:], "content-type": content_map["mp3"]}
+
+
+def place_asset(sha256: str, filename: str, userID: str, sessionID: str):
+    '''
+    Puts a stored blob into a session's asset directory and returns the response for the client
+    Files that need processing (gifs, non-mp3 audio) are handed to a background job, and the
+    client gets its job id (202) to follow on /file/job/<job_id>
+    '''
     # directories
     video_dir = "../videos"
     user_dir = os.path.join(video_dir, userID)
@@ -51,39 +122,80 @@ def upload_asset():
 
     # placing the file depending on what the extension is
     extension = get_file_extension(filename)
+    name = filename.split(".")[0]
 
     match extension:
         case "mp3":
             file_path = os.path.join(sound_dir, filename)
-        case "jpeg":
-            file_path = os.path.join(image_dir, filename)
-        case "jpg":
-            file_path = os.path.join(image_dir, filename)
-
-        case "png":
+        case "jpeg" | "jpg" | "png":
             file_path = os.path.join(image_dir, filename)
         case "gif":
             # extract the frames and put them in our sequence directory
-            output_folder = os.path.join(sequence_dir, filename.split(".")[0])
-            gif_info = extract_frames(bytes, filename, output_folder)
+            job_id = submit_job(extract_gif_job, sha256, os.path.join(sequence_dir, name))
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+        case _ if extension in transcoded_audio:
+            job_id = submit_job(transcode_audio_job, sha256, os.path.join(sound_dir, name + ".mp3"))
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+        case _:
+            return jsonify({"message": f"unsupported file type: {extension}"}), 400
+
+    # link the stored file into the appropriate place in the asset directory
+    try:
+        link_blob(sha256, file_path)
+        # we return the file path relative to the ROOT directory, not backend now
+        # ../videos/user/session/assets => videos/user/session/assets
+        file_path = file_path[3:]
+        return jsonify({"src": file_path, "content-type": content_map[extension]}), 200
+    except Exception as e:
+        print(e)
+        return jsonify({"message": "could not upload file"}), 400
+
+
+@file_bp.route("/file/upload_file", methods=["POST"])
+def upload_asset():
+    start_time = time.time()
+    # receiving file and filename from client
+    # look up flask.Request in docs for other info
+    file = request.files['file']
+    filename = request.form["filename"]
+    userID, sessionID = request.form["userID"], request.form["sessionID"]
+    # every upload is stored once by content (written and hashed in chunks), sessions only get links to it
+    sha256 = store_stream(file.stream)
+    print("Asset received from the frontend")
+    return place_asset(sha256, filename, userID, sessionID)
+
+
+@file_bp.route("/file/has_asset/<sha256>", methods=["GET"])
+def has_asset(sha256):
+    '''
+    Lets the client check whether we already have a file (by its sha256) before uploading it
+    '''
+    return jsonify({"exists": has_blob(sha256.lower())}), 200
+
+
+@file_bp.route("/file/link_asset", methods=["POST"])
+def link_asset():
+    '''
+    Adds a file we already have to a session without uploading it again
+    Responds like /file/upload_file, or with 404 if the client has to upload the file after all
+    '''
+    data = request.get_json()
+    sha256 = str(data["sha256"]).lower()
+    if not has_blob(sha256):
+        return jsonify({"message": "unknown file, upload it instead"}), 404
+    return place_asset(sha256, data["filename"], data["userID"], data["sessionID"])
+
+
+@file_bp.route("/file/job/<job_id>", methods=["GET"])
+def asset_job(job_id):
+    '''
+    Returns the status of an asset's background processing (and its result once it is done)
+    '''
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"message": "unknown job"}), 404
+    return jsonify(job), 200
 
-    if extension != "gif":
-        # just write the bytes to the appropriate place in the asset directory
-        try:
-            with open(file_path, "wb") as f:
-                f.write(bytes)
-                # we return the file path relative to the ROOT directory, not backend now
-                # ../videos/user/session/assets => videos/user/session/assets
-                file_path = file_path[3:]
-            return jsonify({"src": file_path, "content-type": content_map[extension]}), 200
-        except Exception as e:
-            print(e)
-            return jsonify({"message": "could not upload file"}), 400
-    else:
-        # file writing has already been done, so we just return the gif info
-        # removing the ../ prefix
-        output_folder = output_folder[3:]
-        return jsonify({"src": output_folder, "gif_frame_count": gif_info["frame_count"], "gif_fps": gif_info["fps"], "content-type": content_map[extension]})
 
 # downloads a gif from a url, creates a directory for the frames in the user's video assets dir
 # then dumps all the frames into that directory
@@ -99,6 +211,10 @@ def get_note_count(file_path):
     '''
     Returns the number of note files in a given folder
     '''
+    # our bundled folders are counted in the asset manifest already
+    note_count = asset_manifest.file_count(file_path)
+    if note_count is not None:
+        return jsonify({"note_count": note_count}), 200
     try:
         path = os.path.join("../", file_path)
         note_count = len(os.listdir(path))
@@ -107,12 +223,49 @@ def get_note_count(file_path):
         return jsonify({"message": "could not count files"}), 400
 
 
+@file_bp.route("/file/get_sequence/<path:folder_path>")
+def get_sequence(folder_path):
+    '''
+    Returns the index of a packed frame sequence (frame count, fps, byte offset and length of every frame)
+    The pack itself ("src") is served by /file/get_asset/ and supports range requests
+    '''
+    root = os.path.abspath("../")
+    folder = os.path.abspath(os.path.join(root, folder_path))
+    if os.path.commonpath([root, folder]) != root or not os.path.isdir(folder):
+        return jsonify({"message": "sequence does not exist"}), 404
+    fps = request.args.get("fps", type=int)
+    try:
+        index = ensure_packed(folder, fps)
+    except Exception as e:
+        print(e)
+        return jsonify({"message": "could not pack sequence"}), 400
+    return jsonify({
+        "src": pack_src(folder),
+        "frame_count": index["frame_count"],
+        "fps": index["fps"] if index["fps"] is not None else fps,
+        "bytes": index["bytes"],
+        "frames": index["frames"],
+    }), 200
+
+
 @file_bp.route("/file/get_asset/<path:file_path>")
 def send_asset(file_path):
     '''
     Serves file relative to our ROOT directory
     If the file comes from ../assets and not ../videos, we cache it, since it will never change
     '''
+    if not any(os.path.normpath(file_path).startswith(folder + os.sep) for folder in served_folders):
+        return jsonify({"message": "asset does not exist"}), 404
+
+    if file_path.startswith("assets") and asset_manifest.ready.is_set():
+        # static assets are looked up in the manifest, so unknown paths never touch the filesystem
+        entry = asset_manifest.lookup(file_path)
+        if entry is None:
+            return jsonify({"message": "asset does not exist"}), 404
+        # caching the response since our static assets will not change
+        return send_file(os.path.join("../", file_path), mimetype=entry["mime"], etag=entry["sha256"],
+                         last_modified=entry["mtime"], max_age=31536000, conditional=True)
+
     response = send_from_directory("../", file_path)
     if file_path.startswith("assets"):
         # caching the response since our static assets will not change
@@ -121,17 +274,26 @@ def send_asset(file_path):
     return response
 
 
+@file_bp.route("/file/asset_manifest", methods=["GET"])
+def get_asset_manifest():
+    '''
+    Returns the size, hash, mime type and duration of every static asset, and the file count of every asset folder
+    '''
+    if not asset_manifest.ready.wait(timeout=30):
+        return jsonify({"message": "asset manifest is still being built"}), 503
+    return cached_response(asset_manifest.body, asset_manifest.etag, "application/json")
+
+
 @file_bp.route("/file/animation_configs", methods=["GET"])
 def read_defaults():
-    response = send_from_directory("./", "animation-configs.json")
-    return response
+    config = asset_manifest.cached_files["animation_configs"]
+    return cached_response(config.body, config.etag, config.mimetype)
 
 
 @file_bp.route("/file/element_map", methods=["GET"])
 def read_elements():
-    response = send_from_directory("./", "element-map.json")
-
-    return response
+    element_map = asset_manifest.cached_files["element_map"]
+    return cached_response(element_map.body, element_map.etag, element_map.mimetype)
 
 
 @file_bp.route("/file/setup_directories", methods=["POST"])
@@ -182,7 +344,11 @@ def clear_session_directory():
     session_dir = os.path.join(user_dir, sessionID)
     try:
         if (os.path.isdir(session_dir)):
+            # this also removes the session's render cache (sessionDir/render_cache)
             shutil.rmtree(session_dir)
+            remove_packs(session_dir)
+            # blobs only this session used can now be cleaned up (once they have been unused for a while)
+            maybe_collect_garbage()
             return jsonify({"message": f"successfully removed {session_dir}"}), 200
         else:
             return jsonify({"message": f"{session_dir} does not exist"}), 200
@@ -0,0 +1,114 @@
+import os
+import json
+import uuid
+import errno
+import shutil
+import threading
+
+# processed gif frame sequences, relative to the backend directory
+GIF_CACHE_DIR = os.environ.get("GIF_CACHE_DIR", "../cache/gif_sequences")
+GIF_CACHE_MAX_BYTES = int(os.environ.get("GIF_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+META_FILE = "meta.json"
+
+
+class GifSequenceCache:
+    '''
+    Extracted gif frame sequences on disk, keyed by content hash and processing settings (scale, colors, palette)
+
+    Each entry is a folder holding the compressed frames and a meta.json with the frame count
+    and fps, so a hit costs one small read. The meta file's mtime is the entry's last use, and
+    the least recently used entries are evicted once the cache grows past max_bytes.
+    '''
+
+    def __init__(self, cache_dir: str = GIF_CACHE_DIR, max_bytes: int = GIF_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, sha256: str, settings: tuple) -> str:
+        return "-".join([sha256, *map(str, settings)])
+
+    def lookup(self, sha256: str, settings: tuple) -> dict | None:
+        '''
+        Returns {"folder", "frame_count", "fps"} for a processed gif (by its sha256), or None if we have not processed it
+        '''
+        folder = os.path.join(self.cache_dir, self.key(sha256, settings))
+        meta_path = os.path.join(folder, META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # marking the entry as recently used
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"folder": folder, **meta}
+
+    def add(self, sha256: str, settings: tuple, process) -> dict:
+        '''
+        Runs process(folder) to fill a new entry, which returns {"frame_count", "fps"}, and stores the result
+        '''
+        folder = os.path.join(self.cache_dir, self.key(sha256, settings))
+        # processing into a temporary folder first, so a half-written entry is never visible
+        temp_folder = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        try:
+            info = process(temp_folder)
+            meta = {"frame_count": info["frame_count"], "fps": info["fps"]}
+            with open(os.path.join(temp_folder, META_FILE), "w") as f:
+                json.dump(meta, f)
+            try:
+                os.rename(temp_folder, folder)
+            except OSError as e:
+                # someone else processed the same gif at the same time, we just use theirs
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        self.evict()
+        return {"folder": folder, **meta}
+
+    def link_frames(self, entry: dict, output_folder: str):
+        '''
+        Hard links the frames of a cached entry into a session folder (copying them if we cannot link)
+        '''
+        os.makedirs(output_folder, exist_ok=True)
+        for name in os.listdir(entry["folder"]):
+            if name == META_FILE:
+                continue
+            source = os.path.join(entry["folder"], name)
+            target = os.path.join(output_folder, name)
+            if os.path.lexists(target):
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits in max_bytes
+        '''
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                folder = os.path.join(self.cache_dir, name)
+                meta_path = os.path.join(folder, META_FILE)
+                if name.startswith(".") or not os.path.isfile(meta_path):
+                    continue
+                size = sum(entry.stat().st_size for entry in os.scandir(folder))
+                entries.append((os.path.getmtime(meta_path), size, folder))
+                total += size
+            for _, size, folder in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # session folders hold their own links, so removing the entry never breaks them
+                shutil.rmtree(folder, ignore_errors=True)
+                total -= size
+
+
+# shared by every upload in this process
+gif_cache = GifSequenceCache()
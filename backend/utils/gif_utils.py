@@ -1,92 +1,161 @@
 import ffmpeg
 import os
-from pydub import AudioSegment
-import requests
 from PIL import Image  # Importing PIL for image processing
 import shutil
-
-
-def create_directory(path):
-    '''
-    create directory if it does not exist
-    '''
-    if not os.path.exists(path):
-        try:
-            os.makedirs(path, exist_ok=True)
-        except OSError as e:
-            print(e)
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.gif_cache import gif_cache
+from utils.sequence_pack import pack_sequence
 
 
 def download_gif(url: str, user: str):
     pass
 
 
-def get_fps(bytes) -> int:
-    path = "file"
-    with open(path, "wb") as f:
-        f.write(bytes)
+# how many processes quantize frames at once
+GIF_WORKERS = int(os.environ.get("GIF_WORKERS", os.cpu_count() or 1))
+# "web" matches Pillow's default convert("P"), "adaptive" builds a palette per frame,
+# "shared" builds one palette from the first frame and reuses it for every frame (no palette flicker)
+GIF_PALETTE = os.environ.get("GIF_PALETTE", "web")
+GIF_COLORS = int(os.environ.get("GIF_COLORS", 256))
+
+# the frame compression pools (by worker count), shared by every gif instead of starting processes for each one
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    '''
+    Returns the process pool that compresses gif frames, started on first use
+
+    Its processes come from a forkserver (or are spawned where there is none) rather than being forked
+    from this process, since a fork would copy the threads of the render workers and uploads mid-flight.
+    '''
+    with _pools_lock:
+        if workers not in _pools:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _pools[workers]
+
+
+def probe_gif(path: str) -> dict:
+    '''
+    Returns the fps, size and frame count of a gif that is already on disk, with a single ffprobe pass
+    '''
     # Run ffmpeg to retrieve the metadata of the video
-    probe = ffmpeg.probe(path, v='error', select_streams='v:0',
-                         show_entries='stream=r_frame_rate')
+    # (counting packets reads the file without decoding it, and a gif has one packet per frame)
+    probe = ffmpeg.probe(path, v='error', select_streams='v:0', count_packets=None,
+                         show_entries='stream=r_frame_rate,width,height,nb_read_packets')
 
     # Extract the frame rate from the probe result
-    fps = probe['streams'][0]['r_frame_rate']
-    num, denom = map(int, fps.split('/'))
-    os.remove(path)
-    return int(num / denom)
-
-
-def compress_png(input_file, output_file, quality=80):
-    """
-    Compress a PNG image using Pillow.
-    - Convert the image to a palette-based format with 256 colors.
-    - Optimize the image to reduce the file size.
-    """
-    img = Image.open(input_file)
-    img = img.convert("P", colors=256)  # Convert to 256-color palette
-    img.save(output_file, optimize=True)  # Save optimized PNG
-
-
-def compress_images(output_folder):
-    """
-    Compress all PNG files in the 'output_folder' directory using the compress_png function.
-    """
-    for filename in os.listdir(output_folder):
-        if filename.endswith(".png"):
-            try:
-                input_path = os.path.join(output_folder, filename)
-                output_path = os.path.join(output_folder, f"frame{filename}")
-                compress_png(input_path, output_path)
-                # Optionally remove the original uncompressed image
-                os.remove(input_path)
-            except Exception as e:
-                print(e)
+    stream = probe['streams'][0]
+    num, denom = map(int, stream['r_frame_rate'].split('/'))
+    return {"fps": int(num / denom), "width": int(stream['width']), "height": int(stream['height']),
+            "frame_count": int(stream.get('nb_read_packets', 0))}
 
 
-# returns frame path, frame count, and fps
-def extract_frames(bytes, filename, output_folder):
-    with open(filename, "wb") as f:
-        f.write(bytes)
-    os.makedirs(output_folder, exist_ok=True)
+def quantize_frame(img: Image.Image, palette: str, colors: int, palette_image: Image.Image | None = None) -> Image.Image:
+    '''
+    Converts a frame to a palette-based image with the given quantization settings
+    '''
+    match palette:
+        case "adaptive":
+            return img.convert("RGB").quantize(colors=colors)
+        case "shared":
+            return img.convert("RGB").quantize(palette=palette_image)
+        case _:
+            return img.convert("P", colors=colors)  # Convert to a 256-color web palette
+
+
+def compress_frame(job):
+    '''
+    Quantizes one raw RGBA frame and writes it as an optimized PNG (runs in a worker process)
+    '''
+    raw, size, output_path, palette, colors, palette_bytes = job
+    img = Image.frombytes("RGBA", size, raw)
+    palette_image = None
+    if palette_bytes is not None:
+        palette_image = Image.new("P", (1, 1))
+        palette_image.putpalette(palette_bytes)
+    quantize_frame(img, palette, colors, palette_image).save(output_path, optimize=True)
+
 
-    # Use FFmpeg to extract frames as PNG images (still images, not video)
-    ffmpeg.input(filename).output(
-        f'{output_folder}/%04d.png',
-        # Scale the frames to width 720 (height auto-calculated)
-        vf="scale=720:-1", loglevel="quiet"
-    ).run()
-
-    # Compress PNGs using PIL after extraction
-    compress_images(output_folder)
-    # Remove the video file from the filesystem after we are done
-    os.remove(filename)
-    # be sure to return the fps of the
+def process_gif(path, output_folder, scale=720, colors=GIF_COLORS, palette=GIF_PALETTE, workers=GIF_WORKERS,
+                on_frame=None):
+    '''
+    Extracts and compresses the frames of a gif file into output_folder
+
+    ffmpeg decodes the (scaled) frames to raw RGBA on its stdout, and a process pool quantizes
+    them straight from memory, so each frame is written to disk once, already compressed
+    on_frame(frame_count, total_frames) is called as every frame is decoded (total_frames is what ffprobe
+    counted, 0 if it could not), and ffmpeg.Error is raised if it fails
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    # fps and size of our gif
+    info = probe_gif(path)
+    # Scale the frames to the given width (height follows the aspect ratio)
+    width, height = scale, max(1, round(info["height"] * scale / info["width"]))
+    frame_size = width * height * 4
+
+    process = ffmpeg.input(path).output(
+        "pipe:", format="rawvideo", pix_fmt="rgba", vf=f"scale={width}:{height}", loglevel="error"
+    ).run_async(pipe_stdout=True, pipe_stderr=True)
+
+    frame_count = 0
+    palette_bytes = None
+    executor = get_pool(workers)
+    pending = []
+    try:
+        while True:
+            raw = process.stdout.read(frame_size)
+            if len(raw) < frame_size:
+                break
+            frame_count += 1
+            if palette == "shared" and palette_bytes is None:
+                # the first frame decides the palette of the whole sequence
+                first = Image.frombytes("RGBA", (width, height), raw).convert("RGB")
+                palette_bytes = first.quantize(colors=colors).getpalette()
+            output_path = os.path.join(output_folder, f"frame{frame_count:04d}.png")
+            pending.append(executor.submit(
+                compress_frame, (raw, (width, height), output_path, palette, colors, palette_bytes)))
+            # only keeping a few frames in flight, so a long gif never sits in memory all at once
+            if len(pending) >= workers * 2:
+                pending.pop(0).result()
+            if on_frame is not None:
+                on_frame(frame_count, info["frame_count"])
+        for future in pending:
+            future.result()
+    except Exception:
+        # a frame could not be compressed, so the rest of the gif is not needed
+        process.kill()
+        process.wait()
+        raise
+    # stderr only has errors in it (loglevel error), so it is small enough to read once ffmpeg is done
+    err = process.stderr.read()
+    if process.wait() != 0:
+        # raising discards the half-filled folder (see GifSequenceCache.add)
+        raise ffmpeg.Error("ffmpeg", b"", err)
     print("Frames extracted and compressed successfully!")
-    # number of frames we extracted
 
-    frame_count = len(os.listdir(output_folder))
+    # number of frames we extracted (counted once here, cached along with the frames)
+    return {"fps": info["fps"], "frame_count": frame_count}
 
-    # fps of our gif
-    frames_per_second = get_fps(bytes)
 
-    return {"output_folder": output_folder, "frame_count": frame_count, "fps": frames_per_second}
+# returns frame path, frame count, and fps
+def extract_gif(path, sha256, output_folder, scale=720, colors=GIF_COLORS, palette=GIF_PALETTE, on_frame=None):
+    '''
+    Extracts the frames of a gif that is already on disk (e.g. in the blob store), whose sha256 we know
+    '''
+    # processed sequences are shared by everyone who uploads the same gif
+    settings = (scale, colors, palette)
+    cached = gif_cache.lookup(sha256, settings)
+    if cached is None:
+        cached = gif_cache.add(sha256, settings,
+                               lambda folder: process_gif(path, folder, scale, colors, palette, on_frame=on_frame))
+
+    # the session gets links to the cached frames
+    gif_cache.link_frames(cached, output_folder)
+    # and a packed copy, so the client can load the whole sequence at once
+    pack_sequence(output_folder, cached["fps"])
+    return {"output_folder": output_folder, "frame_count": cached["frame_count"], "fps": cached["fps"]}
@@ -0,0 +1,33 @@
+import sys
+import types
+import importlib
+import threading
+
+
+class LazyModule(types.ModuleType):
+    '''
+    Stands in for a module until one of its attributes is first used, then imports it
+
+        ffmpeg = lazy_module("ffmpeg")   # nothing is imported yet
+        ffmpeg.input(...)                # ffmpeg is imported here, once per process
+    '''
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+
+    def __getattr__(self, attribute: str):
+        # only called for attributes we do not have yet, so once loaded this is never reached again
+        with self._lazy_lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    '''
+    The module itself if it was already imported, otherwise a LazyModule that imports it on first use
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,253 @@
+'''
+Lightweight in-process metrics, exposed in the Prometheus text format on /metrics
+
+    metrics.inc("motionlab_renders_total")                      counter
+    metrics.set("motionlab_some_gauge", 3)                      gauge
+    metrics.observe("motionlab_stage_seconds", 1.2, stage=...)  summary (p50/p95/p99 over recent samples)
+    metrics.register("motionlab_queue_depth", "gauge", fn)      read from fn() whenever /metrics is scraped
+
+    with measure_stage("combine_frames"): ...                    wall time, cpu time and io bytes of a stage
+    @measure_stage("generate_audio")                            same, as a decorator
+    with cprofile_dump(path): ...                               cProfile stats of a block (pstats format)
+'''
+import os
+import time
+import resource
+import threading
+import functools
+import cProfile
+from collections import deque
+from flask import Blueprint, Response, request, g
+
+# how many recent samples each summary keeps to compute its quantiles
+SUMMARY_SAMPLES = int(os.environ.get("METRICS_SUMMARY_SAMPLES", 1024))
+QUANTILES = (0.5, 0.95, 0.99)
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def quantile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    '''
+    Counters, gauges and summaries keyed by name and labels, safe to update from any thread
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        # name => labels => [recent samples, sum, count]
+        self._summaries: dict[str, dict[tuple, list]] = {}
+        # name => (type, fn) read when the metrics are rendered
+        self._callbacks: dict[str, tuple[str, callable]] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            summary = series.setdefault(label_key(labels), [deque(maxlen=SUMMARY_SAMPLES), 0.0, 0])
+            summary[0].append(value)
+            summary[1] += value
+            summary[2] += 1
+
+    def register(self, name: str, kind: str, fn, help_text: str | None = None):
+        '''
+        Adds a metric whose value is read from fn() on every scrape
+        fn returns a number, or a list of (labels dict, number) pairs
+        '''
+        self._callbacks[name] = (kind, fn)
+        if help_text:
+            self.describe(name, help_text)
+
+    def summary(self, name: str, **labels) -> dict | None:
+        with self._lock:
+            summary = self._summaries.get(name, {}).get(label_key(labels))
+            if summary is None:
+                return None
+            ordered = sorted(summary[0])
+            return {**{f"p{int(q * 100)}": quantile(ordered, q) for q in QUANTILES},
+                    "sum": summary[1], "count": summary[2]}
+
+    def _header(self, lines: list[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in sorted(self._gauges.items()):
+                self._header(lines, name, "gauge")
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in sorted(self._summaries.items()):
+                self._header(lines, name, "summary")
+                for labels, (samples, total, count) in series.items():
+                    ordered = sorted(samples)
+                    for q in QUANTILES:
+                        lines.append(f"{name}{format_labels(labels, (('quantile', q),))} {quantile(ordered, q)}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for name, (kind, fn) in sorted(self._callbacks.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Could not read metric {name}: {e}")
+                continue
+            self._header(lines, name, kind)
+            if isinstance(value, list):
+                for labels, item in value:
+                    lines.append(f"{name}{format_labels(label_key(labels))} {item}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# shared by everything in this process
+metrics = Metrics()
+
+
+def read_io() -> tuple[int, int]:
+    '''
+    Bytes this process has read from and written to storage so far (0, 0 where /proc is not available)
+    '''
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def children_cpu_seconds() -> float:
+    # cpu time of the subprocesses (ffmpeg) we have waited on
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class measure_stage:
+    '''
+    Records the wall time, cpu time (this thread plus finished subprocesses) and io bytes of a render stage
+
+    io and subprocess cpu are process-wide, so they are approximate while several renders run at once.
+    '''
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.children_start = children_cpu_seconds()
+        self.io_start = read_io()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu_start + children_cpu_seconds() - self.children_start
+        read_bytes, write_bytes = read_io()
+        metrics.observe("motionlab_stage_seconds", wall, stage=self.stage)
+        metrics.observe("motionlab_stage_cpu_seconds", cpu, stage=self.stage)
+        metrics.inc("motionlab_stage_read_bytes_total", read_bytes - self.io_start[0], stage=self.stage)
+        metrics.inc("motionlab_stage_write_bytes_total", write_bytes - self.io_start[1], stage=self.stage)
+        if exc_type is not None:
+            metrics.inc("motionlab_stage_errors_total", stage=self.stage)
+        return False
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure_stage(self.stage):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+class cprofile_dump:
+    '''
+    Profiles the calling thread with cProfile and writes the stats to path (open with pstats or snakeviz)
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.profiler.disable()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.profiler.dump_stats(self.path)
+        print(f"Profile written to {self.path}")
+        return False
+
+
+def instrument_blueprint(blueprint: Blueprint):
+    '''
+    Times every request handled by a blueprint's routes, by endpoint and status code
+    '''
+    @blueprint.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @blueprint.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            endpoint = request.endpoint or "unknown"
+            metrics.observe("motionlab_http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+            metrics.inc("motionlab_http_requests_total", endpoint=endpoint, status=response.status_code)
+        return response
+
+
+metrics.describe("motionlab_stage_seconds", "Wall time of a render stage")
+metrics.describe("motionlab_stage_cpu_seconds", "CPU time of a render stage, including its ffmpeg processes")
+metrics.describe("motionlab_stage_read_bytes_total", "Bytes read from storage during a render stage")
+metrics.describe("motionlab_stage_write_bytes_total", "Bytes written to storage during a render stage")
+metrics.describe("motionlab_stage_errors_total", "Render stages that raised")
+metrics.describe("motionlab_http_request_seconds", "Time spent handling a request")
+metrics.describe("motionlab_http_requests_total", "Requests handled, by endpoint and status")
+metrics.register("motionlab_process_max_rss_bytes", "gauge", max_rss_bytes, "Peak resident memory of this process")
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,121 @@
+'''
+Packs a frame sequence folder into one binary file plus a JSON index, so clients can fetch a whole
+sequence in one (or a few ranged) requests instead of one request per frame
+
+    pack:  every frame file, concatenated in frame order
+    index: {"frame_count", "fps", "bytes", "frames": [[offset, length], ...], "source_mtime"}
+
+Packs live under PACK_DIR, mirroring the sequence's path relative to ROOT, so sequence folders
+themselves (and the bundled assets) are never modified.
+
+pack the bundled sequences ahead of time from the backend directory:
+    python -m utils.sequence_pack ../assets/frame_sequences/dance --fps 20
+'''
+import os
+import sys
+import json
+import uuid
+import shutil
+import argparse
+
+# our ROOT directory, relative to the backend directory we run from
+ROOT_DIR = "../"
+PACK_DIR = os.environ.get("SEQUENCE_PACK_DIR", "../cache/sequence_packs")
+PACK_FILE = "sequence.pack"
+INDEX_FILE = "sequence.json"
+frame_extensions = (".png", ".jpg", ".jpeg")
+
+
+def pack_location(folder: str) -> str:
+    '''
+    Returns the directory holding the pack of a sequence folder
+    '''
+    relative_path = os.path.relpath(os.path.abspath(folder), os.path.abspath(ROOT_DIR))
+    return os.path.join(PACK_DIR, relative_path)
+
+
+def list_frames(folder: str) -> list[str]:
+    return sorted(name for name in os.listdir(folder) if name.lower().endswith(frame_extensions))
+
+
+def pack_sequence(folder: str, fps: int | None = None) -> dict:
+    '''
+    Writes the pack and index of a sequence folder and returns the index
+    '''
+    location = pack_location(folder)
+    os.makedirs(location, exist_ok=True)
+    frames = []
+    offset = 0
+    # writing to temporary files first, so a reader never sees a pack that does not match its index
+    suffix = f".tmp-{uuid.uuid4().hex}"
+    pack_path = os.path.join(location, PACK_FILE)
+    index_path = os.path.join(location, INDEX_FILE)
+    with open(pack_path + suffix, "wb") as pack:
+        for name in list_frames(folder):
+            with open(os.path.join(folder, name), "rb") as f:
+                data = f.read()
+            pack.write(data)
+            frames.append([offset, len(data)])
+            offset += len(data)
+    index = {
+        "frame_count": len(frames),
+        "fps": fps,
+        "bytes": offset,
+        "frames": frames,
+        "source_mtime": os.path.getmtime(folder),
+    }
+    with open(index_path + suffix, "w") as f:
+        json.dump(index, f)
+    os.replace(pack_path + suffix, pack_path)
+    os.replace(index_path + suffix, index_path)
+    return index
+
+
+def load_index(folder: str) -> dict | None:
+    '''
+    Returns the index of a sequence's pack, or None if it has not been packed (or changed since)
+    '''
+    index_path = os.path.join(pack_location(folder), INDEX_FILE)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("source_mtime") != os.path.getmtime(folder):
+        return None
+    return index
+
+
+def ensure_packed(folder: str, fps: int | None = None) -> dict:
+    '''
+    Returns the index of a sequence's pack, packing it first if needed
+    '''
+    index = load_index(folder)
+    if index is None:
+        index = pack_sequence(folder, fps)
+    return index
+
+
+def remove_packs(folder: str):
+    '''
+    Removes the packs of a folder and of every sequence inside it (e.g. when a session is cleared)
+    '''
+    shutil.rmtree(pack_location(folder), ignore_errors=True)
+
+
+def pack_src(folder: str) -> str:
+    '''
+    Path of a sequence's pack relative to ROOT (what /file/get_asset/ expects)
+    '''
+    pack_path = os.path.join(pack_location(folder), PACK_FILE)
+    return os.path.relpath(os.path.abspath(pack_path), os.path.abspath(ROOT_DIR))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack frame sequence folders")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--fps", type=int, default=None)
+    args = parser.parse_args()
+    for folder in args.folders:
+        index = pack_sequence(folder, args.fps)
+        print(f"Packed {index['frame_count']} frames ({index['bytes']} bytes) from {folder}", file=sys.stderr)
@@ -0,0 +1,27 @@
+from utils.lazy_import import lazy_module
+
+ffmpeg = lazy_module("ffmpeg")
+
+
+def run_with_progress(stream, on_frame=None):
+    '''
+    Runs an ffmpeg-python output stream, calling on_frame(frame) as ffmpeg reports encoded frames
+
+    Uses ffmpeg's -progress output (key=value lines on stdout), which is written regardless of loglevel.
+    Returns the last values ffmpeg reported (e.g. "frame", "fps", "speed").
+    Raises ffmpeg.Error if ffmpeg fails, like stream.run() does.
+    '''
+    process = stream.global_args("-progress", "pipe:1", "-nostats").run_async(pipe_stdout=True, pipe_stderr=True)
+    report = {}
+    for line in process.stdout:
+        key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+        report[key] = value
+        if key == "frame" and on_frame is not None:
+            try:
+                on_frame(int(value))
+            except ValueError:
+                pass
+    err = process.stderr.read()
+    if process.wait() != 0:
+        raise ffmpeg.Error("ffmpeg", b"", err)
+    return report
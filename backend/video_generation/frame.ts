@@ -4,6 +4,10 @@ import express from "express";
 import cors from "cors";
 
 const fps = 60;
+// when true, frames are streamed straight into the flask backend's encoder instead of being written as PNGs
+const streamFrames = process.env.STREAM_FRAMES === "true";
+const framesPerRequest = 10; // how many raw frames we batch into one streamed request
+const flaskURL = "http://localhost:8000";
 let map: any = {};
 
 async function run(animationPath: string, user: string, session: number) {
@@ -18,7 +22,9 @@ async function run(animationPath: string, user: string, session: number) {
     let assetLoadTime = await animation.load();
     // waiting for all frames to be written
     console.log("Creating and writing frames...");
-    let frameWriteTime = await writeFrames(animation, user, session);
+    let frameWriteTime = streamFrames
+      ? await streamFramesToEncoder(animation, user, session)
+      : await writeFrames(animation, user, session);
     await animation.terminate(); // clearing events added to our emitter
 
     map[user][session]["info"] = {
@@ -33,6 +39,8 @@ async function run(animationPath: string, user: string, session: number) {
       audioTimeline: animation.audioTimeline,
       assetLoadTime: assetLoadTime,
       frameWriteTime: frameWriteTime,
+      streamed: streamFrames,
+      profile: map[user][session]["profile"],
     };
   } catch (error) {
     console.error("Error loading animation:", error);
@@ -68,6 +76,55 @@ async function writeFrames(animation: any, user: string, session: number) {
   return timeElapsed;
 }
 
+// create the frames and stream their raw pixels to the flask backend, which encodes them as they arrive
+async function streamFramesToEncoder(animation: any, user: string, session: number) {
+  let startTime = Date.now();
+  console.log("Starting frame stream");
+  const userInfo = { userID: user, sessionID: session };
+  const startResponse = await fetch(`${flaskURL}/video/stream/start`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    // node-canvas raw buffers are BGRA on little-endian machines
+    body: JSON.stringify({
+      ...userInfo,
+      width: animation.canvas.width,
+      height: animation.canvas.height,
+      format: "bgra",
+      fps: fps,
+      profile: map[user][session]["profile"],
+    }),
+  });
+  if (!startResponse.ok) {
+    throw new Error(`Could not start the frame stream: ${(await startResponse.json())["message"]}`);
+  }
+  const totalFrames = fps * map[user][session]["duration"];
+  let batch: Buffer[] = [];
+  for (let frameIndex = 0; frameIndex < totalFrames; frameIndex++) {
+    await animation.update();
+    await animation.draw();
+    batch.push(animation.canvas.toBuffer("raw"));
+    map[user][session]["progress"] = (frameIndex / totalFrames) * 74;
+    if (batch.length == framesPerRequest || frameIndex == totalFrames - 1) {
+      // this request only resolves once the encoder has taken every byte, which keeps us from running ahead of it
+      const framesResponse = await fetch(`${flaskURL}/video/stream/frames/${user}/${session}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/octet-stream" },
+        body: Buffer.concat(batch),
+      });
+      if (!framesResponse.ok) {
+        // the encoder is gone (or never started), so the rest of the frames have nowhere to go
+        throw new Error(`Frame stream failed: ${(await framesResponse.json())["message"]}`);
+      }
+      batch = [];
+    }
+    if ((frameIndex + 1) % 10 == 0) {
+      console.log(`Streamed ${frameIndex + 1}/${totalFrames} frames`);
+    }
+  }
+  map[user][session]["progress"] = 75;
+  return (Date.now() - startTime) / 1000;
+}
+
 const app = express();
 app.use(express.json());
 app.use(cors({ origin: "*", methods: ["GET", "POST", "PUT", "DELETE"], credentials: true }));
@@ -92,7 +149,7 @@ app.post("/video/get_info", (req, res) => {
 app.post("/video/create_frames", async (request, response) => {
   console.log(request.body);
   let { userID: userID, sessionID: sessionID } = request.body.userInfo;
-  let { duration: duration } = request.body.videoInfo;
+  let { duration: duration, profile: profile } = request.body.videoInfo;
   let {
     animationPath: animationPath,
     config: config,
@@ -106,6 +163,7 @@ app.post("/video/create_frames", async (request, response) => {
   map[userID][sessionID] = {};
   map[userID][sessionID]["progress"] = 0;
   map[userID][sessionID]["duration"] = duration;
+  map[userID][sessionID]["profile"] = profile; // optional encoder profile (preview, standard, archive)
   map[userID][sessionID]["animationPath"] = animationPath;
   map[userID][sessionID]["config"] = config;
   map[userID][sessionID]["categoryName"] = categoryName;
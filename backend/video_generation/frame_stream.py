@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+from flask import Blueprint, request, jsonify
+from user.auth import get_plan
+from video_generation.profiles import select_profile, video_options
+from utils.lazy_import import lazy_module
+
+ffmpeg = lazy_module("ffmpeg")
+
+# frame stream blueprint
+stream_bp = Blueprint("stream_bp", __name__)
+
+# how much of the request body we forward to ffmpeg at a time
+CHUNK_SIZE = 256 * 1024
+# every PNG file ends with this IEND chunk, which lets us count frames in an image2pipe stream
+PNG_END = b"IEND\xaeB`\x82"
+
+# (user, session) => FrameStream for every stream that has not finished yet
+streams = {}
+streams_lock = threading.Lock()
+
+
+class StreamError(Exception):
+    pass
+
+
+class FrameStream:
+    '''
+    A long-lived ffmpeg process that encodes frames as soon as they are written to its stdin
+
+    Frames are either raw pixels (rgba/bgra, width * height * 4 bytes each) or PNG files, and
+    are encoded into sessionDir/output.mp4. Writes block while ffmpeg is busy, so a client
+    streaming faster than we can encode is slowed down by the pipe (back-pressure) instead of
+    buffering frames in memory.
+    '''
+
+    def __init__(self, session_dir: str, width: int, height: int, frame_format: str = "rgba", fps: int = 60,
+                 profile: str | None = None):
+        self.output_video = os.path.join(session_dir, "output.mp4")
+        self.frame_format = frame_format
+        self.frame_size = width * height * 4
+        if frame_format == "png":
+            video = ffmpeg.input("pipe:", format="image2pipe", vcodec="png", framerate=fps)
+        else:
+            video = ffmpeg.input("pipe:", format="rawvideo", pix_fmt=frame_format,
+                                 s=f"{width}x{height}", framerate=fps)
+        self.process = video \
+            .output(self.output_video, vcodec="libx264", pix_fmt="yuv420p", r=fps, loglevel="quiet",
+                    **video_options(profile)) \
+            .overwrite_output() \
+            .run_async(pipe_stdin=True)
+        self.frame_rate = fps
+        self.frames = 0
+        self.bytes = 0
+        self.start_time = time.time()
+        self.end_time = None
+        # the tail of the previous chunk, in case a PNG end marker is split between two chunks
+        self._tail = b""
+        self._lock = threading.Lock()
+
+    def write(self, chunk: bytes):
+        with self._lock:
+            self.process.stdin.write(chunk)
+            self.bytes += len(chunk)
+            if self.frame_format == "png":
+                data = self._tail + chunk
+                self.frames += data.count(PNG_END)
+                self._tail = data[-(len(PNG_END) - 1):]
+            else:
+                self.frames = self.bytes // self.frame_size
+
+    def finish(self) -> dict:
+        '''
+        Closes the pipe and waits for ffmpeg to write the rest of the video
+        '''
+        with self._lock:
+            if self.end_time is None:
+                self.process.stdin.close()
+                self.process.wait()
+                self.end_time = time.time()
+        return self.stats()
+
+    def stats(self) -> dict:
+        elapsed = (self.end_time or time.time()) - self.start_time
+        return {
+            "frames": self.frames,
+            "frame_rate": self.frame_rate,
+            "bytes": self.bytes,
+            "time": elapsed,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "finished": self.end_time is not None,
+            "return_code": self.process.returncode,
+        }
+
+
+def finish_stream(userID, sessionID) -> dict | None:
+    '''
+    Finishes a session's frame stream (if it has one) and returns its stats
+    '''
+    with streams_lock:
+        stream = streams.pop((str(userID), str(sessionID)), None)
+    if stream is None:
+        return None
+    return stream.finish()
+
+
+def check_stream(stats: dict | None, duration: int) -> dict:
+    '''
+    Raises StreamError unless a finished stream's encode succeeded with every frame of a duration second video
+    '''
+    if stats is None:
+        raise StreamError("no frame stream for this session")
+    if stats["return_code"] != 0:
+        raise StreamError(f"the frame stream's encoder exited with {stats['return_code']}")
+    expected = int(duration) * stats["frame_rate"]
+    if stats["frames"] < expected:
+        raise StreamError(f"the frame stream has {stats['frames']} of {expected} frames")
+    return stats
+
+
+@stream_bp.route("/video/stream/start", methods=["POST"])
+def start_stream():
+    '''
+    Starts an encoder for a session, which frames can then be streamed to
+    '''
+    data = request.get_json()
+    userID, sessionID = str(data["userID"]), str(data["sessionID"])
+    session_dir = os.path.join("../videos", userID, sessionID)
+    if not os.path.isdir(session_dir):
+        return jsonify({"message": f"{session_dir} does not exist"}), 400
+    # closing any stream left over from a render that never finished
+    finish_stream(userID, sessionID)
+    stream = FrameStream(session_dir, int(data["width"]), int(data["height"]),
+                         data.get("format", "rgba"), int(data.get("fps", 60)),
+                         select_profile(data.get("profile"), get_plan(userID)))
+    with streams_lock:
+        streams[(userID, sessionID)] = stream
+    return jsonify({"message": "Started frame stream"}), 200
+
+
+@stream_bp.route("/video/stream/frames/<userID>/<sessionID>", methods=["POST"])
+def stream_frames(userID, sessionID):
+    '''
+    Forwards the (possibly chunked) request body straight into the session's encoder
+    '''
+    with streams_lock:
+        stream = streams.get((userID, sessionID))
+    if stream is None:
+        return jsonify({"message": "no frame stream for this session"}), 404
+    try:
+        for chunk in iter(lambda: request.stream.read(CHUNK_SIZE), b""):
+            stream.write(chunk)
+    except (BrokenPipeError, ValueError) as e:
+        # ffmpeg exited (or the stream was finished) while we were still writing
+        print(f"Frame stream closed early: {e}")
+        return jsonify({"message": "frame stream closed", **stream.stats()}), 409
+    return jsonify(stream.stats()), 200
+
+
+@stream_bp.route("/video/stream/progress", methods=["POST"])
+def stream_progress():
+    data = request.get_json()
+    with streams_lock:
+        stream = streams.get((str(data["userID"]), str(data["sessionID"])))
+    if stream is None:
+        return jsonify({"message": "no frame stream for this session"}), 404
+    return jsonify(stream.stats()), 200
+
+
+@stream_bp.route("/video/stream/finish", methods=["POST"])
+def end_stream():
+    '''
+    Waits for the encoder to finish writing sessionDir/output.mp4
+    '''
+    data = request.get_json()
+    stats = finish_stream(data["userID"], data["sessionID"])
+    if stats is None:
+        return jsonify({"message": "no frame stream for this session"}), 404
+    return jsonify(stats), 200
@@ -0,0 +1,73 @@
+import numpy as np
+from pydub import AudioSegment
+
+# numpy types for each pydub sample width (pydub/audioop treat every width as signed)
+sample_types = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def frame_to_ms(frame: int, fps: int = 60) -> int:
+    '''
+    Converts an animation frame to a position in MILLISECONDS (frame / 60 * 1000 = frame * 1000 // 60)
+    '''
+    return int(frame) * 1000 // fps
+
+
+def clip_to_array(clip: AudioSegment, frame_rate: int, channels: int, sample_width: int) -> np.ndarray:
+    '''
+    Converts a clip to the mix format and returns its samples as a (frames, channels) array
+    '''
+    clip = clip.set_frame_rate(frame_rate).set_channels(channels).set_sample_width(sample_width)
+    samples = np.frombuffer(clip.raw_data, dtype=sample_types[sample_width])
+    return samples.reshape(-1, channels)
+
+
+def mix_timeline(audio_timeline: list[dict], clips: dict[str, AudioSegment], duration: int,
+                 limit: bool = False) -> AudioSegment:
+    '''
+    Mixes every clip of the timeline into one preallocated buffer and returns it as a single segment
+
+    Matches the old chained AudioSegment.overlay output: the mix uses the highest frame rate,
+    channel count and sample width of any clip (starting from pydub's 11025 Hz mono silence),
+    clips are trimmed to audio_duration and anything past the end of the video is dropped.
+    Overlapping clips are summed at full precision and then hard clipped, or scaled down to
+    fit when limit is True.
+    '''
+    # pydub's silent() defaults, which the overlay loop used as its base
+    frame_rate, channels, sample_width = 11025, 1, 2
+    for clip in clips.values():
+        frame_rate = max(frame_rate, clip.frame_rate)
+        channels = max(channels, clip.channels)
+        sample_width = max(sample_width, clip.sample_width)
+
+    total_frames = int(frame_rate * duration)
+    # accumulating in 64 bits means overlapping clips can never wrap around
+    mix = np.zeros((total_frames, channels), dtype=np.int64)
+
+    # each distinct clip is converted to the mix format once
+    arrays = {url: clip_to_array(clip, frame_rate, channels, sample_width) for url, clip in clips.items()}
+
+    for entry in audio_timeline:
+        samples = arrays[str(entry["audio"])]
+        if "audio_duration" in entry.keys():
+            # same ms => frame rounding as slicing an AudioSegment
+            samples = samples[:int(entry["audio_duration"] * frame_rate / 1000.0)]
+        start = int(frame_to_ms(entry["frame"]) * frame_rate / 1000.0)
+        if start >= total_frames:
+            continue
+        end = min(start + len(samples), total_frames)
+        mix[start:end] += samples[:end - start]
+
+    sample_type = sample_types[sample_width]
+    low, high = np.iinfo(sample_type).min, np.iinfo(sample_type).max
+    peak = int(np.abs(mix).max()) if total_frames else 0
+    if limit and peak > high:
+        # scaling the whole track down instead of clipping its peaks
+        mix = mix * high // peak
+    output = np.clip(mix, low, high).astype(sample_type)
+
+    return AudioSegment(
+        data=output.tobytes(),
+        sample_width=sample_width,
+        frame_rate=frame_rate,
+        channels=channels,
+    )
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import fcntl
+import random
+import sqlite3
+import threading
+from utils.metrics import metrics
+
+# rows sent to the database in one request
+OUTBOX_BATCH = int(os.environ.get("OUTBOX_BATCH", 50))
+# how often the flusher looks for rows written by the other worker processes
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 1))
+# retries back off exponentially from OUTBOX_RETRY_DELAY up to OUTBOX_MAX_DELAY seconds
+OUTBOX_RETRY_DELAY = float(os.environ.get("OUTBOX_RETRY_DELAY", 1))
+OUTBOX_MAX_DELAY = float(os.environ.get("OUTBOX_MAX_DELAY", 300))
+# a row that failed this many times is dead-lettered: kept in the outbox (with its last error) but never retried
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 20))
+
+
+def retry_delay(attempts: int) -> float:
+    '''
+    How long to wait before the next attempt, after attempts failed ones (with up to 20% jitter)
+    '''
+    delay = min(OUTBOX_MAX_DELAY, OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1)
+
+
+class Outbox:
+    '''
+    Rows for the database, written to a local SQLite file first and inserted by a background flusher
+
+    add() returns as soon as the row is on disk, so a slow or unavailable database never holds up a
+    render, and rows survive restarts until they are inserted. The flusher inserts due rows in
+    batches (one request per table), and retries failed rows with exponential backoff, up to
+    OUTBOX_MAX_ATTEMPTS times, after which the row is dead-lettered (failed_at is set) for someone to look at.
+
+    Every row has a key, adding a key that is already waiting does nothing. A retried row may have
+    made it into the database before the failure (a timeout after the insert), so before a row is
+    sent again we look for it by its match_columns and skip it if it is already there. These should
+    identify the row exactly, like an id we generated for it.
+
+    Every worker process can add rows, one of them (holding an flock next to the database) flushes.
+    '''
+
+    def __init__(self, path: str, client, match_columns: dict[str, tuple[str, ...]] | None = None):
+        # client() returns the supabase client to insert with
+        self.path = path
+        self.client = client
+        self.match_columns = match_columns or {}
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._flush_lock_file = None
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                table_name TEXT NOT NULL,
+                row TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                failed_at REAL
+            )''')
+        # outboxes made before rows could be dead-lettered
+        if "failed_at" not in [column[1] for column in connection.execute("PRAGMA table_info(outbox)")]:
+            connection.execute("ALTER TABLE outbox ADD COLUMN failed_at REAL")
+        connection.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        # a connection must not be used across a fork, so a worker forked from a preloaded app opens its own
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # autocommit mode, every statement is its own transaction
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # the database is only created once something is queued (or read), not when the app is imported
+            self._create(connection)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, table: str, row: dict, key: str):
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR IGNORE INTO outbox (key, table_name, row, created_at, next_attempt) VALUES (?, ?, ?, ?, ?)",
+            (key, table, json.dumps(row), now, now))
+        self._wake.set()
+
+    def pending(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM outbox WHERE failed_at IS NULL").fetchone()[0]
+
+    def dead(self) -> int:
+        '''
+        Rows that gave up after OUTBOX_MAX_ATTEMPTS attempts
+        '''
+        return self._connection().execute("SELECT COUNT(*) FROM outbox WHERE failed_at IS NOT NULL").fetchone()[0]
+
+    def lag(self) -> float:
+        '''
+        Seconds the oldest row has been waiting (0 when the outbox is empty)
+        '''
+        oldest = self._connection().execute(
+            "SELECT MIN(created_at) FROM outbox WHERE failed_at IS NULL").fetchone()[0]
+        return time.time() - oldest if oldest is not None else 0.0
+
+    def _already_inserted(self, table: str, row: dict) -> bool:
+        columns = self.match_columns.get(table)
+        if not columns:
+            return False
+        query = self.client().table(table).select(columns[0])
+        for column in columns:
+            query = query.eq(column, row[column])
+        return bool(query.execute().data)
+
+    def _insert(self, table: str, entries: list[tuple[int, dict, int]]):
+        connection = self._connection()
+        # rows that failed before may already be in the database
+        inserted = {row_id for row_id, row, attempts in entries
+                    if attempts > 0 and self._already_inserted(table, row)}
+        rows = [row for row_id, row, _ in entries if row_id not in inserted]
+        if rows:
+            self.client().table(table).insert(rows).execute()
+        connection.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id, _, _ in entries])
+        metrics.inc("motionlab_outbox_inserted_total", len(rows), table=table)
+
+    def _failed(self, entries: list[tuple[int, dict, int]], error: Exception):
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ?, failed_at = ? WHERE id = ?",
+            [(attempts + 1, now + retry_delay(attempts + 1), str(error),
+              now if attempts + 1 >= OUTBOX_MAX_ATTEMPTS else None, row_id)
+             for row_id, _, attempts in entries])
+        metrics.inc("motionlab_outbox_failures_total", len(entries))
+        dead = [row_id for row_id, _, attempts in entries if attempts + 1 >= OUTBOX_MAX_ATTEMPTS]
+        if dead:
+            print(f"Giving up on outbox rows {dead} after {OUTBOX_MAX_ATTEMPTS} attempts: {error}")
+
+    def flush(self) -> int:
+        '''
+        Inserts up to OUTBOX_BATCH rows that are due, returns how many rows were handled
+        '''
+        due = self._connection().execute(
+            "SELECT id, table_name, row, attempts FROM outbox WHERE failed_at IS NULL AND next_attempt <= ? "
+            "ORDER BY id LIMIT ?",
+            (time.time(), OUTBOX_BATCH)).fetchall()
+        tables: dict[str, list[tuple[int, dict, int]]] = {}
+        for row_id, table, row, attempts in due:
+            tables.setdefault(table, []).append((row_id, json.loads(row), attempts))
+        for table, entries in tables.items():
+            try:
+                self._insert(table, entries)
+            except Exception as e:
+                if len(entries) == 1:
+                    print(f"Could not insert into {table} (attempt {entries[0][2] + 1}): {e}")
+                    self._failed(entries, e)
+                    continue
+                # a batch is inserted all or nothing, so one bad row would hold back every other one
+                for entry in entries:
+                    try:
+                        self._insert(table, [entry])
+                    except Exception as e:
+                        print(f"Could not insert into {table} (attempt {entry[2] + 1}): {e}")
+                        self._failed([entry], e)
+        return len(due)
+
+    def _claim(self) -> bool:
+        # only one process flushes, the others take over if it exits
+        if self._flush_lock_file is not None:
+            return True
+        lock_file = open(self.path + ".lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._flush_lock_file = lock_file
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(OUTBOX_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                if not self._claim():
+                    continue
+                # a full batch means there may be more rows waiting
+                while self.flush() >= OUTBOX_BATCH:
+                    pass
+            except Exception as e:
+                print(f"Outbox flush failed: {e}")
+
+    def start(self):
+        '''
+        Starts the flusher on a background thread (once per process)
+        '''
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name="outbox", daemon=True).start()
@@ -0,0 +1,95 @@
+import os
+
+# named speed/quality tiers for the x264 encodes of a render
+# crf is used unless a bitrate is given, threads=0 lets x264 pick, gop is the keyframe interval in frames,
+# max_height scales the video down (keeping its aspect ratio) when the canvas is taller
+PROFILES = {
+    "preview": {
+        "preset": "ultrafast",
+        "tune": "animation",
+        "crf": 30,
+        "bitrate": None,
+        "threads": 2,
+        "gop": 120,
+        "audio_bitrate": "96k",
+        "max_height": 480,
+    },
+    "standard": {
+        "preset": "medium",
+        "tune": "animation",
+        "crf": 23,
+        "bitrate": None,
+        "threads": 0,
+        "gop": 120,
+        "audio_bitrate": "128k",
+        "max_height": None,
+    },
+    "archive": {
+        "preset": "slow",
+        "tune": "animation",
+        "crf": 18,
+        "bitrate": None,
+        "threads": 0,
+        "gop": 240,
+        "audio_bitrate": "192k",
+        "max_height": None,
+    },
+}
+
+# the profile used when a render does not ask for one and its plan has none
+DEFAULT_PROFILE = os.environ.get("RENDER_PROFILE", "standard")
+
+# the profiles from the cheapest to encode to the most expensive
+PROFILE_ORDER = ["preview", "standard", "archive"]
+
+# which profile each plan renders with by default, which is also the most expensive one it may ask for
+PLAN_PROFILES = {
+    "free": "preview",
+    "pro": "standard",
+    "studio": "archive",
+}
+
+
+def select_profile(requested: str | None, plan: str | None) -> str:
+    '''
+    Picks a render's profile: the one asked for if the user's plan allows it, otherwise the plan's own
+    A plan allows its own profile and every cheaper one, plan is looked up on the server (see user.auth.get_plan)
+    Without a known plan a render gets DEFAULT_PROFILE (or a cheaper one it asks for), it is never downgraded further
+    '''
+    plan_profile = PLAN_PROFILES.get(plan, DEFAULT_PROFILE)
+    if requested in PROFILE_ORDER and plan_profile in PROFILE_ORDER \
+            and PROFILE_ORDER.index(requested) <= PROFILE_ORDER.index(plan_profile):
+        return requested
+    return plan_profile
+
+
+def get_profile(name: str | None) -> dict:
+    return PROFILES.get(name, PROFILES[DEFAULT_PROFILE])
+
+
+def video_options(name: str | None) -> dict:
+    '''
+    ffmpeg output options for the libx264 video stream of a profile
+    '''
+    profile = get_profile(name)
+    options = {
+        "preset": profile["preset"],
+        "tune": profile["tune"],
+        "threads": profile["threads"],
+        "g": profile["gop"],
+    }
+    if profile["bitrate"]:
+        options.update({"b:v": profile["bitrate"], "maxrate": profile["bitrate"], "bufsize": profile["bitrate"]})
+    else:
+        options["crf"] = profile["crf"]
+    if profile["max_height"]:
+        # never scaling up, and keeping the width even (which yuv420p needs)
+        options["vf"] = f"scale=-2:'min({profile['max_height']},ih)'"
+    return options
+
+
+def audio_options(name: str | None) -> dict:
+    '''
+    ffmpeg output options for the aac audio stream of a profile
+    '''
+    return {"acodec": "aac", "b:a": get_profile(name)["audio_bitrate"]}
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# how long a finished render's progress and info are kept around for the client to read
+FINISHED_TTL = int(os.environ.get("PROGRESS_TTL", 15 * 60))
+# how often (at most) we sweep expired entries
+EXPIRE_INTERVAL = 60
+
+
+class ProgressStore:
+    '''
+    Holds the progress (0 - 100), final info and error of every render, keyed by user and session
+
+    set() updates only the fields it is given, atomically. A render counts as finished once its
+    progress reaches 100 or it has an error, and finished renders are dropped FINISHED_TTL seconds later.
+    '''
+
+    def set(self, userID, sessionID, **fields):
+        raise NotImplementedError
+
+    def get(self, userID, sessionID) -> dict | None:
+        '''
+        Returns {"progress", "info", "error", "updated_at", "finished_at"} or None if we know nothing about the render
+        '''
+        raise NotImplementedError
+
+    def delete(self, userID, sessionID):
+        raise NotImplementedError
+
+    def expire(self):
+        raise NotImplementedError
+
+
+class MemoryProgressStore(ProgressStore):
+    '''
+    Progress for a single process, in a dictionary guarded by a lock
+    '''
+
+    def __init__(self, ttl: int = FINISHED_TTL):
+        self.ttl = ttl
+        self._entries: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+        self._last_expire = time.time()
+
+    def set(self, userID, sessionID, **fields):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(
+                (str(userID), str(sessionID)),
+                {"progress": 0, "info": None, "error": None, "updated_at": now, "finished_at": None})
+            entry.update(fields)
+            entry["updated_at"] = now
+            entry["finished_at"] = now if entry["progress"] >= 100 or entry["error"] is not None else None
+        if now - self._last_expire > EXPIRE_INTERVAL:
+            self.expire()
+
+    def get(self, userID, sessionID) -> dict | None:
+        with self._lock:
+            entry = self._entries.get((str(userID), str(sessionID)))
+            return dict(entry) if entry is not None else None
+
+    def delete(self, userID, sessionID):
+        with self._lock:
+            self._entries.pop((str(userID), str(sessionID)), None)
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            self._last_expire = now
+            for key in [key for key, entry in self._entries.items()
+                        if entry["finished_at"] is not None and now - entry["finished_at"] > self.ttl]:
+                del self._entries[key]
+
+
+class SQLiteProgressStore(ProgressStore):
+    '''
+    Progress shared by every worker process on this machine, in a WAL-mode SQLite database
+
+    Each thread gets its own connection. Every update is a single upsert statement, so concurrent
+    writers never see a half-written row, and lookups go through the (user, session) primary key.
+    '''
+
+    def __init__(self, path: str, ttl: int = FINISHED_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_expire = time.time()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS render_progress (
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                info TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                PRIMARY KEY (user_id, session_id)
+            )''')
+        # databases made before renders could fail with an error
+        if "error" not in [column[1] for column in connection.execute("PRAGMA table_info(render_progress)")]:
+            connection.execute("ALTER TABLE render_progress ADD COLUMN error TEXT")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS render_progress_finished ON render_progress (finished_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        # a connection must not be used across a fork, so a worker forked from a preloaded app opens its own
+        if connection is None or self._local.pid != os.getpid():
+            # autocommit mode, every statement is its own transaction
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def set(self, userID, sessionID, **fields):
+        now = time.time()
+        progress = fields.get("progress")
+        info = json.dumps(fields["info"]) if "info" in fields else None
+        error = fields.get("error")
+        self._connection().execute('''
+            INSERT INTO render_progress (user_id, session_id, progress, info, error, updated_at, finished_at)
+            VALUES (?, ?, COALESCE(?, 0), ?, ?, ?, CASE WHEN ? >= 100 OR ? IS NOT NULL THEN ? END)
+            ON CONFLICT (user_id, session_id) DO UPDATE SET
+                progress = COALESCE(?, progress),
+                info = CASE WHEN ? THEN excluded.info ELSE info END,
+                error = CASE WHEN ? THEN excluded.error ELSE error END,
+                updated_at = excluded.updated_at,
+                finished_at = CASE WHEN COALESCE(?, progress) >= 100 OR (CASE WHEN ? THEN excluded.error ELSE error END)
+                                   IS NOT NULL THEN excluded.updated_at END
+            ''', (str(userID), str(sessionID), progress, info, error, now, progress, error, now,
+                  progress, "info" in fields, "error" in fields, progress, "error" in fields))
+        if now - self._last_expire > EXPIRE_INTERVAL:
+            self.expire()
+
+    def get(self, userID, sessionID) -> dict | None:
+        row = self._connection().execute(
+            "SELECT progress, info, error, updated_at, finished_at FROM render_progress WHERE user_id = ? AND session_id = ?",
+            (str(userID), str(sessionID))).fetchone()
+        if row is None:
+            return None
+        return {
+            "progress": row[0],
+            "info": json.loads(row[1]) if row[1] is not None else None,
+            "error": row[2],
+            "updated_at": row[3],
+            "finished_at": row[4],
+        }
+
+    def delete(self, userID, sessionID):
+        self._connection().execute(
+            "DELETE FROM render_progress WHERE user_id = ? AND session_id = ?", (str(userID), str(sessionID)))
+
+    def expire(self):
+        self._last_expire = time.time()
+        self._connection().execute(
+            "DELETE FROM render_progress WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (self._last_expire - self.ttl,))
+
+
+def create_progress_store() -> ProgressStore:
+    '''
+    PROGRESS_STORE=sqlite shares progress between worker processes (through PROGRESS_DB), otherwise it stays in memory
+    '''
+    if os.environ.get("PROGRESS_STORE", "memory") == "sqlite":
+        return SQLiteProgressStore(os.environ.get("PROGRESS_DB", "../progress.db"))
+    return MemoryProgressStore()
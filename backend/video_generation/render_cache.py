@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from utils.audio_prefetch import resolve_local_path
+from utils.metrics import metrics
+
+# lives inside the session directory, so clean_up keeps it and clearing the session removes it
+CACHE_DIR = "render_cache"
+# most a session's cached audio mixes and encoded segments may take up
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+RENDER_CACHE = os.environ.get("RENDER_CACHE", "1") == "1"
+# caching segments means always encoding in segments, then concatenating them and muxing the audio, which is slower
+# than the single pass encode unless most of a session's frames stay the same between renders (so it is opt-in)
+RENDER_SEGMENT_CACHE = os.environ.get("RENDER_SEGMENT_CACHE", "0") == "1"
+
+
+def hash_frame(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def link_or_copy(source: str, destination: str):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class RenderCache:
+    '''
+    Keeps a session's audio mix and encoded video segments between renders, keyed by fingerprints of what made them
+
+    audio/<fingerprint>.wav     audio timeline + duration + the size/mtime of every local clip
+    segments/<fingerprint>.mp4  hashes of the segment's frames + encode settings
+
+    Entries are touched when reused and the least recently used ones are evicted past the quota.
+    '''
+
+    def __init__(self, session_dir: str, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.directory = os.path.join(session_dir, CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, kind: str, key: str, extension: str) -> str:
+        return os.path.join(self.directory, kind, key + extension)
+
+    def _get(self, path: str) -> str | None:
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self.hits += 1
+                metrics.inc("motionlab_render_cache_requests_total", result="hit")
+                return path
+            self.misses += 1
+            metrics.inc("motionlab_render_cache_requests_total", result="miss")
+            return None
+
+    def _put(self, path: str, source: str, move: bool = False) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if move:
+            os.replace(source, path)
+        else:
+            link_or_copy(source, path)
+        return path
+
+    def audio_key(self, audio_timeline: list[dict], duration) -> str:
+        clips = {}
+        for url in dict.fromkeys(str(entry["audio"]) for entry in audio_timeline):
+            path = resolve_local_path(url)
+            # a session file can be replaced under the same url, so its size and mtime are part of the key
+            clips[url] = [os.path.getsize(path), os.path.getmtime(path)] if path and os.path.isfile(path) else None
+        # every field of an entry changes the mix (audio_duration trims the clip), not just where it starts
+        description = {"timeline": [{**entry, "audio": str(entry["audio"])} for entry in audio_timeline],
+                       "duration": duration, "clips": clips}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def get_audio(self, key: str) -> str | None:
+        return self._get(self._path("audio", key, ".wav"))
+
+    def put_audio(self, key: str, path: str) -> str:
+        return self._put(self._path("audio", key, ".wav"), path)
+
+    def segment_key(self, frame_paths: list[str], settings: dict) -> str:
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+        for path in frame_paths:
+            digest.update(hash_frame(path).encode())
+        return digest.hexdigest()
+
+    def get_segment(self, key: str) -> str | None:
+        return self._get(self._path("segments", key, ".mp4"))
+
+    def put_segment(self, key: str, path: str) -> str:
+        '''
+        Moves a freshly encoded segment into the cache and returns its new path
+        '''
+        return self._put(self._path("segments", key, ".mp4"), path, move=True)
+
+    def evict(self, keep: set[str] = frozenset()):
+        '''
+        Removes the least recently used entries until the cache fits its quota (never the paths in keep)
+        '''
+        with self._lock:
+            entries = []
+            for directory, _, filenames in os.walk(self.directory):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path in keep:
+                    continue
+                os.remove(path)
+                total -= size
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,103 @@
+import os
+import heapq
+import itertools
+import threading
+from utils.metrics import metrics
+
+# how many renders run at once (each one runs its own ffmpeg encode), in this process
+# (under gunicorn every worker process has its own queue, see gunicorn.conf.py)
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# how many renders can wait for a worker before we start turning requests away (also per process)
+MAX_QUEUED_RENDERS = int(os.environ.get("MAX_QUEUED_RENDERS", 16))
+# the queue priority of each plan's renders (lower runs first), a plan that is not listed waits the longest
+PLAN_PRIORITIES = {
+    "studio": 0,
+    "pro": 1,
+    "free": 2,
+}
+
+
+def plan_priority(plan: str | None) -> int:
+    return PLAN_PRIORITIES.get(plan, max(PLAN_PRIORITIES.values()))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class RenderQueue:
+    '''
+    Bounded FIFO-with-priority queue of render jobs, drained by a fixed number of worker threads
+
+    Jobs with a lower priority number run first, and jobs with the same priority run in the order
+    they were submitted. A job is the same data payload render_video consumes.
+
+    Workers are threads rather than processes because the heavy lifting already happens outside the
+    GIL (ffmpeg subprocesses and numpy mixing), and render progress lives in this process.
+    '''
+
+    def __init__(self, handler, workers: int = RENDER_WORKERS, max_queued: int = MAX_QUEUED_RENDERS):
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        # (priority, submission order, key, data)
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self.active = 0
+
+    def _start_workers(self):
+        # workers are started lazily so importing this module never spawns threads
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"render-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, data: dict, priority: int = 0) -> int:
+        '''
+        Queues a render and returns its position in the queue (0 = next to run)
+        '''
+        with self._condition:
+            if len(self._heap) >= self.max_queued:
+                raise QueueFullError(f"render queue is full ({self.max_queued} jobs waiting)")
+            self._start_workers()
+            heapq.heappush(self._heap, (priority, next(self._counter), key, data))
+            self._condition.notify()
+            return self._position(key)
+
+    def _position(self, key) -> int | None:
+        ordered = sorted(self._heap)
+        for position, job in enumerate(ordered):
+            if job[2] == key:
+                return position
+        return None
+
+    def position(self, key) -> int | None:
+        '''
+        Returns how many jobs will run before this one, or None if it is not waiting
+        '''
+        with self._condition:
+            return self._position(key)
+
+    def depth(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                _, _, _, data = heapq.heappop(self._heap)
+                self.active += 1
+            try:
+                self.handler(data)
+            except Exception as e:
+                print(f"Render failed: {e}")
+                metrics.inc("motionlab_render_failures_total")
+            finally:
+                with self._condition:
+                    self.active -= 1
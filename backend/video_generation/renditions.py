@@ -0,0 +1,100 @@
+import os
+import shutil
+from utils.lazy_import import lazy_module
+
+ffmpeg = lazy_module("ffmpeg")
+
+# when set, the encode that writes final.mp4 also cuts it into an HLS playlist with short segments (sessionDir/hls)
+OUTPUT_HLS = os.environ.get("OUTPUT_HLS", "0") == "1"
+HLS_SEGMENT_SECONDS = int(os.environ.get("HLS_SEGMENT_SECONDS", 4))
+# when set, a low bitrate copy of the video is encoded in the same ffmpeg pass (sessionDir/preview.mp4)
+PREVIEW_RENDITION = os.environ.get("PREVIEW_RENDITION", "0") == "1"
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", 360))
+PREVIEW_BITRATE = os.environ.get("PREVIEW_BITRATE", "400k")
+# a jpeg of the frame POSTER_SECONDS in, also from the same pass (sessionDir/poster.jpg)
+POSTER = os.environ.get("POSTER", "1") == "1"
+POSTER_SECONDS = 0.5
+
+# mp4 flags that let a file be read (and uploaded) before ffmpeg finishes writing it
+fragmented_movflags = "frag_keyframe+empty_moov+default_base_moof"
+# a plain mp4 gets its index (moov) moved to the front once it is written, so players can start before
+# they have the whole file
+faststart_movflags = "+faststart"
+
+
+def remove_outputs(session_dir: str):
+    '''
+    Removes final.mp4 and everything made along with it by a previous render of the session
+    (so none of it can be uploaded as part of the next render)
+    '''
+    for name in ["final.mp4", "preview.mp4", "poster.jpg"]:
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(os.path.join(session_dir, "hls"), ignore_errors=True)
+
+
+def final_output(session_dir: str, fragmented: bool = False) -> tuple[str, dict]:
+    '''
+    The ffmpeg target and options for sessionDir/final.mp4 (and its HLS playlist, if OUTPUT_HLS is set)
+
+    The HLS segments are cut from the same encoded stream through the tee muxer, so nothing is encoded twice.
+    '''
+    final_video = os.path.join(session_dir, "final.mp4")
+    movflags = fragmented_movflags if fragmented else faststart_movflags
+    if not OUTPUT_HLS:
+        return final_video, {"movflags": movflags}
+    hls_dir = os.path.join(session_dir, "hls")
+    # segments of a previous (longer) render of this session must not be uploaded with this one
+    shutil.rmtree(hls_dir, ignore_errors=True)
+    os.makedirs(hls_dir)
+    hls_options = ":".join([
+        "f=hls",
+        f"hls_time={HLS_SEGMENT_SECONDS}",
+        "hls_playlist_type=vod",
+        f"hls_segment_filename={os.path.join(hls_dir, 'segment%03d.ts')}",
+    ])
+    target = f"[f=mp4:movflags={movflags}]{final_video}|[{hls_options}]{os.path.join(hls_dir, 'index.m3u8')}"
+    return target, {"format": "tee"}
+
+
+def extra_outputs(video, audio, session_dir: str) -> list:
+    '''
+    The preview rendition and poster outputs to run along with the final video's output (ffmpeg.merge_outputs)
+    '''
+    outputs = []
+    if PREVIEW_RENDITION:
+        outputs.append(ffmpeg.output(
+            video, audio, os.path.join(session_dir, "preview.mp4"),
+            vcodec="libx264", pix_fmt="yuv420p", preset="veryfast", vf=f"scale=-2:'min({PREVIEW_HEIGHT},ih)'",
+            movflags=faststart_movflags, acodec="aac",
+            **{"b:v": PREVIEW_BITRATE, "maxrate": PREVIEW_BITRATE, "bufsize": PREVIEW_BITRATE, "b:a": "64k"}))
+    if POSTER:
+        outputs.append(ffmpeg.output(video, os.path.join(session_dir, "poster.jpg"), ss=POSTER_SECONDS, vframes=1,
+                                     **{"q:v": 3}))
+    return outputs
+
+
+def rendition_files(session_dir: str, bucket_path: str) -> list[tuple[str | None, str, str, str]]:
+    '''
+    (info field, local path, bucket path, content type) of every file made along with final.mp4, in upload order
+
+    The field is None for files only referenced by another one (the HLS segments, listed before their playlist).
+    '''
+    files = []
+    if OUTPUT_HLS:
+        hls_dir = os.path.join(session_dir, "hls")
+        if os.path.isfile(os.path.join(hls_dir, "index.m3u8")):
+            # the playlist refers to its segments by name, so they sit next to it in the bucket
+            for name in sorted(os.listdir(hls_dir)):
+                if name.endswith(".ts"):
+                    files.append((None, os.path.join(hls_dir, name), f"{bucket_path}_hls/{name}", "video/mp2t"))
+            files.append(("hls_url", os.path.join(hls_dir, "index.m3u8"), f"{bucket_path}_hls/index.m3u8",
+                          "application/vnd.apple.mpegurl"))
+    if PREVIEW_RENDITION and os.path.isfile(os.path.join(session_dir, "preview.mp4")):
+        files.append(("preview_url", os.path.join(session_dir, "preview.mp4"), f"{bucket_path}_preview",
+                      "video/mp4"))
+    if POSTER and os.path.isfile(os.path.join(session_dir, "poster.jpg")):
+        files.append(("poster_url", os.path.join(session_dir, "poster.jpg"), f"{bucket_path}_poster",
+                      "image/jpeg"))
+    return files
@@ -0,0 +1,108 @@
+import os
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from utils.lazy_import import lazy_module
+
+ffmpeg = lazy_module("ffmpeg")
+
+# frames per segment (10 s at 60 fps), every segment starts on its own keyframe
+SEGMENT_FRAMES = int(os.environ.get("SEGMENT_FRAMES", 600))
+# how many segments are encoded at once (each one is its own ffmpeg process)
+SEGMENT_WORKERS = int(os.environ.get("SEGMENT_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# renders with at least this many frames are encoded in segments
+SEGMENT_THRESHOLD = int(os.environ.get("SEGMENT_THRESHOLD", 1800))
+
+
+def segment_ranges(total_frames: int, segment_frames: int) -> list[tuple[int, int]]:
+    '''
+    Splits [0, total_frames) into (start, frame count) ranges
+    '''
+    return [(start, min(segment_frames, total_frames - start)) for start in range(0, total_frames, segment_frames)]
+
+
+def encode_segment(frame_pattern: str, start: int, frame_count: int, output: str, fps: int = 60, threads: int = 0,
+                   output_options: dict | None = None):
+    '''
+    Encodes frame_count frames starting at frame number start into its own file
+    '''
+    options = {"threads": threads, **(output_options or {})}
+    ffmpeg.input(frame_pattern, framerate=fps, start_number=start) \
+        .output(output, vframes=frame_count, vcodec='libx264', pix_fmt='yuv420p', r=fps,
+                loglevel='quiet', **options) \
+        .overwrite_output() \
+        .run()
+
+
+def concat_segments(segment_paths: list[str], output_video: str):
+    '''
+    Joins encoded segments with ffmpeg's concat demuxer, without re-encoding
+    '''
+    list_path = output_video + ".segments.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        ffmpeg.input(list_path, format='concat', safe=0) \
+            .output(output_video, c='copy', loglevel='quiet') \
+            .overwrite_output() \
+            .run()
+    finally:
+        os.remove(list_path)
+
+
+def encode_segments(session_dir: str, total_frames: int, fps: int = 60, segment_frames: int = SEGMENT_FRAMES,
+                    workers: int = SEGMENT_WORKERS, on_segment=None, output_options: dict | None = None,
+                    cache=None):
+    '''
+    Encodes a session's frames in keyframe-aligned segments concurrently, then joins them into sessionDir/output.mp4
+
+    on_segment(done, total) is called every time a segment finishes. With a RenderCache, segments whose
+    frames and settings did not change since the last render are reused instead of encoded again.
+    Returns the time it took.
+    '''
+    start_time = time.time()
+    frame_pattern = os.path.join(session_dir, "frames", "frame%04d.png")
+    segment_dir = os.path.join(session_dir, "segments")
+    os.makedirs(segment_dir, exist_ok=True)
+    output_video = os.path.join(session_dir, "output.mp4")
+
+    ranges = segment_ranges(total_frames, segment_frames)
+    segment_paths = [os.path.join(segment_dir, f"segment{index:04d}.mp4") for index in range(len(ranges))]
+    # splitting the cores between the segments running at the same time (unless the options set a thread count)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    output_options = {key: value for key, value in (output_options or {}).items()
+                      if not (key == "threads" and not value)}
+    # what a segment's encode depends on besides its frames (the thread count does not change the quality)
+    settings = {"fps": fps, "vcodec": "libx264", "pix_fmt": "yuv420p",
+                **{key: value for key, value in output_options.items() if key != "threads"}}
+
+    def make_segment(start: int, count: int, path: str) -> str:
+        if cache is None:
+            encode_segment(frame_pattern, start, count, path, fps, threads, output_options)
+            return path
+        key = cache.segment_key([frame_pattern % frame for frame in range(start, start + count)], settings)
+        cached_path = cache.get_segment(key)
+        if cached_path is not None:
+            return cached_path
+        encode_segment(frame_pattern, start, count, path, fps, threads, output_options)
+        return cache.put_segment(key, path)
+
+    done = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(make_segment, start, count, path)
+                       for (start, count), path in zip(ranges, segment_paths)]
+            for index, future in enumerate(futures):
+                segment_paths[index] = future.result()
+                done += 1
+                if on_segment is not None:
+                    on_segment(done, len(ranges))
+        concat_segments(segment_paths, output_video)
+        print(f"Encoded {len(ranges)} segments and saved to {output_video}")
+        if cache is not None:
+            print(f"Render cache: {cache.stats()}")
+            cache.evict(keep=set(segment_paths))
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    return time.time() - start_time
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import fcntl
+import base64
+import hashlib
+import threading
+from utils.lazy_import import lazy_module
+
+requests = lazy_module("requests")
+
+TUS_VERSION = "1.0.0"
+# supabase only accepts 6 MB chunks (except for the last one), so adaptive sizing scales in whole multiples of this
+BASE_CHUNK_SIZE = 6 * 1024 * 1024
+MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", 8 * BASE_CHUNK_SIZE))
+ADAPTIVE_CHUNKS = os.environ.get("UPLOAD_ADAPTIVE_CHUNKS", "0") == "1"
+# how long we want each chunk to take when sizing adaptively
+TARGET_CHUNK_SECONDS = 2.0
+# where in-progress uploads are remembered, so they can be resumed after a restart
+UPLOAD_STATE_DIR = os.environ.get("UPLOAD_STATE_DIR", "../cache/uploads")
+TIMEOUT = 60
+
+# held by the one worker process that resumes the interrupted uploads, see claim_pending_uploads
+_resume_lock_file = None
+
+
+class TusError(Exception):
+    pass
+
+
+class UploadAborted(Exception):
+    pass
+
+
+def encode_metadata(metadata: dict) -> str:
+    return ",".join(f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in metadata.items())
+
+
+class TusUploader:
+    '''
+    Minimal tus (resumable upload) client that keeps one pooled, keep-alive session for every upload
+
+    Supports resuming an upload from its persisted url, chunk sizes that follow the measured
+    throughput, and uploading a file that is still being written (with a deferred length).
+    '''
+
+    def __init__(self, endpoint: str, headers: dict):
+        self.endpoint = endpoint
+        self.headers = {"Tus-Resumable": TUS_VERSION, **headers}
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def create(self, metadata: dict, length: int | None) -> str:
+        '''
+        Creates an upload and returns its url (a None length defers it until the last chunk)
+        '''
+        headers = {**self.headers, "Upload-Metadata": encode_metadata(metadata)}
+        if length is None:
+            headers["Upload-Defer-Length"] = "1"
+        else:
+            headers["Upload-Length"] = str(length)
+        response = self.session.post(self.endpoint, headers=headers, timeout=TIMEOUT)
+        if response.status_code != 201:
+            raise TusError(f"could not create upload: HTTP {response.status_code} {response.text}")
+        return requests.compat.urljoin(self.endpoint, response.headers["Location"])
+
+    def offset(self, url: str) -> int | None:
+        '''
+        Returns how much of an upload the server has, or None if it does not know the upload anymore
+        '''
+        response = self.session.head(url, headers=self.headers, timeout=TIMEOUT)
+        if response.status_code in (404, 410):
+            return None
+        if response.status_code not in (200, 204):
+            raise TusError(f"could not resume upload: HTTP {response.status_code}")
+        return int(response.headers["Upload-Offset"])
+
+    def patch(self, url: str, offset: int, data: bytes, length: int | None = None) -> int:
+        headers = {**self.headers, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}
+        if length is not None:
+            # sent along with the last chunk of an upload whose length was deferred
+            headers["Upload-Length"] = str(length)
+        response = self.session.patch(url, headers=headers, data=data, timeout=TIMEOUT)
+        if response.status_code != 204:
+            raise TusError(f"could not upload chunk at {offset}: HTTP {response.status_code} {response.text}")
+        return int(response.headers["Upload-Offset"])
+
+
+def state_path(key: str) -> str:
+    return os.path.join(UPLOAD_STATE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+def load_state(key: str) -> dict | None:
+    try:
+        with open(state_path(key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(key: str, state: dict):
+    os.makedirs(UPLOAD_STATE_DIR, exist_ok=True)
+    temp_path = state_path(key) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path(key))
+
+
+def remove_state(key: str):
+    if os.path.exists(state_path(key)):
+        os.remove(state_path(key))
+
+
+def pending_uploads() -> list[dict]:
+    '''
+    Returns the persisted state of every upload that did not finish (e.g. because we restarted)
+    '''
+    if not os.path.isdir(UPLOAD_STATE_DIR):
+        return []
+    states = []
+    for name in os.listdir(UPLOAD_STATE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(UPLOAD_STATE_DIR, name)) as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return states
+
+
+def claim_pending_uploads() -> bool:
+    '''
+    Returns True in the first worker process to ask, so interrupted uploads are resumed only once
+
+    The claim is an exclusive lock on a file next to the upload states, held until the process exits.
+    '''
+    global _resume_lock_file
+    if _resume_lock_file is not None:
+        return True
+    os.makedirs(UPLOAD_STATE_DIR, exist_ok=True)
+    lock_file = open(os.path.join(UPLOAD_STATE_DIR, "resume.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _resume_lock_file = lock_file
+    return True
+
+
+def next_chunk_size(chunk_size: int, chunk_bytes: int, seconds: float) -> int:
+    '''
+    Sizes the next chunk so it takes about TARGET_CHUNK_SECONDS at the throughput we just measured
+    '''
+    if not ADAPTIVE_CHUNKS or seconds <= 0:
+        return chunk_size
+    target = chunk_bytes / seconds * TARGET_CHUNK_SECONDS
+    multiples = max(1, min(int(target // BASE_CHUNK_SIZE), MAX_CHUNK_SIZE // BASE_CHUNK_SIZE))
+    return multiples * BASE_CHUNK_SIZE
+
+
+def upload_file(uploader: TusUploader, path: str, key: str, metadata: dict, extra_state: dict | None = None,
+                on_progress=None, finished: threading.Event | None = None,
+                failed: threading.Event | None = None, created: threading.Event | None = None) -> list[dict]:
+    '''
+    Uploads a file in chunks and returns the timing of every chunk
+
+    key identifies the upload across restarts: if an upload with the same key and file was
+    interrupted, it continues from the offset the server already has (extra_state is stored
+    with it, for whoever resumes it). If finished is given, the file is still being written
+    (e.g. a fragmented mp4) and we upload full chunks as they appear until finished is set and
+    the rest of the file is sent. With finished, created is set by the writer once any older file
+    at path is gone, so only a file that appears after that is read. If failed is set by the time
+    finished is, the file was never completed, so the upload is abandoned with UploadAborted (and
+    nothing is saved for it to be resumed). on_progress(sent, total) is called after every chunk,
+    with a total of None while the file is still growing.
+    '''
+    url = None
+    offset = 0
+    deferred = finished is not None
+    state = load_state(key)
+    if state is not None and not deferred and state["path"] == path \
+            and state["size"] == os.path.getsize(path) and state["mtime"] == os.path.getmtime(path):
+        url = state["url"]
+        offset = uploader.offset(url)
+        deferred = state.get("deferred", False)
+        if offset is None:
+            url, offset, deferred = None, 0, False
+        else:
+            print(f"Resuming upload of {path} at {offset} bytes")
+
+    if url is None:
+        url = uploader.create(metadata, None if deferred else os.path.getsize(path))
+
+    chunks = []
+    chunk_size = BASE_CHUNK_SIZE
+    length_sent = not deferred
+    state_saved = False
+    # a file that is still to be written may not exist yet (ffmpeg creates it once its inputs are ready)
+    while finished is not None and not finished.is_set() \
+            and not ((created is None or created.is_set()) and os.path.exists(path)):
+        time.sleep(0.2)
+    if failed is not None and failed.is_set():
+        raise UploadAborted(f"{path} was not written completely")
+    with open(path, "rb") as file:
+        while True:
+            done_writing = finished is None or finished.is_set()
+            if done_writing and failed is not None and failed.is_set():
+                raise UploadAborted(f"{path} was not written completely")
+            size = os.path.getsize(path)
+            if done_writing and not state_saved:
+                # the file is complete, so we remember where this upload is in case we get interrupted
+                save_state(key, {"url": url, "path": path, "size": size, "mtime": os.path.getmtime(path),
+                                 "deferred": deferred, "key": key, "metadata": metadata, **(extra_state or {})})
+                state_saved = True
+            if done_writing and offset >= size:
+                if not length_sent:
+                    # telling the server the final length of a deferred upload
+                    uploader.patch(url, offset, b"", length=size)
+                break
+            if not done_writing and size - offset < chunk_size:
+                # waiting for a full chunk to be written (every chunk but the last must be full)
+                time.sleep(0.2)
+                continue
+            file.seek(offset)
+            data = file.read(chunk_size)
+            last = done_writing and offset + len(data) >= size
+            start = time.time()
+            offset = uploader.patch(url, offset, data, length=size if last and not length_sent else None)
+            elapsed = time.time() - start
+            length_sent = length_sent or last
+            chunks.append({"offset": offset - len(data), "bytes": len(data), "time": elapsed})
+            if on_progress is not None:
+                on_progress(offset, size if done_writing else None)
+            chunk_size = next_chunk_size(chunk_size, len(data), elapsed)
+    remove_state(key)
+    return chunks
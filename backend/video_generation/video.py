@@ -1,79 +1,116 @@
 import os
-from flask import Blueprint, request, jsonify
-import requests
-import ffmpeg
-from pydub import AudioSegment
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
 import time
-from tusclient import client
-from user.auth import supabase
-import pytz
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from user.auth import get_supabase, get_plan
+from utils.audio_cache import audio_cache
+from utils.gif_cache import gif_cache
+from utils.metrics import metrics, measure_stage, cprofile_dump
+from utils.audio_prefetch import prefetch_audio
+from utils.lazy_import import lazy_module
+from utils.sequence_pack import remove_packs
+from video_generation.frame_stream import finish_stream, check_stream
+from video_generation.segments import encode_segments, SEGMENT_THRESHOLD
+from video_generation.profiles import select_profile, video_options, audio_options
+from video_generation.render_cache import RenderCache, RENDER_CACHE, RENDER_SEGMENT_CACHE, link_or_copy
+from video_generation.render_queue import RenderQueue, QueueFullError, plan_priority
+from video_generation.progress_store import create_progress_store
+from video_generation.ffmpeg_progress import run_with_progress
+from video_generation.outbox import Outbox
+from video_generation.renditions import final_output, extra_outputs, rendition_files, remove_outputs
+from video_generation.uploader import TusUploader, UploadAborted, upload_file, pending_uploads, claim_pending_uploads
 import datetime
 import shutil
-import threading
+
+# imported the first time a render needs them, so a worker that only serves files never loads them
+ffmpeg = lazy_module("ffmpeg")
+pydub = lazy_module("pydub")
+pytz = lazy_module("pytz")
+mixer = lazy_module("video_generation.mixer")
+renderer = lazy_module("renderer.render")
 
 # containing the progress of each user's session's video and info related to it
-hashmap = {}
+progress_store = create_progress_store()
 
-# video blueprint
-video_bp = Blueprint("video_bp", __name__)
+# fields of a render's info that are sent to the client but are not columns of the Videos table
+info_only_fields = {"audio_fetch", "upload_chunks", "hls_url", "preview_url", "poster_url"}
 
+# rows for the Videos table wait here until the background flusher inserts them
+# (get_supabase is looked up on every flush, so the benchmarks can swap in their stub)
+# (a retried Videos row is looked up by the render_id we generated for it, see record_render)
+outbox = Outbox(os.environ.get("OUTBOX_DB", "../outbox.db"), lambda: get_supabase(),
+                match_columns={"Videos": ("render_id",)})
 
-def download_audio_file(url: str, path: str):
-    '''
-    Downloads mp3 file
-    '''
-    query_params = {"downloadformat": "mp3"}
-    response = requests.get(url, params=query_params)
-    if response.status_code == 200:
-        with open(path, 'wb') as file:
-            file.write(response.content)
-    else:
-        print(f"Failed to download audio: HTTP {response.status_code}")
+# uploads run as their own stage, so a render worker can start encoding the next video right away
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 2))
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+# when set, final.mp4 is written as a fragmented mp4 and uploaded while ffmpeg is still writing it
+STREAM_UPLOAD = os.environ.get("STREAM_UPLOAD", "0") == "1"
+
+# a progress stream is closed after this many seconds so it can not hold a worker thread forever
+# (EventSource reconnects on its own, and the new stream picks up where this one stopped)
+RENDER_EVENTS_MAX_SECONDS = int(os.environ.get("RENDER_EVENTS_MAX_SECONDS", 10 * 60))
+
+# when set, every render is profiled with cProfile and its stats are written to this directory
+RENDER_CPROFILE_DIR = os.environ.get("RENDER_CPROFILE_DIR")
+
+# video blueprint
+video_bp = Blueprint("video_bp", __name__)
 
 
+@measure_stage("generate_audio")
 def generate_audio(audio_timeline: list[dict], duration: int, session_dir: str):
     '''
     Makes an audio file given the audio timeline
     '''
     start_time = time.time()
     # audio_timeline = [{"audio": url, "frame": int}, {"audio": url, "frame": int}]
-    # Create an empty audio segment to start with (duration is in ms)
-    final_audio = AudioSegment.silent(duration=duration * 1000)
-
-    # Add each audio file to the timeline
-    for index, entry in enumerate(audio_timeline):
-        # {"audio": url, "frame": int}
-        # Load the audio file
-        audio_location: str = str(entry["audio"])
-        # in session/audio directory, add audio_{index}
-        audio_dir: str = os.path.join(session_dir, "audio")
-        audio_path: str = os.path.join(audio_dir, "sound_" + str(index))
-        download_audio_file(audio_location, audio_path)
-
-        # formatting audio file
-        audio = AudioSegment.from_mp3(audio_path)
-        if ("audio_duration" in entry.keys()):
-            audio = audio[0:entry["audio_duration"]]
-        # start time of audio position in MILLISECONDS
-        # going from frame to MS: frame / 60 * 1000 = frame * 1000 // 60
-        audio_position: int = int(entry["frame"]) * 1000 // 60
-
-        # Overlay the audio at the correct position
-        final_audio = final_audio.overlay(audio, position=audio_position)
-
-    # Export the final combined audio to a file
-    output_audio = os.path.join(session_dir, "output.mp3")
-    final_audio.export(output_audio, format="mp3")
+    urls = [str(entry["audio"]) for entry in audio_timeline]
+    # static clips are already decoded in the shared cache, so they are not fetched again
+    missing = [url for url in urls if not audio_cache.has_url(url)]
+    # downloading (or locating on disk) every distinct file at once
+    paths, fetch_report = prefetch_audio(missing, os.path.join(session_dir, "audio"))
+
+    # decoded clips for this render
+    clips: dict[str, pydub.AudioSegment] = {}
+    for url in dict.fromkeys(urls):
+        clip = audio_cache.get_clip(url, paths.get(url))
+        if clip is not None:
+            clips[url] = clip
+    # any sound we could not fetch is left out of the mix instead of failing the render
+    audio_timeline = [entry for entry in audio_timeline if str(entry["audio"]) in clips]
+
+    # placing every clip at its frame position (duration is in seconds)
+    final_audio = mixer.mix_timeline(audio_timeline, clips, duration)
+
+    # Export the final combined audio to a file (uncompressed, since it is encoded again with the video)
+    output_audio = os.path.join(session_dir, "output.wav")
+    # a render that failed before clean_up can leave output.wav hard linked to a cached mix,
+    # which writing it in place would overwrite
+    if os.path.exists(output_audio):
+        os.remove(output_audio)
+    final_audio.export(output_audio, format="wav")
     print(f"Audio has been generated and saved to {output_audio}")
+    print(f"Audio cache: {audio_cache.stats()}")
     time_elapsed = time.time() - start_time
-    return time_elapsed
+    return time_elapsed, fetch_report
 
 
 # Function to generate a video from the PNG frames
-def combine_frames(session_dir: str):
+@measure_stage("combine_frames")
+def combine_frames(session_dir: str, total_frames: int | None = None, on_segment=None, profile: str | None = None,
+                   cache: RenderCache | None = None):
     '''
     Concatenates all the frames in a video session's frame directory to make a video
+    Long videos (at least SEGMENT_THRESHOLD frames) are encoded in segments concurrently, see segments.py
+    With a render cache, the video is always encoded in segments so unchanged ones can be reused
     '''
+    if total_frames is not None and (cache is not None or total_frames >= SEGMENT_THRESHOLD):
+        return encode_segments(session_dir, total_frames, on_segment=on_segment,
+                               output_options=video_options(profile), cache=cache)
     start_time = time.time()
     # where the frames are located
     frame_dir = os.path.join(session_dir, "frames")
@@ -83,12 +120,15 @@ def combine_frames(session_dir: str):
     output_video = os.path.join(session_dir, "output.mp4")
     try:
         ffmpeg.input(frame_pattern, framerate=60) \
-            .output(output_video, vcodec='libx264', pix_fmt='yuv420p', r=60, loglevel='quiet') \
+            .output(output_video, vcodec='libx264', pix_fmt='yuv420p', r=60, loglevel='quiet',
+                    **video_options(profile)) \
+            .overwrite_output() \
             .run()  # Execute the FFmpeg command
 
         print(f"Frame sequence generated and saved to {output_video}")
     except ffmpeg.Error as e:
         print(f"Error during video creation: {e}")
+        raise
     time_elapsed = time.time() - start_time
     return time_elapsed
 
@@ -100,78 +140,186 @@ def clean_up(session_dir: str):
     asset_dir = os.path.join(session_dir, "assets")
     audio_dir = os.path.join(session_dir, "audio")
     frame_dir = os.path.join(session_dir, "frames")
-    # removing all the intermediate directories
-    shutil.rmtree(frame_dir)
-    shutil.rmtree(audio_dir)
-    shutil.rmtree(asset_dir)
+    # removing all the intermediate directories (the frame directory is optional)
+    for directory in [frame_dir, audio_dir, asset_dir]:
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+    # along with the packed frame sequences of the session's assets
+    remove_packs(asset_dir)
 
     # removing intermediate video and audio file
-    output_audio = os.path.join(session_dir, "output.mp3")
+    output_audio = os.path.join(session_dir, "output.wav")
     output_video = os.path.join(session_dir, "output.mp4")
     for file in [output_video, output_audio]:
-        if file:
+        if os.path.exists(file):
             os.remove(file)
     print("Cleaned up intermediate files")
 
 
-def generate_video(session_dir: str):
+@measure_stage("generate_video")
+def generate_video(session_dir: str, fragmented: bool = False, profile: str | None = None, started=None):
+    '''
+    Adds the audio to an already encoded muted video (sessionDir/output.mp4)
+    The video stream is copied as is, so only the audio gets encoded (along with the preview and poster)
+    started (a threading.Event) is set once the previous render's outputs are gone and the new ones are written
+    '''
     start_time = time.time()
-    output_audio = os.path.join(session_dir, "output.mp3")
+    output_audio = os.path.join(session_dir, "output.wav")
     output_video = os.path.join(session_dir, "output.mp4")
     final_video = os.path.join(session_dir, "final.mp4")
 
+    # a failed mux must not leave the previous render's video behind to be uploaded as this one
+    remove_outputs(session_dir)
+    if started is not None:
+        started.set()
     audio = ffmpeg.input(output_audio)
     video = ffmpeg.input(output_video)
-    ffmpeg.output(video, audio, final_video, vcodec='libx264',
-                  acodec='aac', strict='experimental', loglevel='quiet').run()
+    target, options = final_output(session_dir, fragmented)
+    ffmpeg.merge_outputs(
+        ffmpeg.output(video, audio, target, vcodec='copy', loglevel='quiet', **audio_options(profile), **options),
+        *extra_outputs(video, audio, session_dir)).overwrite_output().run()
     # if the audio sounds weird when you upload the video, change the audio codec
     print("Final video generated and saved to", final_video)
     video_integration_time = time.time() - start_time
     return final_video, video_integration_time
 
 
-def upload_video(file, user, session):
+@measure_stage("encode_video")
+def encode_video(session_dir: str, on_frame=None, fragmented: bool = False, profile: str | None = None,
+                 started=None):
     '''
-    Uploads a completed video to a user's video folder inside their bucket
-    Then returns the URL of the generated video
+    Encodes the frame sequence and the generated audio straight into the final video in a single ffmpeg pass
+    on_frame(frame) is called with ffmpeg's encoded frame count as the encode goes
+    started (a threading.Event) is set once the previous render's outputs are gone and the new ones are written
     '''
     start_time = time.time()
+    frame_pattern = os.path.join(session_dir, "frames", "frame%04d.png")
+    output_audio = os.path.join(session_dir, "output.wav")
+    final_video = os.path.join(session_dir, "final.mp4")
 
-    # initialize the TUS client
-    tus_client = client.TusClient(
-        f"{supabase.supabase_url}/storage/v1/upload/resumable",
-        headers={"Authorization": f"Bearer {
-            supabase.supabase_key}", "x-upsert": "true"},
-    )
+    # a failed encode must not leave the previous render's video behind to be uploaded as this one
+    remove_outputs(session_dir)
+    if started is not None:
+        started.set()
+    video = ffmpeg.input(frame_pattern, framerate=60)
+    audio = ffmpeg.input(output_audio)
+    target, options = final_output(session_dir, fragmented)
+    try:
+        report = run_with_progress(
+            ffmpeg.merge_outputs(
+                ffmpeg.output(video, audio, target, vcodec='libx264', pix_fmt='yuv420p', r=60, loglevel='quiet',
+                              **video_options(profile), **audio_options(profile), **options),
+                *extra_outputs(video, audio, session_dir)).overwrite_output(),
+            on_frame)
+        if report.get("fps"):
+            metrics.observe("motionlab_ffmpeg_encode_fps", float(report["fps"]), profile=profile)
+        print("Final video generated and saved to", final_video)
+    except ffmpeg.Error as e:
+        print(f"Error during video creation: {e}")
+        raise
+    time_elapsed = time.time() - start_time
+    return final_video, time_elapsed
+
+
+_tus_uploader = None
+_tus_lock = threading.Lock()
+
+
+def get_tus_uploader() -> TusUploader:
+    '''
+    Returns the TUS client shared by every upload in this process (so connections are reused)
+    '''
+    global _tus_uploader
+    with _tus_lock:
+        if _tus_uploader is None:
+            supabase = get_supabase()
+            _tus_uploader = TusUploader(
+                f"{supabase.supabase_url}/storage/v1/upload/resumable",
+                headers={"Authorization": f"Bearer {supabase.supabase_key}", "x-upsert": "true"},
+            )
+        return _tus_uploader
+
+
+@measure_stage("upload_video")
+def upload_video(path, user, session, on_progress=None, finished=None, extra_state=None, failed=None,
+                 created=None):
+    '''
+    Uploads a completed video to a user's video folder inside their bucket
+    Then returns the URL of the generated video, the upload time and the timing of every chunk
+    If finished is given, the video is still being written and is uploaded as it grows
+    (only once created is set, and abandoned with UploadAborted if failed is set, because the encode did not complete)
+    '''
+    start_time = time.time()
 
     # each user gets their own separate folder for videos
     bucket_path = f"{user}/video_" + session
-    uploader = tus_client.uploader(
-        file_stream=file,
-        chunk_size=(6 * 1024 * 1024),
+    chunks = upload_file(
+        get_tus_uploader(),
+        path,
+        key=bucket_path,
         metadata={
             "bucketName": "videos",
             "objectName": bucket_path,
             "contentType": "video/mp4",
             "cacheControl": "3600",
         },
+        extra_state=extra_state,
+        on_progress=on_progress,
+        finished=finished,
+        failed=failed,
+        created=created,
     )
-    uploader.upload()
     # retrieving public url for the video we just uploaded
-    video_url = supabase.storage.from_("videos").get_public_url(bucket_path)
+    video_url = get_supabase().storage.from_("videos").get_public_url(bucket_path)
     print(f"Uploaded video to supabase at videos/{bucket_path}")
     upload_time = time.time() - start_time
-    return video_url, upload_time
+    return video_url, upload_time, chunks
+
+
+@measure_stage("upload_renditions")
+def upload_renditions(session_dir, user, session):
+    '''
+    Uploads the HLS playlist and segments, preview and poster made along with a video (see renditions.py)
+    Then returns their URLs by info field, the upload time and the timing of every chunk
+    '''
+    start_time = time.time()
+    urls = {}
+    chunks = []
+    for field, path, bucket_path, content_type in rendition_files(session_dir, f"{user}/video_" + session):
+        chunks += upload_file(
+            get_tus_uploader(),
+            path,
+            key=bucket_path,
+            metadata={
+                "bucketName": "videos",
+                "objectName": bucket_path,
+                "contentType": content_type,
+                "cacheControl": "3600",
+            },
+        )
+        if field is not None:
+            urls[field] = get_supabase().storage.from_("videos").get_public_url(bucket_path)
+    return urls, time.time() - start_time, chunks
 
 
 @video_bp.route("/video/render_progress", methods=["POST"])
 def get_progress():
     '''
     Returns the progress of the video for a given user and session
+    While the render is waiting for a worker, this also returns its position in the queue
     '''
-    global hashmap
     data = request.get_json()
-    return jsonify({"progress": hashmap[data["userID"]][data["sessionID"]]["progress"]})
+    entry = progress_store.get(data["userID"], data["sessionID"])
+    if entry is None:
+        return jsonify({"message": "no render for this session"}), 404
+    response = {"progress": entry["progress"]}
+    if entry["error"] is not None:
+        # the render failed, its progress will not move anymore
+        response["error"] = entry["error"]
+    queue_position = render_queue.position((data["userID"], data["sessionID"]))
+    if queue_position is not None:
+        response["queue_position"] = queue_position
+    return jsonify(response)
 
 
 @video_bp.route("/video/get_info", methods=["POST"])
@@ -179,60 +327,214 @@ def get_info():
     '''
     Returns the finished video information 
     '''
-    global hashmap
     data = request.get_json()
-    info = hashmap[data["userID"]][data["sessionID"]]["info"]
-    # removing the data from our map since we're done with it
-    del hashmap[data["userID"]][data["sessionID"]]
-    if len(hashmap[data["userID"]].keys()) == 0:
-        del hashmap[data["userID"]]
-    return jsonify(info), 200
+    entry = progress_store.get(data["userID"], data["sessionID"])
+    if entry is None or entry["info"] is None:
+        return jsonify({"message": "no finished render for this session"}), 404
+    # the entry is not removed here, it expires on its own once the render has been finished for a while
+    return jsonify(entry["info"]), 200
+
+
+@video_bp.route("/video/render_events/<userID>/<sessionID>", methods=["GET"])
+def render_events(userID, sessionID):
+    '''
+    Streams the progress of a render as server-sent events until it finishes
+    Every change is sent as a "progress" event, and the last event ("done") carries the finished video information
+    A failed render ends the stream with an "error" event instead
+    '''
+    def events():
+        last_update = None
+        started = last_sent = time.time()
+        while time.time() - started < RENDER_EVENTS_MAX_SECONDS:
+            entry = progress_store.get(userID, sessionID)
+            if entry is None:
+                yield "event: error\ndata: {\"message\": \"no render for this session\"}\n\n"
+                return
+            if entry["error"] is not None:
+                yield f"event: error\ndata: {json.dumps({'message': entry['error']})}\n\n"
+                return
+            if entry["updated_at"] != last_update:
+                last_update = entry["updated_at"]
+                last_sent = time.time()
+                message = {"progress": entry["progress"]}
+                queue_position = render_queue.position((userID, sessionID))
+                if queue_position is not None:
+                    message["queue_position"] = queue_position
+                if entry["progress"] >= 100:
+                    message["info"] = entry["info"]
+                    yield f"event: done\ndata: {json.dumps(message)}\n\n"
+                    return
+                yield f"event: progress\ndata: {json.dumps(message)}\n\n"
+            elif time.time() - last_sent > 15:
+                # comment line so proxies do not close an idle connection
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(0.1)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
 
 
 def render_video(data):
     '''
     progress timeline
-    0 - 75 frame write (happens on express server)
+    0 - 75 frame write (happens on express server, or here for server renders, see renderer/)
     75 - 85 audio creation
-    85 - 90 frame combination 
-    90 - 95 gen vid
-    95 - 100 upload
+    85 - 95 frame encoding and audio muxing (one ffmpeg pass, or segments then a mux for long videos)
+    95 - 100 upload (runs on the upload executor, see finish_render)
     '''
-    global hashmap
     userID = data["userID"]
     sessionID = data["sessionID"]
+    # the encoder settings (speed/quality tier) of this render, limited by the plan queue_render looked up
+    profile = select_profile(data.get("profile"), data.get("plan"))
+
+    # the session's audio mix and encoded segments from its previous renders
+    cache = RenderCache(data["sessionDir"]) if RENDER_CACHE else None
+    segment_cache = cache if RENDER_SEGMENT_CACHE else None
+
+    if data.get("serverRender", False):
+        # drawing and encoding the frames here instead of on the express server
+        # (this fills in the audio timeline and the rest of what the express server would have sent)
+        def report_server_frame(frame: int, total: int):
+            progress_store.set(userID, sessionID, progress=75 * frame / total)
+
+        renderer.render_session(data, report_server_frame)
+
+    progress_store.set(userID, sessionID, progress=75)  # we start at 75
+
+    # generating audio (saved to sessionDir/output.wav), unless the timeline did not change since the last render
+    output_audio = os.path.join(data["sessionDir"], "output.wav")
+    audio_key = cache.audio_key(data["audioTimeline"], data["duration"]) if cache is not None else None
+    cached_audio = cache.get_audio(audio_key) if cache is not None else None
+    if cached_audio is not None:
+        link_or_copy(cached_audio, output_audio)
+        audio_creation_time, audio_fetch_report = 0.0, []
+        print("Reusing the audio of the previous render")
+    else:
+        audio_creation_time, audio_fetch_report = generate_audio(
+            data["audioTimeline"], data["duration"], data["sessionDir"])
+        if cache is not None:
+            # keeping the session's cache within its quota (segments are also evicted after a segmented encode)
+            cache.evict(keep={cache.put_audio(audio_key, output_audio)})
+    progress_store.set(userID, sessionID, progress=85)
+
+    # filled in once the video is encoded, read by the upload stage once it has the whole file
+    timings = {"audio_creation_time": audio_creation_time, "audio_fetch": audio_fetch_report, "profile": profile}
+    video_path = os.path.join(data["sessionDir"], "final.mp4")
+    encoded = encode_failed = encode_started = None
+    if STREAM_UPLOAD:
+        # uploading the fragmented mp4 while ffmpeg is still writing it, once the encode has removed the previous
+        # render's final.mp4 (encode_started), so the upload never reads the old one
+        encoded, encode_failed, encode_started = threading.Event(), threading.Event(), threading.Event()
+        upload_executor.submit(finish_render, data, video_path, timings, encoded, encode_failed, encode_started)
+
+    try:
+        if data.get("streamed", False):
+            # the frames were already encoded to sessionDir/output.mp4 while they were streamed in
+            # a missing, failed or short stream would publish a broken video
+            stream_stats = check_stream(finish_stream(userID, sessionID), data["duration"])
+            frame_combination_time = stream_stats["time"]
+            # adding the audio without re-encoding the video (saved to sessionDir/final.mp4)
+            video_path, audio_integration_time = generate_video(
+                data["sessionDir"], STREAM_UPLOAD, profile, encode_started)
+        elif segment_cache is not None or int(data["duration"]) * 60 >= SEGMENT_THRESHOLD:
+            # encoding in segments, concurrently for long videos and reusing unchanged ones from the render cache
+            # (saved to sessionDir/output.mp4)
+            def report_segment(done: int, total: int):
+                # the segments move the progress from 85 to 93, muxing the audio takes the rest
+                progress_store.set(userID, sessionID, progress=85 + 8 * done / total)
+
+            frame_combination_time = combine_frames(
+                data["sessionDir"], int(data["duration"]) * 60, report_segment, profile, segment_cache)
+            # adding the audio without re-encoding the video (saved to sessionDir/final.mp4)
+            video_path, audio_integration_time = generate_video(
+                data["sessionDir"], STREAM_UPLOAD, profile, encode_started)
+        else:
+            # encoding the frames and audio together (saved to sessionDir/final.mp4)
+            # the audio is muxed in the same pass, so there is no separate integration step anymore
+            total_frames = int(data["duration"]) * 60
+
+            def report_frame(frame: int):
+                # the encode moves the progress from 85 to 95
+                progress_store.set(userID, sessionID, progress=85 + 10 * min(frame / total_frames, 1))
+
+            video_path, frame_combination_time = encode_video(
+                data["sessionDir"], report_frame, STREAM_UPLOAD, profile, encode_started)
+            audio_integration_time = 0.0
+        timings.update(frame_combination_time=frame_combination_time,
+                       audio_integration_time=audio_integration_time,
+                       encode_fps=int(data["duration"]) * 60 / frame_combination_time if frame_combination_time else None)
+        if timings["encode_fps"]:
+            metrics.observe("motionlab_encode_fps", timings["encode_fps"], profile=profile)
+    except Exception:
+        # the streamed upload of a video that was never completed must not be recorded
+        if encode_failed is not None:
+            encode_failed.set()
+        raise
+    finally:
+        if encoded is not None:
+            encoded.set()
+    progress_store.set(userID, sessionID, progress=95)
 
-    if userID not in hashmap:
-        # initializing the user's progress map
-        hashmap[userID] = {}
-    hashmap[userID][sessionID] = {}
-    hashmap[userID][sessionID
-                    ]["progress"] = 75  # we start at 75
+    # cleaning up resources (deleting audio and frame directories, as well as intermediate output files)
+    clean_up(data["sessionDir"])
 
-    # generating audio (saved to sessionDir/output.mp3)
-    audio_creation_time = generate_audio(
-        data["audioTimeline"], data["duration"], data["sessionDir"])
-    time.sleep(0.5)
-    hashmap[userID][sessionID]["progress"] = 85
+    if encoded is None:
+        # the upload is its own stage, so this worker is free for the next render
+        upload_executor.submit(finish_render, data, video_path, timings)
 
-    # generating muted video (saved to sessionDir/output.mp4)
-    frame_combination_time = combine_frames(data["sessionDir"])
-    time.sleep(0.5)
 
-    hashmap[userID][sessionID]["progress"] = 90
+def finish_render(data, video_path, timings, encoded=None, encode_failed=None, encode_started=None):
+    '''
+    Uploads a rendered video, then records its information (95 - 100)
+    With encoded (STREAM_UPLOAD), the video is uploaded while it is encoded (from when encode_started is set),
+    and dropped if encode_failed is set
+    '''
+    userID = data["userID"]
+    sessionID = data["sessionID"]
+
+    def report_upload(sent: int, total: int | None):
+        if total:
+            progress_store.set(userID, sessionID, progress=95 + 4.9 * sent / total)
 
-    # combining the muted video and audio (saved to sessionDir/final.mp4)
-    video_path, audio_integration_time = generate_video(data["sessionDir"])
-    time.sleep(0.5)
-    hashmap[userID][sessionID]["progress"] = 95
+    try:
+        # upload the file to supabase using TUS protocol
+        # (the render is stored with the upload, so it can be finished if we restart before it is done)
+        video_url, upload_time, upload_chunks = upload_video(
+            video_path, str(userID), str(sessionID), report_upload, encoded,
+            extra_state={"render": {"data": data, "timings": timings}}, failed=encode_failed, created=encode_started)
+    except UploadAborted as e:
+        # the render itself failed, and has already been marked as such
+        print(f"Upload abandoned: {e}")
+        return
+    except Exception as e:
+        print(f"Upload failed: {e}")
+        progress_store.set(userID, sessionID, error=f"Upload failed: {e}")
+        return
+    try:
+        rendition_urls, rendition_upload_time, rendition_chunks = upload_renditions(
+            data["sessionDir"], str(userID), str(sessionID))
+    except Exception as e:
+        # the video itself is up, so the render still counts without its playlist, preview or poster
+        print(f"Upload of the renditions failed: {e}")
+        rendition_urls, rendition_upload_time, rendition_chunks = {}, 0.0, []
+    try:
+        record_render(data, timings, video_url, upload_time + rendition_upload_time,
+                      upload_chunks + rendition_chunks, rendition_urls)
+    except Exception as e:
+        print(f"Recording the render failed: {e}")
+        progress_store.set(userID, sessionID, error=f"Recording the render failed: {e}")
 
-    # cleaning up resources (deleting audio and frame directories, as well as intermediate output files)
-    clean_up(data["sessionDir"])
 
-    # upload the file to supabase using TUS protocol
-    with open(video_path, "rb") as file:
-        video_url, upload_time = upload_video(
-            file, str(userID), str(sessionID))
+def record_render(data, timings, video_url, upload_time, upload_chunks, rendition_urls=None):
+    '''
+    Stores the information of a finished video and lets the client know we are done
+    '''
+    userID = data["userID"]
+    sessionID = data["sessionID"]
+    frame_combination_time = timings["frame_combination_time"]
+    audio_creation_time = timings["audio_creation_time"]
+    audio_integration_time = timings["audio_integration_time"]
     total_time = data["assetLoadTime"] + data["frameWriteTime"] + \
         frame_combination_time + audio_creation_time + \
         audio_integration_time + upload_time
@@ -245,6 +547,8 @@ def render_video(data):
     info = {
         # video indentification information
         "url": video_url,
+        # the HLS playlist, preview and poster of the video (hls_url, preview_url, poster_url), when they were made
+        **(rendition_urls or {}),
         "user": userID,
         "category": data["categoryName"],
         "template": data["templateName"],
@@ -258,27 +562,128 @@ def render_video(data):
         "audio_creation_time": audio_creation_time,
         "audio_integration_time": audio_integration_time,
         "upload_time": upload_time,
-        "total_time": total_time
+        "total_time": total_time,
+        # encoder settings the video was made with, and how fast its frames were encoded
+        "profile": timings.get("profile"),
+        "encode_fps": timings.get("encode_fps"),
+        # per-url download timings and per-chunk upload timings, only reported to the client
+        "audio_fetch": timings["audio_fetch"],
+        "upload_chunks": upload_chunks
     }
-    hashmap[userID][sessionID]["info"] = info
-    # updating the videos table in our database
-    supabase.table("Videos").insert(info).execute()
-    # this lets the progress bar "show" 100 because we round the value for display
-    hashmap[userID][sessionID]["progress"] = 99.9
-    # but this gives us a chance for it to display since we poll every 0.5 seconds
-    time.sleep(1.5)
-    # letting the frontend know that we are done rendering the video
-    hashmap[userID][sessionID]["progress"] = 100
+    # updating the videos table in our database (in the background, the row is safe on disk once it is queued)
+    # a resumed upload records the same render again, its renderID keeps it from being inserted twice
+    render_id = data.get("renderID", f"{userID}/{sessionID}/{creation_time}")
+    row = {key: value for key, value in info.items() if key not in info_only_fields}
+    outbox.add("Videos", {**row, "render_id": render_id}, key=render_id)
+    progress_store.set(userID, sessionID, progress=100, info=info)
+    metrics.inc("motionlab_renders_completed_total")
+
+
+def resume_uploads():
+    '''
+    Finishes the uploads that were interrupted by a restart (in only one of the worker processes)
+    '''
+    if not claim_pending_uploads():
+        return
+    for upload in pending_uploads():
+        render = upload.get("render")
+        if render is None or not os.path.isfile(upload["path"]):
+            continue
+        print(f"Resuming upload of {upload['path']}")
+        upload_executor.submit(finish_render, render["data"], upload["path"], render["timings"])
+
+
+def run_render(data):
+    '''
+    Runs a queued render (profiled with cProfile when RENDER_CPROFILE_DIR is set)
+    A failed render is marked as such in the progress store, so the client stops waiting for it
+    '''
+    metrics.inc("motionlab_renders_started_total")
+    try:
+        if RENDER_CPROFILE_DIR is None:
+            return render_video(data)
+        path = os.path.join(RENDER_CPROFILE_DIR,
+                            f"render_{data['userID']}_{data['sessionID']}_{int(time.time())}.prof")
+        with cprofile_dump(path):
+            return render_video(data)
+    except Exception as e:
+        progress_store.set(data["userID"], data["sessionID"], error=f"Render failed: {e}")
+        # the render queue logs and counts the failure
+        raise
+
+
+# renders wait here until one of the render workers is free
+render_queue = RenderQueue(run_render)
+
+metrics.register("motionlab_active_renders", "gauge", lambda: render_queue.active, "Renders being worked on")
+metrics.register("motionlab_render_queue_depth", "gauge", render_queue.depth, "Renders waiting for a worker")
+metrics.register("motionlab_outbox_pending", "gauge", outbox.pending, "Rows waiting to be inserted into the database")
+metrics.register("motionlab_outbox_lag_seconds", "gauge", outbox.lag,
+                 "How long the oldest row waiting to be inserted into the database has waited")
+metrics.register("motionlab_outbox_dead", "gauge", outbox.dead,
+                 "Rows that were given up on after OUTBOX_MAX_ATTEMPTS failed inserts")
+metrics.register("motionlab_cache_hits_total", "counter", lambda: [
+    ({"cache": "audio"}, audio_cache.stats()["hits"]), ({"cache": "gif"}, gif_cache.hits)],
+    "Lookups served by the audio clip and gif sequence caches")
+metrics.register("motionlab_cache_misses_total", "counter", lambda: [
+    ({"cache": "audio"}, audio_cache.stats()["misses"]), ({"cache": "gif"}, gif_cache.misses)],
+    "Lookups the audio clip and gif sequence caches could not serve")
 
 
 @video_bp.route("/video/render_video", methods=["POST"])
 def render():
     # receiving json containing: user, session, sessionDir, duration, audioTimeline
     data = request.get_json()
+    # the progress bar waits at 75 until a worker picks the render up
+    return queue_render(data, 75)
+
+
+@video_bp.route("/video/render_server", methods=["POST"])
+def render_server():
+    '''
+    Renders a video entirely on this server, frames included
+    Takes the same body as the express server's /video/create_frames (userInfo, videoInfo, animationInfo)
+    '''
+    body = request.get_json()
+    userInfo, videoInfo, animationInfo = body["userInfo"], body["videoInfo"], body["animationInfo"]
+    if not renderer.supports(animationInfo["animationPath"]):
+        return jsonify({"message": f"{animationInfo['animationPath']} can not be rendered on the server"}), 400
+    userID, sessionID = userInfo["userID"], userInfo["sessionID"]
+    data = {
+        "userID": userID,
+        "sessionID": sessionID,
+        "sessionDir": f"../videos/{userID}/{sessionID}",
+        "path": animationInfo["animationPath"],
+        "config": animationInfo["config"],
+        "categoryName": animationInfo["categoryName"],
+        "templateName": animationInfo["templateName"],
+        "duration": videoInfo["duration"],
+        "serverRender": True,
+    }
+    if "profile" in videoInfo:
+        data["profile"] = videoInfo["profile"]
+    # the progress bar starts at 0 since the frames are drawn here too
+    return queue_render(data, 0)
+
 
-    # rendering the video on a separate thread so we can continue to poll for progress on the main thread
-    render_thread = threading.Thread(
-        target=render_video, args=(data,), daemon=True).start()
+def queue_render(data, progress):
+    '''
+    Queues a render for the next free render worker, with its progress starting at progress
+    '''
+    userID, sessionID = data["userID"], data["sessionID"]
+    data["renderID"] = uuid.uuid4().hex
+    # whatever plan the request claims, the render gets the one the user is actually on
+    data["plan"] = get_plan(userID)
+    # the info and error of a previous render of this session do not apply to this one
+    progress_store.set(userID, sessionID, progress=progress, info=None, error=None)
+
+    # queueing the render so we can continue to poll for progress while it waits for a worker
+    # (renders of the paid plans go first)
+    try:
+        queue_position = render_queue.submit((userID, sessionID), data, priority=plan_priority(data["plan"]))
+    except QueueFullError as e:
+        progress_store.delete(userID, sessionID)
+        return jsonify({"message": str(e)}), 429
 
     # Notifying the client that the video will start rendering
-    return jsonify({"message": "Starting video rendering"}), 200
+    return jsonify({"message": "Starting video rendering", "queue_position": queue_position}), 200
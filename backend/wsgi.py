@@ -0,0 +1,7 @@
+'''
+Production entry point: gunicorn -c gunicorn.conf.py wsgi:app (from the backend directory)
+'''
+from main import create_app
+
+# the background threads are started by every worker once it has been forked (post_worker_init)
+app = create_app(start_background=False)
@@ -109,7 +109,7 @@ function Selector({ selectorType, setting, defaultValue }: Props) {
     return (
       <div>
         <label htmlFor={setting}>{format(setting)}</label>
-        <input type="file" id={setting} accept="audio/mpeg" onChange={(e) => handleFileChange(e, setting)} />
+        <input type="file" id={setting} accept=".mp3, .wav, .ogg, .m4a, .flac, .aac" onChange={(e) => handleFileChange(e, setting)} />
       </div>
     );
   }
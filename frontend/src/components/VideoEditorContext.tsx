@@ -4,6 +4,8 @@ type InputType = "color_image" | "color" | "audio" | "image" | "gif";
 interface VideoProgression {
   progress: number;
   url: string | null;
+  // why the last export failed, if it did
+  error?: string;
 }
 
 interface ContextType {
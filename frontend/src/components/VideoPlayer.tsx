@@ -109,6 +109,7 @@ function VideoPlayer() {
           <button id="export-button" onClick={exportVideo}>
             Export <FontAwesomeIcon icon={faDownload} />
           </button>
+          {videoProgress["error"] && <p className="export-error">{videoProgress["error"]}</p>}
         </>
       ) : (
         progressBar()
@@ -108,8 +108,10 @@ class Animation {
     let imagePromises = [];
     // initializing our image array to be full of null values so we can index into them properly later
     this.images = new Array(this.sequenceFrameCount - 1).fill(null);
+    // the whole sequence packed into one file, so we only need two requests instead of one per frame
+    const packed = await this.loadPackedSequence();
     // sequenceURL = "supabase_url.com/bucket_path/"
-    for (let i = 1; i < this.sequenceFrameCount; i++) {
+    for (let i = 1; !packed && i < this.sequenceFrameCount; i++) {
       let framePath = this.sequenceURL + `/frame${i.toString().padStart(4, "0")}.png`;
       let frameURL = "http://localhost:8000/file/get_asset/" + framePath;
       // adding a promise to the queue and adding an image to the image array at index i - 1 (since i starts at 1)
@@ -130,8 +132,39 @@ class Animation {
     return loadTime;
   }
 
+  // Loads every frame from the sequence's pack, returns false if the sequence could not be packed
+  async loadPackedSequence() {
+    try {
+      const indexResponse = await fetch("http://localhost:8000/file/get_sequence/" + this.sequenceURL);
+      if (!indexResponse.ok) {
+        return false;
+      }
+      const index = await indexResponse.json();
+      const packResponse = await fetch("http://localhost:8000/file/get_asset/" + index["src"]);
+      const pack = new Uint8Array(await packResponse.arrayBuffer());
+      let imagePromises = [];
+      // frame i (starting at 1) goes to index i - 1, same as loading them one by one
+      for (let i = 1; i < this.sequenceFrameCount && i <= index["frame_count"]; i++) {
+        const [offset, length] = index["frames"][i - 1];
+        const bytes = pack.subarray(offset, offset + length);
+        let src: any;
+        if (typeof window === "object") {
+          src = URL.createObjectURL(new Blob([bytes], { type: "image/png" }));
+        } else {
+          src = Buffer.from(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        }
+        imagePromises.push(this.loadImageAsync(src, i - 1));
+      }
+      await Promise.all(imagePromises);
+      return true;
+    } catch (error) {
+      console.error("Could not load packed sequence, loading frames one by one:", error);
+      return false;
+    }
+  }
+
   // Helper function to load an image and assign it to the correct index
-  async loadImageAsync(imgURL: string, index: number) {
+  async loadImageAsync(imgURL: string | Buffer, index: number) {
     try {
       const img = await loadImage(imgURL);
       if (img === null) {
@@ -309,6 +309,22 @@ function VideoEditor() {
       },
     };
     try {
+      // the flask backend can draw the built-in templates itself, which skips the express server entirely
+      const serverResponse = await fetch("http://localhost:8000/video/render_server", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(videoData),
+      });
+      if (serverResponse.ok) {
+        setVideoProgress({ progress: 0.01, url: null });
+        let data = await streamRenderProgress();
+        setVideoProgress({ progress: 100, url: data["url"] });
+        return;
+      }
+      if (serverResponse.status != 400) {
+        throw new Error((await serverResponse.json())["message"]);
+      }
+      // the templates the flask backend can not draw are still drawn by the express server
       // send request to express backend to make the frames
       console.log("Sending frame creation request");
       console.log(videoData);
@@ -336,22 +352,49 @@ function VideoEditor() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(info),
       });
-      await pollProgress("render_video"); // we wait until the video is done rendering
-
-      let res = await fetch("http://localhost:8000/video/get_info", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(userInfo),
-      });
-      // information of the finished video (including upload URL)
-      let data = await res.json();
+      // we wait until the video is done rendering, the last event carries the information of the finished video (including upload URL)
+      let data = await streamRenderProgress();
 
       setVideoProgress({ progress: 100, url: data["url"] });
     } catch (error) {
       console.log(error);
+      // back to the export button, with the reason the last export failed
+      setVideoProgress({ progress: 0, url: null, error: (error as Error).message });
     }
   }
 
+  /**
+   * Listens to the render's server-sent progress events until the video is done,
+   * then resolves with the information of the finished video
+   */
+  async function streamRenderProgress() {
+    return new Promise<any>((resolve, reject) => {
+      const events = new EventSource(`http://localhost:8000/video/render_events/${userID}/${sessionID}`);
+      events.addEventListener("progress", (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        setVideoProgress({ progress: Math.max(data.progress, 0.01), url: null });
+      });
+      events.addEventListener("done", (event) => {
+        events.close();
+        console.log("Video rendering complete!");
+        resolve(JSON.parse((event as MessageEvent).data)["info"]);
+      });
+      events.addEventListener("error", (event) => {
+        if (!(event instanceof MessageEvent) && events.readyState === EventSource.CONNECTING) {
+          // the server closed the stream (it has a max lifetime), the browser reconnects on its own
+          return;
+        }
+        events.close();
+        if (event instanceof MessageEvent) {
+          // the render failed, or there is no render for this session
+          reject(new Error(`Video rendering failed: ${JSON.parse(event.data)["message"]}`));
+        } else {
+          reject(new Error("Lost the connection to the render's progress"));
+        }
+      });
+    });
+  }
+
   async function pollProgress(endpoint: string) {
     return new Promise<void>((resolve) => {
       const pollInterval = 500; // Poll every 0.5 seconds
@@ -439,6 +482,24 @@ function VideoEditor() {
     resetAnimation();
   }
 
+  /**
+   * Polls an asset's background processing job until it finishes,
+   * then resolves with its result (the same information /file/upload_file returns for other files)
+   */
+  async function waitForAssetJob(jobID: string): Promise<any> {
+    while (true) {
+      const response = await fetch(`http://localhost:8000/file/job/${jobID}`);
+      const job = await response.json();
+      if (job["status"] === "done") {
+        return job["result"];
+      }
+      if (job["status"] === "error" || response.status == 404) {
+        throw new Error(`Processing the file failed: ${job["message"]}`);
+      }
+      await new Promise((resolve) => setTimeout(resolve, 250));
+    }
+  }
+
   async function handleFileChange(event: React.ChangeEvent<HTMLInputElement>, setting: string) {
     // checking if files array is not null
     if (event.target.files) {
@@ -453,12 +514,26 @@ function VideoEditor() {
 
       // send the bytes of our file to the backend
       try {
-        const response = await fetch("http://localhost:8000/file/upload_file", {
+        // if the backend already has this exact file, we only link it into our session instead of uploading it
+        const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+        const sha256 = Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, "0")).join("");
+        let response = await fetch("http://localhost:8000/file/link_asset", {
           method: "POST",
-          body: formData,
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ sha256: sha256, filename: file.name, userID: userID, sessionID: sessionID }),
         });
+        if (response.status == 404) {
+          response = await fetch("http://localhost:8000/file/upload_file", {
+            method: "POST",
+            body: formData,
+          });
+        }
         // getting the url response from our backend
-        const data = await response.json();
+        let data = await response.json();
+        if (response.status == 202) {
+          // gifs and non-mp3 audio are processed in the background, so we wait for that job to finish
+          data = await waitForAssetJob(data["job_id"]);
+        }
         const src = data["src"];
         console.log(data);
         // updating the config with the sound url